@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User
+from .models import ApiToken, User
 
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):
@@ -11,3 +11,14 @@ class CustomUserAdmin(UserAdmin):
     fieldsets = UserAdmin.fieldsets + (
         ('Role Information', {'fields': ('role',)}),
     )
+
+
+@admin.register(ApiToken)
+class ApiTokenAdmin(admin.ModelAdmin):
+    list_display = ('name', 'user', 'prefix', 'created_at', 'last_used_at')
+    search_fields = ('name', 'user__username', 'prefix')
+    readonly_fields = ('prefix', 'created_at', 'last_used_at')
+    
+    def has_add_permission(self, request):
+        # Keys are only shown once, by `manage.py create_api_token`
+        return False
@@ -0,0 +1,33 @@
+"""
+Management command to create a token for the read-only JSON API.
+
+The key is printed once and only its hash is stored; revoke a token by
+deleting it in the admin. Send it as ``Authorization: Bearer <key>``.
+
+Usage:
+    python manage.py create_api_token <username> --name "BI dashboard"
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import ApiToken
+
+
+class Command(BaseCommand):
+    help = 'Create an API token for a user and print its key'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='User the token acts as')
+        parser.add_argument('--name', default='API token', help='What the token is used for')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' not found")
+
+        token, key = ApiToken.create_token(user, options['name'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Created token "{token.name}" for {user.username}'))
+        self.stdout.write(f'\n  {key}\n')
+        self.stdout.write(self.style.WARNING('  Store this key now; it cannot be shown again.'))
@@ -1,5 +1,9 @@
+import hashlib
+import secrets
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 
 class User(AbstractUser):
     """Extended User model with role-based permissions"""
@@ -26,3 +30,53 @@ class User(AbstractUser):
     
     def is_editor(self):
         return self.role in ['administrator', 'form_creator', 'editor']
+
+
+class ApiToken(models.Model):
+    """Token for the JSON API and bulk response imports; only a hash of the key is stored"""
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='api_tokens')
+    name = models.CharField(max_length=100, help_text="What the token is used for")
+    key_hash = models.CharField(max_length=64, unique=True, editable=False)
+    prefix = models.CharField(max_length=8, editable=False, help_text="First characters of the key")
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
+    # Only record use this often, so API requests do not write on every call
+    LAST_USED_RESOLUTION = 60 * 60
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.name} ({self.prefix}…, {self.user.username})"
+    
+    @staticmethod
+    def hash_key(key):
+        return hashlib.sha256(key.encode()).hexdigest()
+    
+    @classmethod
+    def create_token(cls, user, name):
+        """Create a token; returns ``(token, key)``. The key is shown only once."""
+        key = secrets.token_urlsafe(32)
+        token = cls.objects.create(user=user, name=name, key_hash=cls.hash_key(key), prefix=key[:8])
+        return token, key
+    
+    @classmethod
+    def authenticate(cls, key):
+        """The active user owning ``key``, or None"""
+        if not key:
+            return None
+        token = cls.objects.select_related('user').filter(key_hash=cls.hash_key(key)).first()
+        if token is None or not token.user.is_active:
+            return None
+        now = timezone.now()
+        if token.last_used_at is None or (now - token.last_used_at).total_seconds() > cls.LAST_USED_RESOLUTION:
+            cls.objects.filter(pk=token.pk).update(last_used_at=now)
+        return token.user
+    
+    @classmethod
+    def from_request(cls, request):
+        """The user of an ``Authorization: Bearer <key>`` header, or None"""
+        scheme, _, key = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+        return cls.authenticate(key.strip()) if scheme.lower() in ('bearer', 'token') else None
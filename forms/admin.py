@@ -1,4 +1,8 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.auth import get_user_model
+from django.template.response import TemplateResponse
+from .duplication import clone_form_to_many, parse_clone_specs
 from .models import Form, FormQuestion, FormCollaboration, FormMasterDataAttachment, QuestionOption, FormSection
 
 @admin.register(Form)
@@ -30,6 +34,55 @@ class FormAdmin(admin.ModelAdmin):
             'classes': ('collapse',),
         }),
     )
+    actions = ['clone_to_many']
+    
+    def clone_to_many(self, request, queryset):
+        """Fan the selected form out to many clones (one per line of input)"""
+        if queryset.count() != 1:
+            self.message_user(request, 'Select exactly one source form to clone.', messages.WARNING)
+            return None
+        source = queryset.get()
+        
+        if request.POST.get('apply'):
+            lines = request.POST.get('clones', '').splitlines()
+            usernames = {line.split('|')[1].strip() for line in lines if '|' in line}
+            users = {u.username: u for u in get_user_model().objects.filter(username__in=usernames)}
+            try:
+                specs = parse_clone_specs(lines, users)
+            except ValueError as e:
+                self.message_user(request, str(e), messages.ERROR)
+            else:
+                if specs:
+                    try:
+                        new_forms, counts = clone_form_to_many(
+                            source, specs,
+                            link_images=bool(request.POST.get('link_images')),
+                            publish=bool(request.POST.get('publish')),
+                        )
+                    except ValueError as e:
+                        self.message_user(request, str(e), messages.ERROR)
+                    else:
+                        self.message_user(
+                            request,
+                            f'Created {counts["forms"]} clone(s) of "{source.title}" '
+                            f'({counts["questions"]} questions in total).',
+                            messages.SUCCESS,
+                        )
+                        return None
+                else:
+                    self.message_user(request, 'Enter at least one clone.', messages.WARNING)
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'title': f'Clone "{source.title}" to many forms',
+            'source': source,
+            'queryset': queryset,
+            'opts': self.model._meta,
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+            'clones': request.POST.get('clones', ''),
+        }
+        return TemplateResponse(request, 'admin/forms/form/clone_form.html', context)
+    clone_to_many.short_description = 'Clone selected form to many owners/units'
 
 
 @admin.register(FormSection)
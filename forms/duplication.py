@@ -0,0 +1,332 @@
+"""
+Form duplication service.
+
+Copies a form with its sections, questions, question options, master data
+attachments and collaborations using one ``bulk_create`` per model, remapping
+the old section and question ids onto the new rows. Images are shared by
+reference (the new rows point at the same stored file) unless hard links are
+requested, so no image bytes are read or rewritten.
+
+``clone_form_to_many`` fans one source form out to many clones (e.g. one per
+parish unit) with per-clone title, owner and attachment overrides.
+"""
+
+import os
+import shutil
+import uuid
+
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.validators import validate_slug
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    Form, FormCollaboration, FormMasterDataAttachment, FormQuestion,
+    FormSection, QuestionOption,
+)
+from .qr import regenerate_qr_files
+
+BATCH_SIZE = 500
+
+# Attachment fields a clone spec may override per dataset
+ATTACHMENT_OVERRIDE_FIELDS = ('dataset_id', 'order', 'hidden_columns', 'display_column', 'filter_columns')
+
+
+def _bulk_create(model, objs, **lookup):
+    """bulk_create ``objs`` and make sure every object has its primary key.
+
+    Backends that cannot return ids from a bulk insert (MySQL) get them
+    re-read in insertion order; ``lookup`` must select exactly the new rows.
+    """
+    created = model.objects.bulk_create(objs, batch_size=BATCH_SIZE)
+    if created and created[0].pk is None:
+        pks = model.objects.filter(**lookup).order_by('pk').values_list('pk', flat=True)
+        for obj, pk in zip(created, pks):
+            obj.pk = pk
+    return created
+
+
+def _link_image(name):
+    """Hard link a stored image under a new name, falling back to a copy"""
+    root, ext = os.path.splitext(name)
+    new_name = default_storage.get_available_name(f"{root}_copy_{uuid.uuid4().hex[:8]}{ext}")
+    source_path = default_storage.path(name)
+    target_path = default_storage.path(new_name)
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copyfile(source_path, target_path)
+    return new_name
+
+
+def _image_name(field, link_images):
+    if not field or not field.name:
+        return None
+    if not link_images:
+        return field.name
+    try:
+        return _link_image(field.name)
+    except OSError:
+        # Missing source file: keep the reference rather than failing the copy
+        return field.name
+
+
+@transaction.atomic
+def clone_form_into(source, new_forms, link_images=False, attachment_overrides=None):
+    """Copy the contents of ``source`` into each of the unsaved ``new_forms``.
+
+    All inserts are batched across every new form. ``attachment_overrides``
+    is an optional list aligned with ``new_forms``; each entry maps a source
+    dataset id to field overrides for that clone's attachment (``dataset_id``,
+    ``display_column``, ``filter_columns``, ``hidden_columns``). Returns a
+    dict with the number of rows created per model.
+    """
+    attachment_overrides = attachment_overrides or [{}] * len(new_forms)
+    sections = list(source.sections.all())
+    questions = list(source.questions.all())
+    options = list(QuestionOption.objects.filter(question__form=source).order_by('question_id', 'order', 'id'))
+    attachments = list(source.master_data_attachments.all())
+    collaborations = list(FormCollaboration.objects.filter(form=source))
+
+    for new_form in new_forms:
+        if not new_form.slug:
+            new_form.slug = Form.generate_slug(new_form.title)
+        new_form.form_image = _image_name(source.form_image, link_images)
+    new_forms = _bulk_create(Form, new_forms, slug__in=[f.slug for f in new_forms])
+
+    new_sections = []
+    for new_form in new_forms:
+        for section in sections:
+            new_sections.append(FormSection(
+                form=new_form,
+                title=section.title,
+                description=section.description,
+                order=section.order,
+                image=_image_name(section.image, link_images),
+            ))
+    _bulk_create(FormSection, new_sections, form__in=new_forms)
+    section_map = {
+        (new_form.pk, old.pk): new
+        for new_form, chunk in zip(new_forms, _chunks(new_sections, len(sections)))
+        for old, new in zip(sections, chunk)
+    }
+
+    new_questions = []
+    for new_form in new_forms:
+        for question in questions:
+            new_questions.append(FormQuestion(
+                form=new_form,
+                section=section_map.get((new_form.pk, question.section_id)),
+                text=question.text,
+                question_type=question.question_type,
+                options=question.options.copy() if question.options else [],
+                order=question.order,
+                is_required=question.is_required,
+                logic=question.logic.copy() if question.logic else {},
+                image=_image_name(question.image, link_images),
+            ))
+    _bulk_create(FormQuestion, new_questions, form__in=new_forms)
+    question_map = {
+        (new_form.pk, old.pk): new
+        for new_form, chunk in zip(new_forms, _chunks(new_questions, len(questions)))
+        for old, new in zip(questions, chunk)
+    }
+
+    new_options = [
+        QuestionOption(
+            question=question_map[(new_form.pk, option.question_id)],
+            text=option.text,
+            value=option.value,
+            order=option.order,
+            image=_image_name(option.image, link_images),
+        )
+        for new_form in new_forms
+        for option in options
+    ]
+    QuestionOption.objects.bulk_create(new_options, batch_size=BATCH_SIZE)
+
+    new_attachments = []
+    for new_form, overrides in zip(new_forms, attachment_overrides):
+        for attachment in attachments:
+            fields = {
+                'dataset_id': attachment.dataset_id,
+                'order': attachment.order,
+                'hidden_columns': list(attachment.hidden_columns or []),
+                'display_column': attachment.display_column,
+                'filter_columns': list(attachment.filter_columns or []),
+            }
+            fields.update(overrides.get(attachment.dataset_id, {}))
+            new_attachments.append(FormMasterDataAttachment(form=new_form, **fields))
+    FormMasterDataAttachment.objects.bulk_create(new_attachments, batch_size=BATCH_SIZE)
+
+    new_collaborations = [
+        FormCollaboration(form=new_form, user_id=collaboration.user_id)
+        for new_form in new_forms
+        for collaboration in collaborations
+    ]
+    FormCollaboration.objects.bulk_create(new_collaborations, batch_size=BATCH_SIZE)
+
+    return {
+        'forms': len(new_forms),
+        'sections': len(new_sections),
+        'questions': len(new_questions),
+        'options': len(new_options),
+        'attachments': len(new_attachments),
+        'collaborations': len(new_collaborations),
+    }
+
+
+def duplicate_form(source, title=None, owner=None, link_images=False):
+    """Duplicate ``source`` as a new draft form and return ``(new_form, counts)``"""
+    new_form = Form(
+        title=title or f"Copy of {source.title}",
+        description=source.description,
+        owner=owner or source.owner,
+        status='draft',  # Always start as draft
+        password=source.password,
+        require_captcha=source.require_captcha,
+        form_settings=source.form_settings.copy() if source.form_settings else {},
+    )
+    counts = clone_form_into(source, [new_form], link_images=link_images)
+    return new_form, counts
+
+
+def clone_form_to_many(source, specs, link_images=False, publish=False, qr_workers=1):
+    """Instantiate ``source`` once per entry of ``specs`` in one transaction.
+
+    Each spec is a dict with ``title`` and optional ``owner`` (a user),
+    ``slug`` and ``attachments`` (see ``clone_form_into``). Inserts are
+    batched across all clones. When ``publish`` is set the clones are
+    published and their QR files are written in one batch after commit.
+    Raises ``ValueError`` for invalid specs before anything is written (see
+    ``validate_clone_specs``). Returns ``(new_forms, counts)``.
+    """
+    validate_clone_specs(source, specs)
+    now = timezone.now()
+    new_forms = [
+        Form(
+            title=spec['title'],
+            slug=spec.get('slug') or Form.generate_slug(spec['title']),
+            description=source.description,
+            owner=spec.get('owner') or source.owner,
+            status='published' if publish else 'draft',
+            published_at=now if publish else None,
+            password=source.password,
+            require_captcha=source.require_captcha,
+            form_settings=source.form_settings.copy() if source.form_settings else {},
+        )
+        for spec in specs
+    ]
+
+    with transaction.atomic():
+        counts = clone_form_into(
+            source, new_forms, link_images=link_images,
+            attachment_overrides=[spec.get('attachments', {}) for spec in specs],
+        )
+        if publish:
+            transaction.on_commit(lambda: regenerate_qr_files(new_forms, workers=qr_workers))
+
+    return new_forms, counts
+
+
+def validate_clone_specs(source, specs):
+    """Check ``specs`` for ``clone_form_to_many`` against the database.
+
+    Slugs must be valid, unique within the batch and not taken; dataset
+    overrides must only set ``ATTACHMENT_OVERRIDE_FIELDS``, must replace a
+    dataset attached to ``source`` with an existing dataset, and no clone
+    may end up with the same dataset twice. Raises ``ValueError`` naming the
+    offending clone.
+    """
+    from master_data.models import MasterDataSet
+
+    source_datasets = list(source.master_data_attachments.values_list('dataset_id', flat=True))
+    slugs = [spec['slug'] for spec in specs if spec.get('slug')]
+    taken = set(Form.objects.filter(slug__in=slugs).values_list('slug', flat=True))
+    targets = {
+        overrides.get('dataset_id')
+        for spec in specs
+        for overrides in (spec.get('attachments') or {}).values()
+        if isinstance(overrides, dict)
+    }
+    existing = set(MasterDataSet.objects.filter(
+        pk__in=[target for target in targets if isinstance(target, int)]
+    ).values_list('pk', flat=True))
+
+    seen = set()
+    for number, spec in enumerate(specs, 1):
+        label = f'Clone {number} ("{spec["title"]}")'
+        slug = spec.get('slug')
+        if slug:
+            try:
+                validate_slug(slug)
+            except ValidationError:
+                raise ValueError(f'{label}: "{slug}" is not a valid slug')
+            if len(slug) > Form._meta.get_field('slug').max_length:
+                raise ValueError(f'{label}: slug "{slug}" is too long')
+            if slug in seen:
+                raise ValueError(f'{label}: slug "{slug}" is used by more than one clone')
+            if slug in taken:
+                raise ValueError(f'{label}: slug "{slug}" is already taken')
+            seen.add(slug)
+
+        overrides = spec.get('attachments') or {}
+        datasets = {dataset_id: dataset_id for dataset_id in source_datasets}
+        for dataset_id, fields in overrides.items():
+            if dataset_id not in datasets:
+                raise ValueError(f'{label}: dataset {dataset_id} is not attached to the source form')
+            if not isinstance(fields, dict):
+                raise ValueError(f'{label}: the override of dataset {dataset_id} must be an object')
+            unknown = sorted(str(key) for key in fields if key not in ATTACHMENT_OVERRIDE_FIELDS)
+            if unknown:
+                raise ValueError(
+                    f'{label}: the override of dataset {dataset_id} has unknown field(s) {", ".join(unknown)}; '
+                    f'allowed: {", ".join(ATTACHMENT_OVERRIDE_FIELDS)}'
+                )
+            target = fields.get('dataset_id', dataset_id)
+            if target != dataset_id and target not in existing:
+                raise ValueError(f'{label}: dataset {target} does not exist')
+            datasets[dataset_id] = target
+        if len(set(datasets.values())) < len(datasets):
+            raise ValueError(f'{label}: the overrides attach the same dataset more than once')
+
+
+def parse_clone_specs(lines, users):
+    """Parse ``title | username | dataset_id=replacement_id, ...`` lines.
+
+    ``users`` maps usernames to users; blank lines and ``#`` comments are
+    ignored. Raises ``ValueError`` naming the offending line.
+    """
+    specs = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = [part.strip() for part in line.split('|')]
+        spec = {'title': parts[0]}
+        if not spec['title']:
+            raise ValueError(f'Line {number}: a title is required')
+        if len(parts) > 1 and parts[1]:
+            if parts[1] not in users:
+                raise ValueError(f'Line {number}: unknown user "{parts[1]}"')
+            spec['owner'] = users[parts[1]]
+        if len(parts) > 2 and parts[2]:
+            spec['attachments'] = {}
+            for pair in parts[2].split(','):
+                try:
+                    old_id, new_id = (int(v) for v in pair.split('='))
+                except ValueError:
+                    raise ValueError(f'Line {number}: invalid dataset override "{pair.strip()}"')
+                spec['attachments'][old_id] = {'dataset_id': new_id}
+        specs.append(spec)
+    return specs
+
+
+def _chunks(items, size):
+    """Split ``items`` into consecutive chunks of ``size`` (one per new form)"""
+    if size == 0:
+        while True:
+            yield []
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
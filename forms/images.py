@@ -0,0 +1,162 @@
+"""
+Responsive image variants for form, section, question and option images.
+
+Uploaded images are often full-size phone photos. For each original this
+module writes resized WebP and JPEG copies (EXIF orientation applied, all
+metadata stripped) under ``variants/`` in media storage, never upscaling.
+Encoding every width in two formats takes seconds for a large photo, so it
+never happens in a request: saving the owning model schedules it once the
+transaction commits, and rendering an image without variants (uploaded
+earlier, or evicted from the cache) schedules it and serves the original
+until the variants are ready. A single background thread per process does
+the encoding, and a cache marker keeps processes from encoding the same
+image at once. The list of variants is cached per original so rendering
+does no storage access, and the files themselves are served directly by
+the web server.
+
+Variant names include a digest of the original name and ``VARIANT_VERSION``,
+so replacing an image or changing the pipeline yields new URLs.
+"""
+
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+VARIANT_WIDTHS = (160, 320, 640, 1024, 1600)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 75, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 80, 'optimize': True, 'progressive': True}),
+}
+VARIANT_VERSION = 1
+VARIANT_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+# How long a scheduled generation keeps others from starting (if its process dies)
+VARIANT_PENDING_TIMEOUT = 60 * 5
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-variants')
+
+
+def _cache_key(name):
+    return 'image_variants:' + hashlib.sha1(f'{VARIANT_VERSION}|{name}'.encode()).hexdigest()
+
+
+def _variant_name(name, digest, width, fmt):
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return f"variants/{directory}/{stem}-{digest}-{width}w.{'jpg' if fmt == 'jpeg' else fmt}"
+
+
+def _widths_for(original_width):
+    """Variant widths for an original, never wider than the original"""
+    widths = [w for w in VARIANT_WIDTHS if w < original_width]
+    widths.append(min(original_width, VARIANT_WIDTHS[-1]))
+    return sorted(set(widths))
+
+
+def _clean_image(image):
+    """Apply EXIF orientation and return an RGB copy without metadata"""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+    return image.convert('RGB')
+
+
+def generate_variants(name):
+    """Write any missing variants of the stored image ``name``.
+
+    Returns ``{'width': w, 'height': h, 'webp': [(width, name)], 'jpeg': [...]}``
+    or None when the original cannot be read.
+    """
+    digest = hashlib.sha1(f'{VARIANT_VERSION}|{name}'.encode()).hexdigest()[:10]
+    try:
+        with default_storage.open(name, 'rb') as fh:
+            original = Image.open(fh)
+            original.load()
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as e:
+        logger.warning('Cannot create image variants for %s: %s', name, e)
+        return None
+
+    image = _clean_image(original)
+    manifest = {'width': image.width, 'height': image.height}
+    for fmt, (pil_format, save_options) in VARIANT_FORMATS.items():
+        manifest[fmt] = []
+        for width in _widths_for(image.width):
+            variant = _variant_name(name, digest, width, fmt)
+            if not default_storage.exists(variant):
+                height = max(1, round(image.height * width / image.width))
+                resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+                out = BytesIO()
+                # No exif/icc arguments: the variant carries no metadata
+                resized.save(out, pil_format, **save_options)
+                default_storage.save(variant, ContentFile(out.getvalue()))
+            manifest[fmt].append((width, variant))
+    return manifest
+
+
+def get_variants(name):
+    """Cached variant manifest for ``name``, or None while there is none.
+
+    A missing manifest schedules the variants to be generated.
+    """
+    if not name:
+        return None
+    manifest = cache.get(_cache_key(name))
+    if manifest is None:
+        schedule_variants(name)
+    return manifest or None
+
+
+def build_variants(name):
+    """Generate the variants of ``name`` and cache their manifest"""
+    key = _cache_key(name)
+    try:
+        manifest = generate_variants(name) or {}
+    except OSError as e:
+        # Variants are an optimisation; the original is still served
+        logger.warning('Cannot write image variants for %s: %s', name, e)
+        manifest = None
+    else:
+        cache.set(key, manifest, VARIANT_CACHE_TIMEOUT)
+    finally:
+        cache.delete(f'{key}:pending')
+    return manifest or None
+
+
+def _build_in_background(name):
+    try:
+        build_variants(name)
+    except Exception:
+        logger.exception('Image variant generation failed for %s', name)
+
+
+def schedule_variants(name):
+    """Generate the variants of ``name`` in the background, unless already scheduled"""
+    if cache.add(f'{_cache_key(name)}:pending', 1, VARIANT_PENDING_TIMEOUT):
+        _executor.submit(_build_in_background, name)
+
+
+def prepare_variants(*fields):
+    """Schedule variants for saved image fields once the save commits (called from model saves)"""
+    for field in fields:
+        if field and field.name and cache.get(_cache_key(field.name)) is None:
+            transaction.on_commit(lambda name=field.name: schedule_variants(name))
+
+
+def name_from_url(url):
+    """Storage name for a media URL (option images are stored as URLs)"""
+    if isinstance(url, str) and url.startswith(settings.MEDIA_URL):
+        return url[len(settings.MEDIA_URL):]
+    return None
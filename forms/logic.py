@@ -0,0 +1,333 @@
+"""
+Conditional logic for form questions.
+
+``FormQuestion.logic`` holds an optional show/hide rule:
+
+    {
+        "action": "show",            # or "hide"
+        "match": "all",              # or "any"
+        "conditions": [
+            {"question": 12, "operator": "equals", "value": "yes"},
+            {"question": 15, "operator": "gte", "value": 18}
+        ]
+    }
+
+An empty dict means the question is always shown. Rules are validated when a
+question is saved and compiled once per form version into a dependency-ordered
+table: ``CompiledLogic.table`` is the compact structure evaluated in the
+browser and ``CompiledLogic.hidden_questions`` evaluates the same table on the
+server, so hidden questions can be skipped in validation, storage and export
+without re-parsing the JSON on every request.
+"""
+
+import re
+
+from django.core.cache import cache
+
+LOGIC_CACHE_TIMEOUT = 60 * 60 * 24
+
+ACTIONS = ('show', 'hide')
+MATCHES = ('all', 'any')
+
+# Operator name -> short code used in the client table
+OPERATORS = {
+    'equals': 'eq',
+    'not_equals': 'ne',
+    'in': 'in',
+    'not_in': 'nin',
+    'contains': 'has',
+    'not_contains': 'nhas',
+    'gt': 'gt',
+    'gte': 'gte',
+    'lt': 'lt',
+    'lte': 'lte',
+    'is_empty': 'empty',
+    'is_not_empty': 'filled',
+}
+LIST_OPERATORS = ('in', 'not_in')
+UNARY_OPERATORS = ('is_empty', 'is_not_empty')
+
+# Answers and values that gt/gte/lt/lte compare as numbers: plain decimal
+# notation only. The browser's evaluator gets the same pattern in the client
+# table, so both sides agree that e.g. "2024-12-01" is a string (compared
+# lexicographically, which orders ISO dates) and not the number 2024.
+NUMBER_PATTERN = r'[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?'
+_NUMBER = re.compile(NUMBER_PATTERN)
+
+
+def validate_rule(logic, questions):
+    """Check the structure of one question's ``logic`` dict.
+
+    ``questions`` maps question id -> question type for the whole form.
+    Returns a list of error messages (empty when the rule is valid).
+    """
+    if not logic:
+        return []
+    if not isinstance(logic, dict):
+        return ['Logic must be an object with "action", "match" and "conditions".']
+
+    errors = []
+    if logic.get('action', 'show') not in ACTIONS:
+        errors.append(f'"action" must be one of: {", ".join(ACTIONS)}.')
+    if logic.get('match', 'all') not in MATCHES:
+        errors.append(f'"match" must be one of: {", ".join(MATCHES)}.')
+
+    conditions = logic.get('conditions')
+    if not isinstance(conditions, list) or not conditions:
+        errors.append('"conditions" must be a non-empty list.')
+        return errors
+
+    for number, condition in enumerate(conditions, 1):
+        if not isinstance(condition, dict):
+            errors.append(f'Condition {number}: must be an object.')
+            continue
+        question_id = condition.get('question')
+        operator = condition.get('operator')
+        if not isinstance(question_id, int) or question_id not in questions:
+            errors.append(f'Condition {number}: question {question_id!r} is not a question of this form.')
+        if operator not in OPERATORS:
+            errors.append(f'Condition {number}: unknown operator {operator!r}.')
+        elif operator in LIST_OPERATORS and not isinstance(condition.get('value'), list):
+            errors.append(f'Condition {number}: "{operator}" needs a list value.')
+        elif operator not in UNARY_OPERATORS and 'value' not in condition:
+            errors.append(f'Condition {number}: a value is required.')
+    return errors
+
+
+def find_cycle(dependencies):
+    """Return a list of question ids forming a cycle, or None.
+
+    ``dependencies`` maps question id -> ids its rule depends on.
+    """
+    visiting, done = set(), set()
+
+    for start in dependencies:
+        if start in done:
+            continue
+        stack = [(start, iter(dependencies.get(start, ())))]
+        path = [start]
+        visiting.add(start)
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                path.pop()
+                visiting.discard(node)
+                done.add(node)
+            elif child in visiting:
+                return path[path.index(child):] + [child]
+            elif child not in done:
+                visiting.add(child)
+                path.append(child)
+                stack.append((child, iter(dependencies.get(child, ()))))
+    return None
+
+
+def _topological_order(dependencies):
+    """Order question ids so every question comes after the ones it depends on"""
+    order, done = [], set()
+
+    def visit(node):
+        if node in done:
+            return
+        done.add(node)
+        for child in dependencies.get(node, ()):
+            visit(child)
+        order.append(node)
+
+    for node in dependencies:
+        visit(node)
+    return order
+
+
+def _answer_values(question_type, raw):
+    """Normalise a submitted or stored answer into a list of strings"""
+    if raw is None:
+        return []
+    if isinstance(raw, (list, tuple)):
+        return [str(v) for v in raw if v not in (None, '')]
+    raw = str(raw)
+    if not raw:
+        return []
+    if question_type == 'multi_select':
+        # Stored multi-select answers are joined with ', '
+        return [v for v in raw.split(', ') if v]
+    return [raw]
+
+
+def _number(value):
+    """``value`` as a float if it matches NUMBER_PATTERN, else None"""
+    value = str(value)
+    return float(value) if _NUMBER.fullmatch(value) else None
+
+
+def _compare(values, expected, op):
+    if not values:
+        return False
+    actual, expected_number = _number(values[0]), _number(expected)
+    if actual is None or expected_number is None:
+        # ISO dates and other strings compare lexicographically
+        actual, expected = str(values[0]), str(expected)
+    else:
+        expected = expected_number
+    if op == 'gt':
+        return actual > expected
+    if op == 'gte':
+        return actual >= expected
+    if op == 'lt':
+        return actual < expected
+    return actual <= expected
+
+
+def _test(values, op, expected):
+    if op == 'eq':
+        return str(expected) in values
+    if op == 'ne':
+        return str(expected) not in values
+    if op == 'in':
+        return any(str(v) in values for v in expected)
+    if op == 'nin':
+        return not any(str(v) in values for v in expected)
+    if op == 'has':
+        return any(str(expected).lower() in v.lower() for v in values)
+    if op == 'nhas':
+        return not any(str(expected).lower() in v.lower() for v in values)
+    if op == 'empty':
+        return not values
+    if op == 'filled':
+        return bool(values)
+    return _compare(values, expected, op)
+
+
+def validate_question_logic(question):
+    """Validate ``question.logic`` against the other questions of its form.
+
+    Catches references to unknown questions, self references and rules that
+    would create a dependency cycle. Returns a list of error messages.
+    """
+    others = list(question.form.questions.exclude(pk=question.pk).only('id', 'question_type', 'logic'))
+    types = {q.pk: q.question_type for q in others}
+    errors = validate_rule(question.logic, types)
+    if errors or not question.logic:
+        return errors
+
+    dependencies = {q.pk: _rule_dependencies(q.logic) for q in others}
+    dependencies[question.pk or 0] = _rule_dependencies(question.logic)
+    cycle = find_cycle(dependencies)
+    if cycle:
+        return ['This rule creates circular logic between questions ' + ' -> '.join(str(q) for q in cycle) + '.']
+    return []
+
+
+def _rule_dependencies(logic):
+    if not isinstance(logic, dict) or not isinstance(logic.get('conditions'), list):
+        return []
+    return [c.get('question') for c in logic['conditions'] if isinstance(c, dict)]
+
+
+class CompiledLogic:
+    """Validated, dependency-ordered logic rules of one form version"""
+
+    def __init__(self, table, types, errors):
+        self.table = table
+        self.types = types
+        self.errors = errors
+
+    @property
+    def has_rules(self):
+        return bool(self.table['rules'])
+
+    def hidden_questions(self, answers):
+        """Return the set of question ids hidden for ``answers``.
+
+        ``answers`` maps question id -> submitted value(s) or stored value.
+        Rules are evaluated in dependency order and answers to hidden
+        questions count as empty, so hiding cascades down the chain.
+        """
+        hidden = set()
+        rules = self.table['rules']
+        for question_id in self.table['order']:
+            action, match, conditions = rules[question_id]
+            results = (
+                _test(
+                    [] if dep in hidden else _answer_values(self.types.get(dep), answers.get(dep)),
+                    op, expected,
+                )
+                for dep, op, expected in conditions
+            )
+            matched = all(results) if match == 'all' else any(results)
+            if matched == (action == 'hide'):
+                hidden.add(question_id)
+        return hidden
+
+    def client_table(self):
+        """JSON-serialisable table for the public page's evaluator"""
+        return {
+            'number': NUMBER_PATTERN,
+            'order': self.table['order'],
+            'rules': {
+                str(question_id): [action == 'hide', match == 'all', [list(c) for c in conditions]]
+                for question_id, (action, match, conditions) in self.table['rules'].items()
+            },
+        }
+
+
+def compile_logic(questions):
+    """Compile the rules of ``questions`` (all questions of one form).
+
+    Invalid rules and rules taking part in a dependency cycle are dropped
+    (the question is always shown) and reported in ``errors``.
+    """
+    types = {q.pk: q.question_type for q in questions}
+    errors = []
+    rules = {}
+
+    for question in questions:
+        problems = validate_rule(question.logic, types)
+        if problems:
+            errors.extend(f'Question {question.pk}: {problem}' for problem in problems)
+            continue
+        if not question.logic:
+            continue
+        rules[question.pk] = (
+            question.logic.get('action', 'show'),
+            question.logic.get('match', 'all'),
+            tuple(
+                (c['question'], OPERATORS[c['operator']], c.get('value'))
+                for c in question.logic['conditions']
+            ),
+        )
+
+    dependencies = {qid: [c[0] for c in rule[2] if c[0] in rules] for qid, rule in rules.items()}
+    cycle = find_cycle(dependencies)
+    while cycle:
+        errors.append('Circular logic between questions ' + ' -> '.join(str(q) for q in cycle))
+        for question_id in cycle:
+            rules.pop(question_id, None)
+            dependencies.pop(question_id, None)
+        dependencies = {qid: [d for d in deps if d in rules] for qid, deps in dependencies.items()}
+        cycle = find_cycle(dependencies)
+
+    table = {'order': _topological_order(dependencies), 'rules': rules}
+    return CompiledLogic(table, types, errors)
+
+
+def _cache_key(form):
+    version = form.updated_at.timestamp() if form.updated_at else 0
+    return f'form_logic:{form.pk}:{version}'
+
+
+def get_form_logic(form):
+    """Compiled logic for ``form``, cached until the form is next updated.
+
+    Saving or deleting a question touches ``Form.updated_at``, which changes
+    the cache key.
+    """
+    key = _cache_key(form)
+    compiled = cache.get(key)
+    if compiled is None:
+        questions = list(form.questions.only('id', 'form_id', 'question_type', 'logic'))
+        compiled = compile_logic(questions)
+        cache.set(key, compiled, LOGIC_CACHE_TIMEOUT)
+    return compiled
@@ -0,0 +1,151 @@
+"""
+Management command to fan one source form out to many clones in a single
+transaction (e.g. rolling the same seasonal survey out to every parish unit).
+
+The spec file is either JSON:
+
+    [
+        {"title": "Survey - Lingkungan A", "owner": "unit_a",
+         "attachments": {"3": {"dataset_id": 7, "filter_columns": ["Wilayah"]}}},
+        {"title": "Survey - Lingkungan B", "owner": "unit_b", "slug": "survey-lingkungan-b"}
+    ]
+
+or plain text with one clone per line:
+
+    Survey - Lingkungan A | unit_a | 3=7
+    Survey - Lingkungan B | unit_b
+
+where the optional third column replaces source dataset ids with another
+dataset for that clone.
+
+Usage:
+    python manage.py clone_form --form-id 1 --spec clones.json
+    python manage.py clone_form --form-id 1 --spec clones.txt --publish --qr-workers 4
+"""
+
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from forms.duplication import clone_form_to_many, parse_clone_specs
+from forms.models import Form
+
+
+class Command(BaseCommand):
+    help = 'Clone one form many times in one transaction with per-clone title/owner/attachment overrides'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--form-id',
+            type=int,
+            required=True,
+            help='ID of the source form',
+        )
+        parser.add_argument(
+            '--spec',
+            type=str,
+            required=True,
+            help='JSON or text file describing the clones',
+        )
+        parser.add_argument(
+            '--publish',
+            action='store_true',
+            help='Publish the clones (QR codes are generated in one batch after commit)',
+        )
+        parser.add_argument(
+            '--link-images',
+            action='store_true',
+            help='Hard link image files for each clone instead of sharing them by reference',
+        )
+        parser.add_argument(
+            '--qr-workers',
+            type=int,
+            default=1,
+            help='Worker processes used to render QR codes when publishing (default: 1)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            source = Form.objects.get(pk=options['form_id'])
+        except Form.DoesNotExist:
+            raise CommandError(f'Form with ID {options["form_id"]} does not exist.')
+
+        specs = self._load_specs(options['spec'])
+        if not specs:
+            raise CommandError('The spec file does not describe any clones.')
+
+        self.stdout.write(f'Cloning form "{source.title}" (ID: {source.pk}) into {len(specs)} form(s)...')
+
+        started = time.perf_counter()
+        try:
+            new_forms, counts = clone_form_to_many(
+                source, specs,
+                link_images=options['link_images'],
+                publish=options['publish'],
+                qr_workers=max(1, options['qr_workers']),
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+
+        for form in new_forms:
+            self.stdout.write(f'  ✓ "{form.title}" (ID: {form.pk}, owner: {form.owner.username}, slug: {form.slug})')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n✓ Created {counts["forms"]} form(s) with {counts["sections"]} section(s), '
+                f'{counts["questions"]} question(s) and {counts["options"]} option(s) in {elapsed:.2f}s'
+            )
+        )
+
+    def _load_specs(self, path):
+        try:
+            with open(path, encoding='utf-8') as fh:
+                content = fh.read()
+        except OSError as e:
+            raise CommandError(f'Could not read spec file: {e}')
+
+        User = get_user_model()
+
+        if path.endswith('.json'):
+            try:
+                raw_specs = json.loads(content)
+            except json.JSONDecodeError as e:
+                raise CommandError(f'Invalid JSON spec: {e}')
+
+            if not isinstance(raw_specs, list) or not all(isinstance(raw, dict) for raw in raw_specs):
+                raise CommandError('The JSON spec must be a list of objects')
+
+            usernames = {spec['owner'] for spec in raw_specs if spec.get('owner')}
+            users = {u.username: u for u in User.objects.filter(username__in=usernames)}
+
+            specs = []
+            for number, raw in enumerate(raw_specs, 1):
+                if not raw.get('title'):
+                    raise CommandError(f'Clone {number}: a title is required')
+                spec = {'title': raw['title'], 'slug': raw.get('slug')}
+                if raw.get('owner'):
+                    if raw['owner'] not in users:
+                        raise CommandError(f'Clone {number}: unknown user "{raw["owner"]}"')
+                    spec['owner'] = users[raw['owner']]
+                try:
+                    spec['attachments'] = {
+                        int(dataset_id): overrides
+                        for dataset_id, overrides in (raw.get('attachments') or {}).items()
+                    }
+                except (AttributeError, ValueError):
+                    raise CommandError(f'Clone {number}: "attachments" must map dataset ids to overrides')
+                specs.append(spec)
+            return specs
+
+        lines = content.splitlines()
+        usernames = {
+            line.split('|')[1].strip()
+            for line in lines if line.count('|') >= 1
+        }
+        users = {u.username: u for u in User.objects.filter(username__in=usernames)}
+        try:
+            return parse_clone_specs(lines, users)
+        except ValueError as e:
+            raise CommandError(str(e))
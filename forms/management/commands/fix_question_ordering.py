@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from forms.models import Form
+from forms.ordering import apply_ordering, order_key
 
 
 class Command(BaseCommand):
@@ -29,32 +30,30 @@ class Command(BaseCommand):
         self.stdout.write(f"Processing {total_forms} form(s)...")
 
         for form in forms:
-            questions = form.questions.order_by('id')  # Order by creation time
+            questions = list(form.questions.order_by('id'))  # Order by creation time
             questions_updated = 0
-            
+
             self.stdout.write(f"\nForm: {form.title} (ID: {form.id})")
-            self.stdout.write(f"  Questions: {questions.count()}")
-            
-            for i, question in enumerate(questions, 1):
+            self.stdout.write(f"  Questions: {len(questions)}")
+
+            for i, question in enumerate(questions):
                 old_order = question.order
-                new_order = i
-                
+                new_order = order_key(i)
+
                 if old_order != new_order:
                     self.stdout.write(
                         f"  Q{question.id}: '{question.text[:50]}...' order {old_order} -> {new_order}"
                     )
-                    
-                    if not options['dry_run']:
-                        question.order = new_order
-                        question.save(update_fields=['order'])
-                    
                     questions_updated += 1
                 else:
                     self.stdout.write(
                         f"  Q{question.id}: '{question.text[:50]}...' order {old_order} (no change)"
                     )
-            
+
             if questions_updated > 0:
+                if not options['dry_run']:
+                    # One bulk update per form
+                    apply_ordering(questions, form.questions.all())
                 self.stdout.write(
                     self.style.SUCCESS(f"  Updated {questions_updated} question(s)")
                 )
@@ -69,4 +68,4 @@ class Command(BaseCommand):
         else:
             self.stdout.write(
                 self.style.SUCCESS(f"\nCompleted: {total_questions_updated} question(s) updated")
-            )
\ No newline at end of file
+            )
@@ -0,0 +1,350 @@
+"""
+Management command to generate synthetic data at production scale.
+
+Creates users, master data sets with a Wilayah/Lingkungan hierarchy and
+extra columns, published forms with sections, a mix of question types,
+conditional logic and dataset attachments, and responses with their answers.
+Everything is written with bulk inserts, and every value (names, choices,
+submission times, client ids) comes from one seeded random generator, so the
+same options always produce the same data for benchmarks and query budgets.
+
+All objects are named after ``--prefix``; pick another prefix to seed a
+second data set next to the first.
+
+Usage:
+    python manage.py seed_scale
+    python manage.py seed_scale --forms 4 --responses 500000 --questions 60
+    python manage.py seed_scale --prefix bench --seed 7 --records 200000 --columns 8
+"""
+
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from forms.logic import get_form_logic
+from forms.models import Form, FormMasterDataAttachment, FormQuestion, FormSection
+from master_data.models import MasterDataColumn, MasterDataRecord, MasterDataSet
+from responses.models import Response, ResponseAnswer
+
+# Submission times are spread over the year before this fixed date
+SEED_EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+FIRST_NAMES = [
+    'Agnes', 'Albertus', 'Andreas', 'Angela', 'Antonius', 'Benedictus', 'Bernadeta', 'Caecilia',
+    'Christina', 'Dominikus', 'Elisabeth', 'Fransiska', 'Fransiskus', 'Gregorius', 'Ignatius',
+    'Katarina', 'Laurensius', 'Lucia', 'Maria', 'Markus', 'Monika', 'Petrus', 'Skolastika',
+    'Stefanus', 'Theresia', 'Valentinus', 'Veronika', 'Yohanes', 'Yosef', 'Yustina',
+]
+LAST_NAMES = [
+    'Aryo', 'Budiman', 'Gunawan', 'Hadi', 'Halim', 'Hartono', 'Kurniawan', 'Lestari', 'Nugroho',
+    'Pratama', 'Purnomo', 'Santoso', 'Saputra', 'Setiawan', 'Sihombing', 'Siregar', 'Susanto',
+    'Tanjung', 'Wibowo', 'Widjaja', 'Wijaya', 'Yulianto',
+]
+SAINTS = [
+    'St. Agustinus', 'St. Aloysius', 'St. Anna', 'St. Antonius', 'St. Barnabas', 'St. Bartolomeus',
+    'St. Benediktus', 'St. Fransiskus Xaverius', 'St. Gabriel', 'St. Ignatius', 'St. Kristoforus',
+    'St. Lukas', 'St. Maria Goretti', 'St. Markus', 'St. Matius', 'St. Mikael', 'St. Monika',
+    'St. Paulus', 'St. Petrus', 'St. Rafael', 'St. Stefanus', 'St. Theresia', 'St. Thomas',
+    'St. Yakobus', 'St. Yohanes', 'St. Yosef', 'St. Yudas Tadeus', 'St. Yustinus',
+]
+OCCUPATIONS = ['Guru', 'Karyawan', 'Wiraswasta', 'Pelajar', 'Mahasiswa', 'Petani', 'Pensiunan', 'Dokter', 'Perawat']
+# Extra dataset columns, used in this order by --columns
+EXTRA_COLUMNS = [
+    ('Alamat', 'text'), ('No HP', 'text'), ('Tahun Lahir', 'number'), ('Jenis Kelamin', 'text'),
+    ('Pekerjaan', 'text'), ('Email', 'email'), ('Tanggal Baptis', 'date'),
+]
+# Question types in the order they cycle through a form
+QUESTION_MIX = [
+    'single_select', 'text_input', 'multi_select', 'numeric_input', 'single_select',
+    'date_input', 'single_select', 'text_input', 'multi_select', 'numeric_input',
+]
+
+
+class Command(BaseCommand):
+    help = 'Generate deterministic synthetic users, datasets, forms and responses for scale testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='scale', help='Name prefix of everything created (default: scale)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+        parser.add_argument('--users', type=int, default=10, help='Users (default: 10)')
+        parser.add_argument('--datasets', type=int, default=2, help='Master data sets (default: 2)')
+        parser.add_argument('--records', type=int, default=20000, help='Records per dataset (default: 20000)')
+        parser.add_argument('--columns', type=int, default=4,
+                            help=f'Extra columns besides Nama/Wilayah/Lingkungan (default: 4, max {len(EXTRA_COLUMNS)})')
+        parser.add_argument('--wilayah', type=int, default=8, help='Wilayah per dataset (default: 8)')
+        parser.add_argument('--lingkungan', type=int, default=6, help='Lingkungan per wilayah (default: 6)')
+        parser.add_argument('--forms', type=int, default=3, help='Published forms (default: 3)')
+        parser.add_argument('--sections', type=int, default=4, help='Sections per form (default: 4)')
+        parser.add_argument('--questions', type=int, default=60, help='Questions per form (default: 60)')
+        parser.add_argument('--responses', type=int, default=20000, help='Responses per form (default: 20000)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Records or responses per bulk insert (default: 1000)')
+        parser.add_argument('--password', default='password', help='Password of the generated users')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.prefix = options['prefix']
+        self.batch_size = max(1, options['batch_size'])
+        if options['columns'] > len(EXTRA_COLUMNS):
+            raise CommandError(f'--columns can be at most {len(EXTRA_COLUMNS)}')
+        if get_user_model().objects.filter(username__startswith=f'{self.prefix}_').exists():
+            raise CommandError(f"Data with prefix '{self.prefix}' already exists; use another --prefix")
+
+        started = time.perf_counter()
+        users = self.create_users(options['users'], options['password'])
+        self.stdout.write(f'  ✓ {len(users)} users')
+
+        datasets = []
+        for n in range(options['datasets']):
+            dataset = self.create_dataset(
+                n, users[n % len(users)], options['records'], options['columns'],
+                options['wilayah'], options['lingkungan'],
+            )
+            datasets.append(dataset)
+            self.stdout.write(f'  ✓ Dataset "{dataset.name}": {options["records"]} records')
+
+        total_responses = total_answers = 0
+        for n in range(options['forms']):
+            form = self.create_form(n, users[n % len(users)], users, datasets[n % len(datasets)] if datasets else None,
+                                    options['sections'], options['questions'])
+            responses, answers = self.create_responses(form, options['responses'])
+            total_responses += responses
+            total_answers += answers
+            self.stdout.write(f'  ✓ Form "{form.slug}": {responses} responses, {answers} answers')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n✓ Seeded {len(users)} users, {len(datasets)} datasets, {options["forms"]} forms, '
+                f'{total_responses} responses and {total_answers} answers in {elapsed:.1f}s'
+            )
+        )
+
+    def create_users(self, count, password):
+        User = get_user_model()
+        hashed = make_password(password)  # Hashing is slow; every user shares one hash
+        User.objects.bulk_create([
+            User(username=f'{self.prefix}_user_{n}', email=f'{self.prefix}_user_{n}@example.com', password=hashed)
+            for n in range(max(1, count))
+        ])
+        return list(User.objects.filter(username__startswith=f'{self.prefix}_user_').order_by('id'))
+
+    def hierarchy(self, wilayah_count, lingkungan_count):
+        """``[(wilayah, [lingkungan, ...]), ...]`` with parish-style names"""
+        saints = SAINTS[:]
+        self.rng.shuffle(saints)
+        names = iter(
+            f'Lingkungan {saint}' if round_ == 0 else f'Lingkungan {saint} {round_ + 1}'
+            for round_ in range(wilayah_count * lingkungan_count // len(saints) + 1)
+            for saint in saints
+        )
+        return [
+            (f'Wilayah {w + 1}', [next(names) for _ in range(lingkungan_count)])
+            for w in range(wilayah_count)
+        ]
+
+    def create_dataset(self, n, owner, record_count, column_count, wilayah_count, lingkungan_count):
+        dataset = MasterDataSet.objects.create(
+            name=f'{self.prefix} umat {n + 1}',
+            description='Synthetic parish members generated by seed_scale',
+            owner=owner,
+        )
+        columns = [('Nama', 'text'), ('Wilayah', 'text'), ('Lingkungan', 'text')] + EXTRA_COLUMNS[:column_count]
+        MasterDataColumn.objects.bulk_create([
+            MasterDataColumn(dataset=dataset, name=name, data_type=data_type, order=order, is_required=order < 3)
+            for order, (name, data_type) in enumerate(columns)
+        ])
+        hierarchy = self.hierarchy(max(1, wilayah_count), max(1, lingkungan_count))
+        # Wilayah differ in size, like real parishes
+        weights = [self.rng.uniform(0.5, 2.0) for _ in hierarchy]
+
+        for start in range(0, record_count, self.batch_size):
+            MasterDataRecord.objects.bulk_create([
+                MasterDataRecord(dataset=dataset, data=self.record_data(hierarchy, weights, columns[3:]))
+                for _ in range(start, min(start + self.batch_size, record_count))
+            ])
+        dataset.hierarchy = hierarchy
+        dataset.record_ids = list(dataset.records.order_by('id').values_list('id', flat=True))
+        return dataset
+
+    def person_name(self):
+        return f'{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}'
+
+    def record_data(self, hierarchy, weights, extra_columns):
+        wilayah, lingkungan = self.rng.choices(hierarchy, weights)[0]
+        data = {'Nama': self.person_name(), 'Wilayah': wilayah, 'Lingkungan': self.rng.choice(lingkungan)}
+        for name, _ in extra_columns:
+            data[name] = self.extra_value(name, data['Nama'])
+        return data
+
+    def extra_value(self, column, person):
+        rng = self.rng
+        if column == 'Alamat':
+            return f'Jl. {rng.choice(LAST_NAMES)} No. {rng.randint(1, 200)}'
+        if column == 'No HP':
+            return f'08{rng.randint(100000000, 9999999999)}'
+        if column == 'Tahun Lahir':
+            return str(rng.randint(1940, 2015))
+        if column == 'Jenis Kelamin':
+            return rng.choice(['L', 'P'])
+        if column == 'Pekerjaan':
+            return rng.choice(OCCUPATIONS)
+        if column == 'Email':
+            return f'{person.lower().replace(" ", ".")}{rng.randint(1, 999)}@example.com'
+        return f'{rng.randint(1950, 2020)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}'
+
+    def create_form(self, n, owner, users, dataset, section_count, question_count):
+        form = Form.objects.create(
+            title=f'{self.prefix} survey {n + 1}',
+            slug=f'{self.prefix}-survey-{n + 1}',
+            description='Synthetic survey generated by seed_scale',
+            owner=owner,
+            status='published',
+            published_at=SEED_EPOCH,
+            require_captcha=False,
+        )
+        form.editors.add(*[user for user in users if user != owner][:2])
+        if dataset is not None:
+            FormMasterDataAttachment.objects.create(
+                form=form, dataset=dataset, display_column='Nama',
+                filter_columns=['Wilayah', 'Lingkungan'],
+                hidden_columns=['No HP'] if dataset.columns.filter(name='No HP').exists() else [],
+            )
+
+        section_count = max(1, section_count)
+        FormSection.objects.bulk_create([
+            FormSection(form=form, title=f'Bagian {s + 1}', order=s)
+            for s in range(section_count)
+        ])
+        sections = list(form.sections.order_by('order'))
+        per_section = max(1, -(-question_count // section_count))
+        FormQuestion.objects.bulk_create([
+            self.question(form, sections[min(q // per_section, section_count - 1)], q)
+            for q in range(question_count)
+        ])
+
+        # Some questions after a yes/no question show only on "ya"; conditions
+        # reference question ids, so they are added after the insert
+        questions = list(form.questions.order_by('order'))
+        conditional = []
+        for position, question in enumerate(questions):
+            previous = questions[position - 1] if position else None
+            if previous and previous.question_type == 'single_select' and position % 4 == 1:
+                question.logic = {
+                    'action': 'show',
+                    'match': 'all',
+                    'conditions': [{'question': previous.pk, 'operator': 'equals', 'value': 'ya'}],
+                }
+                question.is_required = False
+                conditional.append(question)
+        FormQuestion.objects.bulk_update(conditional, ['logic', 'is_required'])
+        form.dataset = dataset
+        return form
+
+    def question(self, form, section, order):
+        question_type = QUESTION_MIX[order % len(QUESTION_MIX)]
+        options = []
+        if question_type == 'single_select':
+            if order % 2 == 0:
+                options = [{'value': 'ya', 'text': 'Ya'}, {'value': 'tidak', 'text': 'Tidak'}]
+            else:
+                options = [{'value': str(v), 'text': str(v)} for v in range(1, 6)]
+        elif question_type == 'multi_select':
+            options = [{'value': f'opsi_{v}', 'text': f'Opsi {v}'} for v in range(1, 7)]
+        return FormQuestion(
+            form=form, section=section, order=order,
+            text=f'Pertanyaan {order + 1}', question_type=question_type,
+            options=options, is_required=order % 3 == 0,
+        )
+
+    def answer(self, question):
+        rng = self.rng
+        if question.question_type == 'single_select':
+            return rng.choice(question.options)['value']
+        if question.question_type == 'multi_select':
+            picked = rng.sample(question.options, rng.randint(1, 3))
+            return ', '.join(option['value'] for option in picked)
+        if question.question_type == 'numeric_input':
+            return str(rng.randint(0, 100))
+        if question.question_type == 'date_input':
+            return (SEED_EPOCH - timedelta(days=rng.randint(0, 3650))).strftime('%Y-%m-%d')
+        return rng.choice(['Baik', 'Cukup', 'Perlu perbaikan', 'Tidak ada komentar', 'Sangat membantu'])
+
+    def identity(self, dataset):
+        """``Response`` identity fields: mostly a record, some new identities, a few anonymous"""
+        roll = self.rng.random()
+        if dataset is None or roll >= 0.95:
+            return {}
+        if roll < 0.85 and dataset.record_ids:
+            return {'record_id': self.rng.choice(dataset.record_ids)}
+        wilayah, lingkungan = self.rng.choice(dataset.hierarchy)
+        return {
+            'is_new_identity': True,
+            'new_identity_dataset_id': dataset.pk,
+            'new_identity_data': {'Nama': self.person_name(), 'Wilayah': wilayah,
+                                  'Lingkungan': self.rng.choice(lingkungan)},
+        }
+
+    def create_responses(self, form, count):
+        questions = list(form.questions.order_by('order'))
+        logic = get_form_logic(form)
+        span = 365 * 24 * 3600
+        inserted = answer_total = 0
+        with _fixed_timestamps():
+            for start in range(0, count, self.batch_size):
+                pending = {}
+                for number in range(start, min(start + self.batch_size, count)):
+                    answers = {question.pk: self.answer(question) for question in questions}
+                    if logic.has_rules:
+                        for question_id in logic.hidden_questions(answers):
+                            del answers[question_id]
+                    submitted_at = SEED_EPOCH - timedelta(seconds=self.rng.randrange(span))
+                    # Derived from the slug, so another prefix never collides
+                    client_id = uuid.uuid5(uuid.NAMESPACE_URL, f'{form.slug}/{number}')
+                    pending[client_id] = (answers, Response(
+                        form=form,
+                        client_id=client_id,
+                        session_key=f'{self.prefix}-{self.rng.getrandbits(64):016x}',
+                        is_complete=True,
+                        submitted_at=submitted_at,
+                        updated_at=submitted_at,
+                        user_agent='seed_scale',
+                        answer_data=Response.answer_document(answers),
+                        **self.identity(form.dataset),
+                    ))
+
+                Response.objects.bulk_create([response for _, response in pending.values()])
+                # bulk_create does not return ids on every backend (MySQL)
+                response_ids = dict(
+                    Response.objects.filter(client_id__in=pending).values_list('client_id', 'id')
+                )
+                rows = [
+                    ResponseAnswer(response_id=response_ids[client_id], question_id=question_id, value=value)
+                    for client_id, (answers, _) in pending.items()
+                    for question_id, value in answers.items()
+                ]
+                ResponseAnswer.objects.bulk_create(rows, batch_size=5000)
+                inserted += len(pending)
+                answer_total += len(rows)
+                if inserted % (self.batch_size * 20) == 0:
+                    self.stdout.write(f'    … {inserted}/{count} responses')
+        return inserted, answer_total
+
+
+@contextmanager
+def _fixed_timestamps():
+    """Let bulk inserts keep the generated ``submitted_at``/``updated_at``"""
+    fields = [Response._meta.get_field('submitted_at'), Response._meta.get_field('updated_at')]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
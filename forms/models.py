@@ -1,11 +1,11 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.conf import settings as django_settings
+from django.utils import timezone
 from django.utils.text import slugify
 import uuid
-import qrcode
-from io import BytesIO
-from django.core.files import File
-# ...existing code...
+
+from .images import prepare_variants
 
 class Form(models.Model):
     """Survey form that can be published and shared"""
@@ -52,39 +52,27 @@ class Form(models.Model):
     
     def save(self, *args, **kwargs):
         if not self.slug:
-            # Generate a unique slug that fits within 50 characters
-            # Reserve 9 characters for the UUID part ("-" + 8 chars)
-            base_slug = slugify(self.title)[:41]  # Max 41 chars for base
-            unique_suffix = str(uuid.uuid4())[:8]
-            self.slug = f"{base_slug}-{unique_suffix}"
+            self.slug = self.generate_slug(self.title)
         super().save(*args, **kwargs)
-        
-        # Generate QR code if published and doesn't have one
-        if self.status == 'published' and not self.qr_code:
-            self.generate_qr_code()
+        prepare_variants(self.form_image)
+    
+    @staticmethod
+    def generate_slug(title):
+        """Generate a unique slug that fits within 50 characters"""
+        # Reserve 9 characters for the UUID part ("-" + 8 chars)
+        base_slug = slugify(title)[:41]  # Max 41 chars for base
+        unique_suffix = str(uuid.uuid4())[:8]
+        return f"{base_slug}-{unique_suffix}"
     
     def generate_qr_code(self):
-        """Generate QR code for the form URL"""
-        from django.conf import settings
-        from django.urls import reverse
+        """Write the QR code PNG to the qr_code file field (for download/printing).
         
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        # Get the site URL from settings
-        site_url = getattr(settings, 'SITE_URL', 'http://localhost:8000')
-        survey_path = reverse('responses:public_survey', kwargs={'slug': self.slug})
-        form_url = f"{site_url}{survey_path}"
-        qr.add_data(form_url)
-        qr.make(fit=True)
+        Public pages serve QR images through the cached QR service instead, so
+        this is only needed for a persisted copy of the image.
+        """
+        from .qr import regenerate_qr_files
         
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Save to file
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        filename = f'qr_{self.slug}.png'
-        
-        self.qr_code.save(filename, File(buffer), save=False)
-        self.save(update_fields=['qr_code'])
+        regenerate_qr_files([self], force=True)
     
     def __str__(self):
         return self.title
@@ -121,6 +109,17 @@ class FormMasterDataAttachment(models.Model):
         ordering = ['order']
         unique_together = ['form', 'dataset']
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Column settings change the public page; touch the form's version
+        Form.objects.filter(pk=self.form_id).update(updated_at=timezone.now())
+    
+    def delete(self, *args, **kwargs):
+        form_id = self.form_id
+        result = super().delete(*args, **kwargs)
+        Form.objects.filter(pk=form_id).update(updated_at=timezone.now())
+        return result
+
     def get_visible_columns(self):
         """Return the dataset's columns excluding any hidden columns for this attachment."""
         hidden = set(self.hidden_columns or [])
@@ -176,6 +175,18 @@ class FormSection(models.Model):
         ordering = ['order', 'id']
         unique_together = ['form', 'order']
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        prepare_variants(self.image)
+        Form.objects.filter(pk=self.form_id).update(updated_at=timezone.now())
+    
+    def delete(self, *args, **kwargs):
+        form_id = self.form_id
+        result = super().delete(*args, **kwargs)
+        # Deleting a section deletes its questions; rebuild the form's logic
+        Form.objects.filter(pk=form_id).update(updated_at=timezone.now())
+        return result
+    
     def __str__(self):
         return f"{self.form.title} - Section {self.order}: {self.title}"
 
@@ -212,6 +223,26 @@ class FormQuestion(models.Model):
     class Meta:
         ordering = ['order', 'id']
     
+    def clean(self):
+        super().clean()
+        if self.logic and self.form_id:
+            from .logic import validate_question_logic
+            errors = validate_question_logic(self)
+            if errors:
+                raise ValidationError({'logic': errors})
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        prepare_variants(self.image)
+        # Touch the form so its compiled logic is rebuilt
+        Form.objects.filter(pk=self.form_id).update(updated_at=timezone.now())
+    
+    def delete(self, *args, **kwargs):
+        form_id = self.form_id
+        result = super().delete(*args, **kwargs)
+        Form.objects.filter(pk=form_id).update(updated_at=timezone.now())
+        return result
+    
     def __str__(self):
         return f"{self.form.title} - Q{self.order}: {self.text[:50]}"
 
@@ -230,5 +261,9 @@ class QuestionOption(models.Model):
         ordering = ['order', 'id']
         unique_together = ['question', 'value']
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        prepare_variants(self.image)
+    
     def __str__(self):
         return f"{self.question} - {self.text}"
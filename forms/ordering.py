@@ -0,0 +1,105 @@
+"""
+Gap-based ordering for sections and questions.
+
+Order keys are spaced ``ORDER_GAP`` apart so that moving one item only needs
+a single UPDATE that places it between its new neighbours. When two
+neighbours have no room left between them the whole sibling list is
+rebalanced. Rebalancing and full reorders are applied with one
+``bulk_update`` after first lifting the rows out of the way, which keeps
+``FormSection``'s unique (form, order) constraint satisfied at every step.
+"""
+
+from django.db import transaction
+from django.db.models import F, Max, Q
+from django.utils import timezone
+
+from .models import Form
+
+ORDER_GAP = 1024
+
+
+def order_key(position):
+    """Order key for the item at ``position`` (0-based) in a rebalanced list"""
+    return (position + 1) * ORDER_GAP
+
+
+def next_order(siblings):
+    """Order key for an item appended after ``siblings``"""
+    max_order = siblings.aggregate(max_order=Max('order'))['max_order'] or 0
+    return max_order + ORDER_GAP
+
+
+@transaction.atomic
+def apply_ordering(objs, siblings=None, fields=()):
+    """Give ``objs`` gap-spaced order keys in list order with one bulk_update.
+
+    ``siblings`` is the queryset of every row sharing the ordering scope (it
+    defaults to ``objs`` themselves); the rows are first lifted above all of
+    its keys so no intermediate state can collide. ``fields`` lists extra
+    fields (e.g. ``section``) to write in the same bulk_update.
+    """
+    if not objs:
+        return
+    model = type(objs[0])
+    pks = [obj.pk for obj in objs]
+    if siblings is None:
+        siblings = model.objects.filter(pk__in=pks)
+
+    ceiling = max(
+        siblings.aggregate(max_order=Max('order'))['max_order'] or 0,
+        order_key(len(objs)),
+    )
+    model.objects.filter(pk__in=pks).update(order=F('order') + ceiling + 1)
+
+    for position, obj in enumerate(objs):
+        obj.order = order_key(position)
+    model.objects.bulk_update(objs, ['order', *fields])
+
+
+@transaction.atomic
+def move(obj, direction, siblings):
+    """Move ``obj`` (a section or question) one place 'up' or 'down' among ``siblings``.
+
+    Returns False when it is already first/last in that direction. A move
+    touches the form's ``updated_at``, which versions the public page.
+    """
+    moved = _move(obj, direction, siblings)
+    if moved:
+        # Queryset updates skip save(); touch the form so public pages change
+        Form.objects.filter(pk=obj.form_id).update(updated_at=timezone.now())
+    return moved
+
+
+def _move(obj, direction, siblings):
+    if direction == 'up':
+        neighbours = list(
+            siblings.filter(Q(order__lt=obj.order) | Q(order=obj.order, pk__lt=obj.pk))
+            .order_by('-order', '-pk').values_list('order', flat=True)[:2]
+        )
+        if not neighbours:
+            return False
+        hi = neighbours[0]
+        lo = neighbours[1] if len(neighbours) > 1 else -1
+    elif direction == 'down':
+        neighbours = list(
+            siblings.filter(Q(order__gt=obj.order) | Q(order=obj.order, pk__gt=obj.pk))
+            .order_by('order', 'pk').values_list('order', flat=True)[:2]
+        )
+        if not neighbours:
+            return False
+        lo = neighbours[0]
+        hi = neighbours[1] if len(neighbours) > 1 else lo + 2 * ORDER_GAP
+    else:
+        return False
+
+    if hi - lo >= 2:
+        type(obj).objects.filter(pk=obj.pk).update(order=(lo + hi) // 2)
+        return True
+
+    # No room between the neighbours: rebalance the whole list with obj moved
+    ordered = list(siblings.order_by('order', 'pk'))
+    index = next(i for i, item in enumerate(ordered) if item.pk == obj.pk)
+    item = ordered.pop(index)
+    ordered.insert(index - 1 if direction == 'up' else index + 1, item)
+    apply_ordering(ordered, siblings)
+    return True
@@ -0,0 +1,172 @@
+"""
+QR code rendering service for published forms.
+
+QR images are rendered on demand (lazily on first fetch) rather than during
+the publish request, and the rendered bytes are kept in the cache keyed by
+(slug, SITE_URL, size, format). Changing ``SITE_URL`` therefore naturally
+produces new cache entries and new ETags without any regeneration step.
+"""
+
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import qrcode
+import qrcode.image.svg
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.urls import reverse
+
+# Pixel sizes that may be requested through the QR image endpoint. Limiting
+# them keeps the number of cache entries per form bounded.
+QR_SIZES = (128, 256, 512, 1024)
+QR_DEFAULT_SIZE = 512
+QR_FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+QR_BORDER = 5
+
+# Bump when the rendering itself changes so caches and ETags are invalidated
+QR_RENDER_VERSION = 1
+
+
+def public_survey_url(slug):
+    """Absolute public survey URL encoded in a form's QR code"""
+    site_url = getattr(settings, 'SITE_URL', 'http://localhost:8000')
+    survey_path = reverse('responses:public_survey', kwargs={'slug': slug})
+    return f"{site_url}{survey_path}"
+
+
+def normalize_size(size):
+    """Snap a requested size to the nearest supported size"""
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        return QR_DEFAULT_SIZE
+    return min(QR_SIZES, key=lambda s: abs(s - size))
+
+
+def normalize_format(fmt):
+    fmt = (fmt or 'png').lower()
+    return fmt if fmt in QR_FORMATS else 'png'
+
+
+def qr_token(slug, size, fmt):
+    """Stable token identifying the rendered content for a form's QR code.
+
+    Used both as the cache key suffix and as the ETag, so a cheap conditional
+    GET never has to render anything.
+    """
+    site_url = getattr(settings, 'SITE_URL', 'http://localhost:8000')
+    raw = f"{QR_RENDER_VERSION}|{slug}|{site_url}|{size}|{fmt}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20]
+
+
+def render_qr(data, size=None, fmt='png'):
+    """Render ``data`` as a QR code and return the encoded bytes.
+
+    When ``size`` is given the PNG is scaled to exactly ``size`` pixels square;
+    SVG output is sized through its box size and stays scalable.
+    """
+    qr = qrcode.QRCode(version=1, box_size=10, border=QR_BORDER)
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    if size:
+        modules = qr.modules_count + 2 * QR_BORDER
+        qr.box_size = max(1, size // modules)
+
+    buffer = BytesIO()
+    if fmt == 'svg':
+        img = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+        img.save(buffer)
+    else:
+        img = qr.make_image(fill_color="black", back_color="white").get_image()
+        if size and img.size != (size, size):
+            from PIL import Image
+            img = img.resize((size, size), Image.NEAREST)
+        img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def get_qr_image(slug, size=QR_DEFAULT_SIZE, fmt='png'):
+    """Return the QR image bytes for a form slug, rendering at most once per key"""
+    key = f"qr:{slug}:{qr_token(slug, size, fmt)}"
+    content = cache.get(key)
+    if content is None:
+        content = render_qr(public_survey_url(slug), size=size, fmt=fmt)
+        cache.set(key, content, getattr(settings, 'QR_CACHE_TIMEOUT', 60 * 60 * 24 * 30))
+    return content
+
+
+def invalidate_qr_images(slug):
+    """Drop every cached QR rendering for a form"""
+    cache.delete_many([
+        f"qr:{slug}:{qr_token(slug, size, fmt)}"
+        for size in QR_SIZES
+        for fmt in QR_FORMATS
+    ])
+
+
+def qr_file_name(slug):
+    """Storage name of a form's persisted QR PNG.
+
+    The name embeds a digest of the encoded URL, so a form whose file already
+    matches the current SITE_URL can be recognised without re-rendering.
+    """
+    digest = hashlib.sha1(public_survey_url(slug).encode('utf-8')).hexdigest()[:8]
+    return f"qr_codes/qr_{slug}-{digest}.png"
+
+
+def _write_qr_file(job):
+    """Render one QR PNG and write it to disk (runs in a worker process)"""
+    url, path = job
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as fh:
+        fh.write(render_qr(url))
+
+
+def regenerate_qr_files(forms, workers=1, force=False, batch_size=500):
+    """Write QR PNG files for ``forms`` and store them on the qr_code field.
+
+    Forms whose file already encodes the current URL are skipped unless
+    ``force`` is set. Rendering runs in a process pool when ``workers`` > 1,
+    and the qr_code field updates are committed with a single bulk_update.
+    Returns ``(updated_forms, skipped_count)``.
+    """
+    from .models import Form
+
+    jobs = []
+    updated = []
+    stale_files = []
+    skipped = 0
+
+    for form in forms:
+        name = qr_file_name(form.slug)
+        if not force and form.qr_code.name == name and default_storage.exists(name):
+            skipped += 1
+            continue
+        if form.qr_code.name and form.qr_code.name != name:
+            stale_files.append(form.qr_code.name)
+        form.qr_code.name = name
+        jobs.append((public_survey_url(form.slug), default_storage.path(name)))
+        updated.append(form)
+
+    if workers > 1 and len(jobs) > 1:
+        chunksize = max(1, len(jobs) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_write_qr_file, jobs, chunksize=chunksize))
+    else:
+        for job in jobs:
+            _write_qr_file(job)
+
+    if updated:
+        Form.objects.bulk_update(updated, ['qr_code'], batch_size=batch_size)
+
+    for name in stale_files:
+        default_storage.delete(name)
+
+    return updated, skipped
@@ -1,8 +1,15 @@
 from django import template
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.http import urlencode
 from django.utils.safestring import mark_safe
 import json
 import re
 
+from forms.images import get_variants, name_from_url
+from forms.qr import QR_DEFAULT_SIZE, normalize_format, normalize_size, qr_token
+
 register = template.Library()
 
 @register.simple_tag
@@ -15,10 +22,60 @@ def record_display(record, attachment):
     """Filter version of get_record_display."""
     return attachment.get_record_display_value(record)
 
+@register.simple_tag
+def qr_image_url(form, size=QR_DEFAULT_SIZE, fmt='png', download=False):
+    """Versioned (immutable) URL of a form's cached QR code image.
+    Usage: {% qr_image_url form 512 'svg' %}
+    """
+    size, fmt = normalize_size(size), normalize_format(fmt)
+    params = {'size': size, 'format': fmt, 'v': qr_token(form.slug, size, fmt)}
+    if download:
+        params['download'] = 1
+    return f"{reverse('forms:qr_code_image', kwargs={'slug': form.slug})}?{urlencode(params)}"
+
+@register.simple_tag
+def responsive_image(image, alt='', css_class='', sizes='100vw', lazy=True):
+    """<picture> with WebP/JPEG srcsets for an uploaded image.
+    ``image`` is an ImageField value or a media URL (option images).
+    Usage: {% responsive_image question.image alt="Question" css_class="question-image" sizes="(min-width: 768px) 640px, 100vw" %}
+    """
+    if not image:
+        return ''
+    if isinstance(image, str):
+        name, src = name_from_url(image), image
+    else:
+        name, src = image.name, image.url
+    loading = 'lazy' if lazy else 'eager'
+    manifest = get_variants(name) if name else None
+    if not manifest:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}" decoding="async">',
+            src, alt, css_class, loading,
+        )
+
+    def srcset(fmt):
+        return ', '.join(f'{default_storage.url(variant)} {width}w' for width, variant in manifest[fmt])
+
+    fallback = default_storage.url(manifest['jpeg'][-1][1])
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}" '
+        'loading="{}" decoding="async"></picture>',
+        srcset('webp'), sizes, fallback, srcset('jpeg'), sizes,
+        manifest['width'], manifest['height'], alt, css_class, loading,
+    )
+
+# Characters that could end a <script> element or start markup inside it
+_JSON_SCRIPT_ESCAPES = {ord('<'): '\\u003C', ord('>'): '\\u003E', ord('&'): '\\u0026'}
+
 @register.filter
 def json_script(value):
-    """Safely convert Python data to JavaScript JSON."""
-    return json.dumps(value)
+    """Safely convert Python data to JavaScript JSON.
+
+    ``<``, ``>`` and ``&`` are escaped, so author-entered strings such as
+    ``</script>`` cannot close the surrounding script element.
+    """
+    return json.dumps(value).translate(_JSON_SCRIPT_ESCAPES)
 
 @register.filter
 def dict_get(dictionary, key):
@@ -1,3 +1,375 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image as PILImage
+
+from accounts.models import ApiToken, User
+from master_data.models import MasterDataSet
+from survey_project.testing import QueryBudgetAssertions, seed_survey
+from . import images
+from .models import Form, FormMasterDataAttachment, FormQuestion, FormSection
+from .templatetags.form_extras import responsive_image
+
+
+class FormViewQueryBudgetTests(QueryBudgetAssertions, TestCase):
+    """Every view in forms/urls.py makes a bounded number of queries"""
+
+    def test_list(self):
+        self.each_survey(lambda form: self.assertQueryBudget(3, 'get', reverse('forms:list')))
+
+    def test_create(self):
+        def check(form):
+            self.assertQueryBudget(2, 'get', reverse('forms:create'))
+            self.assertQueryBudget(3, 'post', reverse('forms:create'), status=302,
+                                   data={'title': 'New form', 'description': ''})
+        self.each_survey(check)
+
+    def test_detail(self):
+        self.each_survey(lambda form: self.assertQueryBudget(10, 'get', reverse('forms:detail', args=[form.pk])))
+
+    def test_edit(self):
+        def check(form):
+            url = reverse('forms:edit', args=[form.pk])
+            self.assertQueryBudget(3, 'get', url)
+            self.assertQueryBudget(4, 'post', url, status=302, data={
+                'title': 'Renamed', 'description': 'Updated', 'password': '',
+            })
+        self.each_survey(check)
+
+    def test_delete(self):
+        def check(form):
+            url = reverse('forms:delete', args=[form.pk])
+            self.assertQueryBudget(9, 'get', url)
+            self.assertQueryBudget(16, 'post', url, status=302)
+        self.each_survey(check)
+
+    def test_duplicate(self):
+        self.each_survey(lambda form: self.assertQueryBudget(
+            14, 'post', reverse('forms:duplicate', args=[form.pk]), status=302,
+        ))
+
+    def test_questions(self):
+        self.each_survey(lambda form: self.assertQueryBudget(6, 'get', reverse('forms:questions', args=[form.pk])))
+
+    def test_question_add(self):
+        def check(form):
+            url = reverse('forms:question_add', args=[form.pk])
+            self.assertQueryBudget(7, 'get', url)
+            self.assertQueryBudget(9, 'post', url, status=302, data={
+                'section': form.sections.first().pk, 'text': 'Colour', 'question_type': 'single_select',
+                'order': 0, 'option_text[]': ['Red', 'Blue'], 'option_value[]': ['red', 'blue'],
+            })
+        self.each_survey(check)
+
+    def test_question_edit(self):
+        def check(form):
+            question = form.questions.get(text='Choice')
+            url = reverse('forms:question_edit', args=[question.pk])
+            self.assertQueryBudget(7, 'get', url)
+            self.assertQueryBudget(8, 'post', url, status=302, data={
+                'section': question.section_id, 'text': 'Choice?', 'question_type': 'single_select',
+                'order': question.order, 'is_required': 'on',
+                'option_text[]': ['Yes', 'No'], 'option_value[]': ['yes', 'no'],
+            })
+        self.each_survey(check)
+
+    def test_question_delete(self):
+        def check(form):
+            url = reverse('forms:question_delete', args=[form.questions.get(text='When').pk])
+            self.assertQueryBudget(4, 'get', url)
+            self.assertQueryBudget(8, 'post', url, status=302)
+        self.each_survey(check)
+
+    def test_section_add(self):
+        def check(form):
+            url = reverse('forms:section_add', args=[form.pk])
+            self.assertQueryBudget(3, 'get', url)
+            self.assertQueryBudget(6, 'post', url, status=302, data={'title': 'More', 'description': ''})
+        self.each_survey(check)
+
+    def test_section_edit(self):
+        def check(form):
+            section = form.sections.first()
+            url = reverse('forms:section_edit', args=[section.pk])
+            self.assertQueryBudget(4, 'get', url)
+            self.assertQueryBudget(6, 'post', url, status=302, data={
+                'title': 'Renamed', 'description': '', 'order': section.order,
+            })
+        self.each_survey(check)
+
+    def test_section_delete(self):
+        def check(form):
+            url = reverse('forms:section_delete', args=[form.sections.last().pk])
+            self.assertQueryBudget(5, 'get', url)
+            self.assertQueryBudget(10, 'post', url, status=302)
+        self.each_survey(check)
+
+    def test_reorder_buttons(self):
+        def check(form):
+            # Lookup, savepoint, neighbours, move, touch the form, release
+            self.assertQueryBudget(6, 'post', reverse('forms:section_reorder', args=[form.sections.first().pk]),
+                                   data={'direction': 'down'})
+            self.assertQueryBudget(6, 'post', reverse('forms:question_reorder', args=[form.questions.first().pk]),
+                                   data={'direction': 'down'})
+        self.each_survey(check)
+
+    def test_reorder(self):
+        def check(form):
+            sections = list(form.sections.values_list('pk', flat=True))
+            payload = {
+                'sections': sections[::-1],
+                'questions': [
+                    {'section': section, 'ids': list(form.questions.filter(section=section).values_list('pk', flat=True))[::-1]}
+                    for section in sections
+                ],
+            }
+            self.assertQueryBudget(14, 'post', reverse('forms:reorder', args=[form.pk]),
+                                   data=json.dumps(payload), content_type='application/json')
+        self.each_survey(check)
+
+    def test_publish(self):
+        def check(form):
+            url = reverse('forms:publish', args=[form.pk])
+            self.assertQueryBudget(5, 'get', url)
+            self.assertQueryBudget(4, 'post', url, status=302, data={'action': 'update_settings', 'password': ''})
+            self.assertQueryBudget(4, 'post', url, status=302, data={'action': 'unpublish'})
+            self.assertQueryBudget(5, 'post', url, status=302, data={'action': 'publish'})
+        self.each_survey(check)
+
+    def test_responses(self):
+        def check(form):
+            url = reverse('forms:responses', args=[form.pk])
+            self.assertQueryBudget(11, 'get', url)
+            self.assertQueryBudget(11, 'get', url, data={'page': 2})
+        self.each_survey(check)
+
+    def test_responses_export(self):
+        self.each_survey(lambda form: self.assertQueryBudget(
+            10, 'get', reverse('forms:responses_export', args=[form.pk]),
+        ))
+
+    def test_responses_import(self):
+        def check(form):
+            choice = form.questions.get(text='Choice')
+            # One row per record: the file grows with the survey
+            rows = [
+                {f'question_{choice.pk}': 'no', f'dataset_{record.dataset_id}': str(record.pk)}
+                for record in form.master_data_attachments.get().dataset.records.all()
+            ]
+            self.assertQueryBudget(14, 'post', reverse('forms:responses_import', args=[form.pk]),
+                                   data=json.dumps(rows), content_type='application/json')
+        self.each_survey(check)
+
+    def test_qr_code(self):
+        def check(form):
+            self.assertQueryBudget(5, 'get', reverse('forms:qr_code', args=[form.slug]))
+            self.assertQueryBudget(1, 'get', reverse('forms:qr_code_image', args=[form.slug]))
+        self.each_survey(check)
+
+    def test_master_data_attachment(self):
+        def check(form):
+            attachment = form.master_data_attachments.get()
+            other = MasterDataSet.objects.filter(owner=form.owner).exclude(pk=attachment.dataset_id).first()
+            self.assertQueryBudget(4, 'get', reverse('forms:master_data_available', args=[form.pk]))
+            self.assertQueryBudget(11, 'post', reverse('forms:master_data_attach', args=[form.pk]),
+                                   data={'dataset_id': other.pk})
+            url = reverse('forms:master_data_configure', args=[form.pk, attachment.pk])
+            self.assertQueryBudget(6, 'get', url)
+            self.assertQueryBudget(9, 'post', url, data={
+                'display_column': 'Name', 'hidden_columns': ['Phone'], 'filter_columns': ['Region'],
+            })
+            self.assertQueryBudget(8, 'delete', reverse('forms:master_data_detach', args=[form.pk, attachment.pk]))
+        self.each_survey(check)
+
+
+class QRCodeImageTests(TestCase):
+    """Conditional requests for QR images never outlive the published form"""
+
+    def setUp(self):
+        owner = User.objects.create_user('owner', password='x')
+        self.form = Form.objects.create(title='Survey', owner=owner, status='published')
+        self.url = reverse('forms:qr_code_image', args=[self.form.slug])
+
+    def test_unpublished_or_deleted_form(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Form.objects.filter(pk=self.form.pk).update(status='draft')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 404)
+        Form.objects.filter(pk=self.form.pk).delete()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 404)
+
+
+class CloneSpecValidationTests(TestCase):
+    """Invalid clone specs are reported before anything is written"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='x')
+        cls.source = Form.objects.create(title='Survey', owner=cls.owner)
+        cls.people, cls.places, cls.other = [
+            MasterDataSet.objects.create(name=name, description='', owner=cls.owner)
+            for name in ('People', 'Places', 'Other')
+        ]
+        for dataset in (cls.people, cls.places):
+            FormMasterDataAttachment.objects.create(form=cls.source, dataset=dataset)
+
+    def clone(self, content, suffix):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False) as fh:
+            fh.write(content)
+        self.addCleanup(os.unlink, fh.name)
+        call_command('clone_form', form_id=self.source.pk, spec=fh.name, stdout=StringIO())
+
+    def assertRejected(self, content, suffix, message):
+        forms = Form.objects.count()
+        with self.assertRaisesMessage(CommandError, message):
+            self.clone(content, suffix)
+        self.assertEqual(Form.objects.count(), forms)
+
+    def test_slugs(self):
+        Form.objects.create(title='Taken', slug='taken', owner=self.owner)
+        self.assertRejected(json.dumps([{'title': 'A', 'slug': 'a'}, {'title': 'B', 'slug': 'a'}]), '.json',
+                            'used by more than one clone')
+        self.assertRejected(json.dumps([{'title': 'A', 'slug': 'taken'}]), '.json', 'already taken')
+        self.assertRejected(json.dumps([{'title': 'A', 'slug': 'not a slug'}]), '.json', 'not a valid slug')
+
+    def test_dataset_overrides(self):
+        self.assertRejected(f'A | | {self.people.pk}={self.places.pk}', '.txt', 'same dataset more than once')
+        self.assertRejected(f'A | | {self.people.pk}={self.other.pk},{self.places.pk}={self.other.pk}', '.txt',
+                            'same dataset more than once')
+        self.assertRejected(f'A | | {self.other.pk}={self.people.pk}', '.txt', 'not attached to the source form')
+        self.assertRejected(f'A | | {self.people.pk}=999999', '.txt', 'does not exist')
+
+    def test_unknown_override_fields(self):
+        spec = [{'title': 'A', 'attachments': {str(self.people.pk): {'dataset_id': self.other.pk, 'colour': 'red'}}}]
+        self.assertRejected(json.dumps(spec), '.json', 'unknown field(s) colour')
+        self.assertFalse(Form.objects.filter(title='A').exists())
+
+    def test_valid_specs(self):
+        self.clone(f'A | owner | {self.people.pk}={self.other.pk}\nB', '.txt')
+        clone = Form.objects.get(title='A')
+        self.assertEqual(
+            set(clone.master_data_attachments.values_list('dataset_id', flat=True)),
+            {self.other.pk, self.places.pk},
+        )
+
+    def test_admin_action_reports_invalid_specs(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        response = self.client.post(reverse('admin:forms_form_changelist'), {
+            'action': 'clone_to_many', '_selected_action': [self.source.pk], 'apply': '1',
+            'clones': f'A | | {self.people.pk}={self.places.pk}',
+        })
+        self.assertContains(response, 'same dataset more than once')
+        self.assertFalse(Form.objects.filter(title='A').exists())
+
+
+class ArrowReorderTests(TestCase):
+    """Arrow moves version the public survey page like drag-and-drop reorders"""
+
+    def setUp(self):
+        owner = User.objects.create_user('owner', password='x')
+        self.form = Form.objects.create(title='Survey', owner=owner, status='published', require_captcha=False)
+        self.sections = [FormSection.objects.create(form=self.form, title=f'S{n}', order=n) for n in range(2)]
+        self.questions = [
+            FormQuestion.objects.create(form=self.form, section=self.sections[0], text=f'Q{n}',
+                                        question_type='text_input', order=n)
+            for n in range(2)
+        ]
+        self.client.force_login(owner)
+        self.url = reverse('responses:public_survey', args=[self.form.slug])
+
+    def assertNewETag(self, reorder_url):
+        self.client.get(self.url)  # Sets the CSRF cookie the ETag depends on
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertTrue(self.client.post(reorder_url, {'direction': 'down'}).json()['success'])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_question_arrow(self):
+        self.assertNewETag(reverse('forms:question_reorder', args=[self.questions[0].pk]))
+
+    def test_section_arrow(self):
+        self.assertNewETag(reverse('forms:section_reorder', args=[self.sections[0].pk]))
+
+
+class ImageVariantTests(TestCase):
+    """Variants are encoded in the background, never in the saving or rendering request"""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x')
+
+    def upload(self):
+        out = BytesIO()
+        PILImage.new('RGB', (800, 400), 'red').save(out, 'PNG')
+        return SimpleUploadedFile('header.png', out.getvalue(), content_type='image/png')
+
+    def wait_for_variants(self):
+        images._executor.submit(lambda: None).result()
+
+    def test_save_defers_variants_until_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            form = Form.objects.create(title='Survey', owner=self.owner, form_image=self.upload())
+        self.assertFalse(default_storage.exists('variants'))
+        self.assertEqual(len(callbacks), 1)
+
+        callbacks[0]()
+        self.wait_for_variants()
+        manifest = images.get_variants(form.form_image.name)
+        self.assertEqual([width for width, _ in manifest['webp']], [160, 320, 640, 800])
+        self.assertTrue(all(default_storage.exists(name) for _, name in manifest['jpeg']))
+
+    def test_render_serves_original_until_variants_exist(self):
+        form = Form.objects.create(title='Survey', owner=self.owner, form_image=self.upload())
+        self.assertNotIn('<picture>', responsive_image(form.form_image))
+        self.wait_for_variants()
+        self.assertIn('<picture>', responsive_image(form.form_image))
+
+
+class ResponsesImportAuthTests(TestCase):
+    """Scripts upload with an API token; browser sessions still need the CSRF token"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='x')
+        cls.form = seed_survey(cls.owner, 2)
+        cls.url = reverse('forms:responses_import', args=[cls.form.pk])
+
+    def setUp(self):
+        self.client = Client(enforce_csrf_checks=True)
+
+    def upload(self, **extra):
+        choice = self.form.questions.get(text='Choice')
+        record = self.form.master_data_attachments.get().dataset.records.first()
+        rows = [{f'question_{choice.pk}': 'no', f'dataset_{record.dataset_id}': str(record.pk)}]
+        upload = SimpleUploadedFile('rows.json', json.dumps(rows).encode(), content_type='application/json')
+        return self.client.post(self.url, {'file': upload}, **extra)
+
+    def test_api_token(self):
+        _, key = ApiToken.create_token(self.owner, 'enumerators')
+        response = self.upload(HTTP_AUTHORIZATION=f'Bearer {key}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['imported'], 1)
+
+    def test_invalid_or_foreign_token(self):
+        self.assertEqual(self.upload(HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertEqual(self.upload().status_code, 401)
+        _, key = ApiToken.create_token(User.objects.create_user('other', password='x'), 'other')
+        self.assertEqual(self.upload(HTTP_AUTHORIZATION=f'Bearer {key}').status_code, 404)
+
+    def test_session_needs_csrf_token(self):
+        self.client.force_login(self.owner)
+        self.assertEqual(self.upload().status_code, 403)
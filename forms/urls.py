@@ -9,6 +9,7 @@ urlpatterns = [
     path('<int:pk>/', views.FormDetailView.as_view(), name='detail'),
     path('<int:pk>/edit/', views.FormEditView.as_view(), name='edit'),
     path('<int:pk>/delete/', views.FormDeleteView.as_view(), name='delete'),
+    path('<int:pk>/duplicate/', views.FormDuplicateView.as_view(), name='duplicate'),
     path('<int:pk>/questions/', views.FormQuestionEditView.as_view(), name='questions'),
     path('<int:pk>/questions/add/', views.FormQuestionCreateView.as_view(), name='question_add'),
     path('questions/<int:pk>/edit/', views.FormQuestionUpdateView.as_view(), name='question_edit'),
@@ -23,10 +24,15 @@ urlpatterns = [
     # Question reordering
     path('questions/<int:pk>/reorder/', views.reorder_question, name='question_reorder'),
     
+    # Drag-and-drop reordering of all sections and questions
+    path('<int:pk>/reorder/', views.FormReorderView.as_view(), name='reorder'),
+    
     path('<int:pk>/publish/', views.FormPublishView.as_view(), name='publish'),
     path('<int:pk>/responses/', views.FormResponsesView.as_view(), name='responses'),
     path('<int:pk>/responses/export/', views.export_responses_excel, name='responses_export'),
+    path('<int:pk>/responses/import/', views.FormResponsesImportView.as_view(), name='responses_import'),
     path('<slug:slug>/qr/', views.FormQRCodeView.as_view(), name='qr_code'),
+    path('<slug:slug>/qr/image/', views.qr_code_image, name='qr_code_image'),
     
     # HTMX endpoints for master data attachment
     path('<int:pk>/master-data/available/', views.MasterDataAttachmentListView.as_view(), name='master_data_available'),
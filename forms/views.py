@@ -3,18 +3,33 @@ from collections import Counter
 from django.views.generic import ListView, CreateView, DetailView, UpdateView, DeleteView, View
 from django.core.paginator import Paginator
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.models import AnonymousUser
 from django.contrib import messages
 from django.urls import reverse_lazy
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
-from django.http import JsonResponse, HttpResponse
+from django.utils.decorators import method_decorator
+from django.http import JsonResponse, HttpResponse, Http404
 from django.db import models, transaction
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_http_methods, etag
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+import io
 import json
 from django.utils.text import slugify
  
+from accounts.models import ApiToken
+from responses.ingest import IngestError, detect_format, ingest_rows, read_rows
+from responses.models import Response
+from survey_project.queries import count_related
 from .models import Form, FormQuestion, FormMasterDataAttachment, FormSection
 from .forms import FormQuestionForm, FormEditForm, FormSectionForm
+from .duplication import duplicate_form
+from .logic import get_form_logic
+from .ordering import apply_ordering, move, next_order, order_key
+from .qr import (
+    QR_DEFAULT_SIZE, QR_FORMATS, get_qr_image, invalidate_qr_images,
+    normalize_format, normalize_size, public_survey_url, qr_token,
+)
 
 class FormListView(LoginRequiredMixin, ListView):
     model = Form
@@ -22,7 +37,10 @@ class FormListView(LoginRequiredMixin, ListView):
     context_object_name = 'forms'
     
     def get_queryset(self):
-        return Form.objects.filter(owner=self.request.user)
+        return Form.objects.filter(owner=self.request.user).annotate(
+            question_count=count_related(FormQuestion, 'form'),
+            response_count=count_related(Response, 'form'),
+        )
 
 class FormCreateView(LoginRequiredMixin, CreateView):
     model = Form
@@ -113,6 +131,22 @@ class FormDeleteView(LoginRequiredMixin, View):
         messages.success(request, f'Form "{form_title}" has been deleted successfully.')
         return redirect('forms:list')
 
+class FormDuplicateView(LoginRequiredMixin, View):
+    """Create a draft copy of a form owned by the current user"""
+    
+    def post(self, request, pk):
+        form = get_object_or_404(
+            Form.objects.filter(
+                models.Q(owner=request.user) | models.Q(editors=request.user)
+            ).distinct(),
+            pk=pk,
+        )
+        
+        new_form, _ = duplicate_form(form, owner=request.user)
+        
+        messages.success(request, f'Form "{form.title}" duplicated as "{new_form.title}".')
+        return redirect('forms:detail', pk=new_form.pk)
+
 class FormQuestionEditView(LoginRequiredMixin, DetailView):
     model = Form
     template_name = 'forms/questions.html'
@@ -177,11 +211,8 @@ class FormQuestionCreateView(LoginRequiredMixin, CreateView):
         
         # Auto-assign order if not provided or is 0
         if not form.instance.order or form.instance.order == 0:
-            # Get the next available order number
-            max_order = parent_form.questions.aggregate(
-                max_order=models.Max('order')
-            )['max_order'] or 0
-            form.instance.order = max_order + 1
+            # Append after the last question, leaving a gap for later moves
+            form.instance.order = next_order(parent_form.questions.all())
         
         # Handle options from POST data
         options = self._process_options_from_request()
@@ -280,11 +311,8 @@ class FormSectionCreateView(LoginRequiredMixin, CreateView):
         
         # Auto-assign order if not provided or is 0
         if not form.instance.order or form.instance.order == 0:
-            # Get the next available order number
-            max_order = parent_form.sections.aggregate(
-                max_order=models.Max('order')
-            )['max_order'] or 0
-            form.instance.order = max_order + 1
+            # Append after the last section, leaving a gap for later moves
+            form.instance.order = next_order(parent_form.sections.all())
         
         messages.success(self.request, 'Section created successfully')
         return super().form_valid(form)
@@ -358,20 +386,19 @@ class FormPublishView(LoginRequiredMixin, View):
             messages.error(request, 'Cannot publish form without questions.')
             return redirect('forms:publish', pk=form.pk)
             
-        # Update form status
-        form.status = 'published'
-        form.published_at = timezone.now()
-        
-        # Update settings from form
+        # Update status and settings in a single UPDATE; the QR code is
+        # rendered lazily by the QR image endpoint on first fetch
         password = request.POST.get('password', '').strip()
         require_captcha = request.POST.get('require_captcha') == 'on'
+        now = timezone.now()
         
-        form.password = password
-        form.require_captcha = require_captcha
-        
-        form.save()
-        
-        # Generate QR code (this will be done automatically in the model's save method)
+        Form.objects.filter(pk=form.pk).update(
+            status='published',
+            published_at=now,
+            password=password,
+            require_captcha=require_captcha,
+            updated_at=now,
+        )
         
         messages.success(request, f'Form "{form.title}" has been published successfully!')
         return redirect('forms:publish', pk=form.pk)
@@ -406,10 +433,11 @@ class FormPublishView(LoginRequiredMixin, View):
             messages.error(request, 'Can only regenerate QR code for published forms.')
             return redirect('forms:publish', pk=form.pk)
         
-        # Delete old QR code and regenerate
+        # Drop the stored file and cached renderings; the next fetch re-renders
         if form.qr_code:
             form.qr_code.delete(save=False)
-        form.generate_qr_code()
+            Form.objects.filter(pk=form.pk).update(qr_code=None)
+        invalidate_qr_images(form.slug)
         
         messages.success(request, 'QR code has been regenerated successfully!')
         return redirect('forms:publish', pk=form.pk)
@@ -432,23 +460,33 @@ class FormResponsesView(LoginRequiredMixin, DetailView):
         form_obj = self.object
         
         # Get all responses for this form
-        responses_qs = form_obj.responses.select_related('user', 'record').prefetch_related('answers').all()
-        responses_list = list(responses_qs)
+        # Answers come from each response's answer_data document
+        responses_qs = Response.with_answers(form_obj.responses.select_related('user', 'record').all())
+        # Filter statistics only need the identity data
+        responses_list = list(responses_qs.defer('answer_data').prefetch_related(None))
         
         context['responses'] = responses_qs
+        context['response_count'] = len(responses_list)
+        context['question_count'] = form_obj.questions.count()
         context['complete_count'] = responses_qs.filter(is_complete=True).count()
 
-        attachments = form_obj.master_data_attachments.select_related('dataset').all()
+        attachments = list(
+            form_obj.master_data_attachments.select_related('dataset').prefetch_related('dataset__columns')
+        )
         context['filter_statistics'] = self._build_filter_statistics(responses_list, attachments)
 
         paginator = Paginator(responses_qs, self.paginate_by)
         page_number = self.request.GET.get('page')
         page_obj = paginator.get_page(page_number)
+        # Respondent names from the attachments loaded above, not a query per row
+        attachments_by_dataset = {attachment.dataset_id: attachment for attachment in attachments}
+        for response in page_obj:
+            response.respondent_display = response.get_respondent_display(attachments_by_dataset)
 
         context['paginated_responses'] = page_obj
         context['page_obj'] = page_obj
         context['is_paginated'] = page_obj.has_other_pages()
-        context['latest_response'] = responses_qs.first()
+        context['latest_response'] = responses_list[0] if responses_list else None
         
         return context
 
@@ -545,13 +583,14 @@ def export_responses_excel(request, pk):
 
     # Question headers
     questions = list(form_obj.questions.all())
+    logic = get_form_logic(form_obj)
     question_headers = [q.text for q in questions]
 
     # Build full header row
     headers = base_headers + [h for (_, _, h) in md_columns] + question_headers
 
     # Prepare queryset with prefetched relations
-    responses_qs = form_obj.responses.select_related('user', 'record').prefetch_related('answers')
+    responses_qs = Response.with_answers(form_obj.responses.select_related('user', 'record'))
     total_responses = responses_qs.count()
 
     import csv
@@ -605,10 +644,12 @@ def export_responses_excel(request, pk):
                         value = ''
                 row.append(value)
 
-            # Answers: build mapping question_id -> value
-            answers_map = {a.question_id: a.value for a in resp.answers.all()}
+            # Answers: mapping question_id -> value
+            answers_map = resp.get_answers_map()
+            # Answers to questions hidden by conditional logic are left blank
+            hidden = logic.hidden_questions(answers_map) if logic.has_rules else ()
             for q in questions:
-                val = answers_map.get(q.id, '')
+                val = '' if q.id in hidden else answers_map.get(q.id, '')
                 if isinstance(val, (dict, list)):
                     try:
                         val = json.dumps(val, ensure_ascii=False)
@@ -642,29 +683,113 @@ class FormQRCodeView(DetailView):
         """Get the form object and ensure it's published"""
         obj = super().get_object(queryset)
         if obj.status != 'published':
-            from django.http import Http404
             raise Http404("Form is not published")
-        
-        # Generate QR code if it doesn't exist
-        if not obj.qr_code:
-            obj.generate_qr_code()
-            obj.refresh_from_db()
-            
         return obj
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        form_obj = self.object
-        
         # Get the public URL using settings.SITE_URL
-        from django.urls import reverse
-        from django.conf import settings
-        survey_path = reverse('responses:public_survey', kwargs={'slug': form_obj.slug})
-        context['public_url'] = f"{settings.SITE_URL}{survey_path}"
-        
+        context['public_url'] = public_survey_url(self.object.slug)
         return context
 
 
+def _qr_image_params(request):
+    return (
+        normalize_size(request.GET.get('size', QR_DEFAULT_SIZE)),
+        normalize_format(request.GET.get('format')),
+    )
+
+
+def _qr_form_published(request, slug):
+    """Whether ``slug`` is a published form, looked up once per request"""
+    if not hasattr(request, '_qr_form_published'):
+        request._qr_form_published = Form.objects.filter(slug=slug, status='published').exists()
+    return request._qr_form_published
+
+
+def _qr_image_etag(request, slug):
+    # No ETag for missing or unpublished forms, so etag() falls through to the 404
+    if not _qr_form_published(request, slug):
+        return None
+    size, fmt = _qr_image_params(request)
+    return qr_token(slug, size, fmt)
+
+
+@require_http_methods(["GET", "HEAD"])
+@etag(_qr_image_etag)
+def qr_code_image(request, slug):
+    """Serve a form's QR code as PNG or SVG at a supported size.
+
+    Images are rendered on first fetch and cached; conditional requests are
+    answered from the ETag without rendering. URLs carrying the current
+    ``v`` token are immutable and cached by browsers for a year.
+    """
+    if not _qr_form_published(request, slug):
+        raise Http404("Form is not published")
+    
+    size, fmt = _qr_image_params(request)
+    token = qr_token(slug, size, fmt)
+    
+    response = HttpResponse(get_qr_image(slug, size, fmt), content_type=QR_FORMATS[fmt])
+    if request.GET.get('v') == token:
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = 'public, max-age=86400'
+    if request.GET.get('download'):
+        response['Content-Disposition'] = f'attachment; filename="qr_{slug}.{fmt}"'
+    return response
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class FormResponsesImportView(View):
+    """Bulk-import responses keyed in from paper forms (see responses/ingest.py).
+    
+    Accepts a JSON or CSV ``file`` upload, or a JSON request body, and answers
+    with the ingestion report as JSON. ``?dry_run=1`` only validates.
+    
+    Scripts authenticate with an API token (``Authorization: Bearer <key>``),
+    which a cross-site page cannot send, so they need no CSRF token; logged-in
+    browser sessions are CSRF-checked as usual.
+    """
+    
+    def dispatch(self, request, *args, **kwargs):
+        if 'HTTP_AUTHORIZATION' in request.META:
+            request.user = ApiToken.from_request(request) or AnonymousUser()
+        elif request.user.is_authenticated:
+            return csrf_protect(super().dispatch)(request, *args, **kwargs)
+        if not request.user.is_authenticated:
+            response = JsonResponse({'error': 'Authentication credentials were not provided or are invalid.'}, status=401)
+            response['WWW-Authenticate'] = 'Bearer'
+            return response
+        return super().dispatch(request, *args, **kwargs)
+    
+    def post(self, request, pk):
+        form_obj = get_object_or_404(
+            Form.objects.filter(
+                models.Q(owner=request.user) | models.Q(editors=request.user)
+            ).distinct(),
+            pk=pk,
+        )
+        
+        try:
+            if 'file' in request.FILES:
+                upload = request.FILES['file']
+                rows = read_rows(upload.file, detect_format(upload.name))
+            elif request.content_type == 'application/json':
+                rows = read_rows(io.BytesIO(request.body), 'json')
+            else:
+                return JsonResponse({'error': 'Upload a JSON or CSV file.'}, status=400)
+        except IngestError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        
+        report = ingest_rows(
+            form_obj, rows,
+            dry_run=bool(request.GET.get('dry_run')),
+            user_agent=f'bulk-import:{request.user.username}',
+        )
+        return JsonResponse(report)
+
+
 # HTMX Views for Master Data Attachment
 class MasterDataAttachmentListView(LoginRequiredMixin, View):
     """HTMX view to list available master data sets for attachment"""
@@ -673,13 +798,16 @@ class MasterDataAttachmentListView(LoginRequiredMixin, View):
         form_obj = get_object_or_404(Form, pk=pk, owner=request.user)
         
         # Get master data sets that user owns or has access to
-        from master_data.models import MasterDataSet
+        from master_data.models import MasterDataColumn, MasterDataRecord, MasterDataSet
         available_datasets = MasterDataSet.objects.filter(
             models.Q(owner=request.user) | 
             models.Q(shared_with=request.user)
         ).exclude(
             id__in=form_obj.master_data_attachments.values_list('dataset_id', flat=True)
-        ).distinct()
+        ).distinct().select_related('owner').annotate(
+            record_count=count_related(MasterDataRecord, 'dataset'),
+            column_count=count_related(MasterDataColumn, 'dataset'),
+        )
         
         context = {
             'form': form_obj,
@@ -802,39 +930,22 @@ class MasterDataAttachmentConfigureView(LoginRequiredMixin, View):
         return render(request, 'forms/partials/master_data_attachments.html', context)
 
 
+def _question_siblings(question):
+    """Questions sharing the ordering scope of ``question`` (same section or ungrouped)"""
+    if question.section_id:
+        return FormQuestion.objects.filter(section_id=question.section_id)
+    return FormQuestion.objects.filter(form_id=question.form_id, section__isnull=True)
+
+
 @require_http_methods(["POST"])
 def reorder_question(request, pk):
     """Reorder a question up or down"""
     question = get_object_or_404(FormQuestion, pk=pk)
     direction = request.POST.get('direction')  # 'up' or 'down'
     
-    # Get all questions in the same context (same section or no section)
-    if question.section:
-        questions = list(question.section.questions.order_by('order', 'id'))
-    else:
-        questions = list(question.form.questions.filter(section__isnull=True).order_by('order', 'id'))
-    
-    # Find current index
-    try:
-        current_index = questions.index(question)
-    except ValueError:
-        return JsonResponse({'success': False, 'error': 'Question not found'})
-    
-    # Determine target index
-    if direction == 'up' and current_index > 0:
-        target_index = current_index - 1
-    elif direction == 'down' and current_index < len(questions) - 1:
-        target_index = current_index + 1
-    else:
+    if not move(question, direction, _question_siblings(question)):
         return JsonResponse({'success': False, 'error': 'Cannot move in that direction'})
     
-    # Swap orders
-    with transaction.atomic():
-        target_question = questions[target_index]
-        question.order, target_question.order = target_question.order, question.order
-        question.save(update_fields=['order'])
-        target_question.save(update_fields=['order'])
-    
     return JsonResponse({'success': True})
 
 
@@ -844,28 +955,78 @@ def reorder_section(request, pk):
     section = get_object_or_404(FormSection, pk=pk)
     direction = request.POST.get('direction')  # 'up' or 'down'
     
-    # Get all sections for this form
-    sections = list(section.form.sections.order_by('order', 'id'))
+    if not move(section, direction, FormSection.objects.filter(form_id=section.form_id)):
+        return JsonResponse({'success': False, 'error': 'Cannot move in that direction'})
+    
+    return JsonResponse({'success': True})
+
+
+class FormReorderView(LoginRequiredMixin, View):
+    """Apply a complete drag-and-drop ordering of a form's sections and questions.
     
-    # Find current index
-    try:
-        current_index = sections.index(section)
-    except ValueError:
-        return JsonResponse({'success': False, 'error': 'Section not found'})
+    Expects a JSON body of the form::
     
-    # Determine target index
-    if direction == 'up' and current_index > 0:
-        target_index = current_index - 1
-    elif direction == 'down' and current_index < len(sections) - 1:
-        target_index = current_index + 1
-    else:
-        return JsonResponse({'success': False, 'error': 'Cannot move in that direction'})
+        {"sections": [3, 1, 2],
+         "questions": [{"section": 3, "ids": [10, 12]}, {"section": null, "ids": [11]}]}
     
-    # Swap orders
-    with transaction.atomic():
-        target_section = sections[target_index]
-        section.order, target_section.order = target_section.order, section.order
-        section.save(update_fields=['order'])
-        target_section.save(update_fields=['order'])
+    ``sections`` must list every section of the form. Each ``questions`` entry
+    gives the new order of a section's questions (questions may move between
+    sections). Everything is applied in one transaction with bulk updates.
+    """
     
-    return JsonResponse({'success': True})
+    def post(self, request, pk):
+        form_obj = get_object_or_404(
+            Form.objects.filter(
+                models.Q(owner=request.user) | models.Q(editors=request.user)
+            ).distinct(),
+            pk=pk,
+        )
+        
+        try:
+            payload = json.loads(request.body)
+            section_ids = [int(i) for i in payload.get('sections', [])]
+            question_groups = [
+                (int(group['section']) if group.get('section') is not None else None,
+                 [int(i) for i in group['ids']])
+                for group in payload.get('questions', [])
+            ]
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return JsonResponse({'success': False, 'error': 'Invalid ordering payload'}, status=400)
+        
+        sections = {s.pk: s for s in form_obj.sections.all()}
+        if section_ids and sorted(section_ids) != sorted(sections):
+            return JsonResponse({'success': False, 'error': 'Ordering must list every section of the form'}, status=400)
+        
+        question_ids = [qid for _, ids in question_groups for qid in ids]
+        questions = {q.pk: q for q in form_obj.questions.filter(pk__in=question_ids)}
+        if len(questions) != len(question_ids) or any(
+            section_id is not None and section_id not in sections
+            for section_id, _ in question_groups
+        ):
+            return JsonResponse({'success': False, 'error': 'Unknown section or question'}, status=400)
+        
+        with transaction.atomic():
+            if section_ids:
+                apply_ordering([sections[i] for i in section_ids], form_obj.sections.all())
+            if questions:
+                _apply_grouped_question_order(question_groups, questions)
+            # bulk_update skips save(); touch the form so public pages change
+            Form.objects.filter(pk=form_obj.pk).update(updated_at=timezone.now())
+        
+        return JsonResponse({'success': True})
+
+
+def _apply_grouped_question_order(question_groups, questions):
+    """Assign per-group gap keys and section changes with one bulk_update.
+    
+    Keys restart for every group since questions are ordered within their
+    section; questions have no unique order constraint to work around.
+    """
+    ordered = []
+    for section_id, ids in question_groups:
+        for position, question_id in enumerate(ids):
+            question = questions[question_id]
+            question.section_id = section_id
+            question.order = order_key(position)
+            ordered.append(question)
+    FormQuestion.objects.bulk_update(ordered, ['order', 'section'])
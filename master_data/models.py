@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings as django_settings
+from django.utils import timezone
 
 class MasterDataSet(models.Model):
     """Master data set containing reusable demographic/reference data"""
@@ -22,6 +23,11 @@ class MasterDataSet(models.Model):
     
     def __str__(self):
         return self.name
+    
+    @classmethod
+    def touch(cls, pk):
+        """Bump ``updated_at``, the version public pages and caches key on"""
+        cls.objects.filter(pk=pk).update(updated_at=timezone.now())
 
 
 class MasterDataSetShare(models.Model):
@@ -56,6 +62,16 @@ class MasterDataColumn(models.Model):
         ordering = ['order', 'id']
         unique_together = ['dataset', 'name']
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        MasterDataSet.touch(self.dataset_id)
+    
+    def delete(self, *args, **kwargs):
+        dataset_id = self.dataset_id
+        result = super().delete(*args, **kwargs)
+        MasterDataSet.touch(dataset_id)
+        return result
+    
     def __str__(self):
         return f"{self.dataset.name} - {self.name}"
 
@@ -71,6 +87,16 @@ class MasterDataRecord(models.Model):
     class Meta:
         ordering = ['id']
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        MasterDataSet.touch(self.dataset_id)
+    
+    def delete(self, *args, **kwargs):
+        dataset_id = self.dataset_id
+        result = super().delete(*args, **kwargs)
+        MasterDataSet.touch(dataset_id)
+        return result
+    
     def __str__(self):
         # Try to show the first text field as identifier
         name_field = None
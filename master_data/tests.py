@@ -1,3 +1,91 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from accounts.models import User
+from survey_project.testing import QueryBudgetAssertions, QueryPlanAssertions
+from .models import MasterDataRecord, MasterDataSet
+
+
+class RecordQueryPlanTests(QueryPlanAssertions, TestCase):
+    """Records are always read per dataset and must not scan the whole table"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', password='x')
+        cls.datasets = [
+            MasterDataSet.objects.create(name=f'Set {n}', description='', owner=owner)
+            for n in range(3)
+        ]
+        cls.dataset = cls.datasets[0]
+        MasterDataRecord.objects.bulk_create([
+            MasterDataRecord(dataset=dataset, data={'Name': f'Person {n}'})
+            for dataset in cls.datasets
+            for n in range(300)
+        ])
+
+    def test_records_of_dataset_in_id_order(self):
+        self.assertNoFullScan(self.dataset.records.order_by('id')[:50])
+
+    def test_records_of_dataset_after_id(self):
+        self.assertNoFullScan(self.dataset.records.filter(id__gt=100).order_by('id')[:50])
+
+    def test_selected_records(self):
+        ids = list(self.dataset.records.values_list('id', flat=True)[:20])
+        self.assertNoFullScan(MasterDataRecord.objects.filter(pk__in=ids))
+
+
+class MasterDataViewQueryBudgetTests(QueryBudgetAssertions, TestCase):
+    """Every view in master_data/urls.py makes a bounded number of queries"""
+
+    def dataset(self, form):
+        return form.master_data_attachments.get().dataset
+
+    def test_list(self):
+        self.each_survey(lambda form: self.assertQueryBudget(3, 'get', reverse('master_data:list')))
+
+    def test_create(self):
+        def check(form):
+            self.assertQueryBudget(2, 'get', reverse('master_data:create'))
+            self.assertQueryBudget(3, 'post', reverse('master_data:create'), status=302,
+                                   data={'name': 'Places', 'description': 'Villages'})
+        self.each_survey(check)
+
+    def test_detail(self):
+        def check(form):
+            url = reverse('master_data:detail', args=[self.dataset(form).pk])
+            self.assertQueryBudget(6, 'get', url)
+            self.assertQueryBudget(6, 'get', url, data={'page': 2})
+        self.each_survey(check)
+
+    def test_edit(self):
+        def check(form):
+            url = reverse('master_data:edit', args=[self.dataset(form).pk])
+            self.assertQueryBudget(4, 'get', url)
+            self.assertQueryBudget(4, 'post', url, status=302, data={'name': 'Renamed', 'description': 'People'})
+        self.each_survey(check)
+
+    def test_import(self):
+        def check(form):
+            dataset = self.dataset(form)
+            existing = dataset.records.count()
+            # One row per existing record: the file grows with the survey
+            lines = ['Name,Region'] + [f'Imported {record.pk},R1' for record in dataset.records.all()]
+            upload = SimpleUploadedFile('people.csv', '\n'.join(lines).encode(), content_type='text/csv')
+            self.assertQueryBudget(4, 'get', reverse('master_data:import', args=[dataset.pk]))
+            self.assertQueryBudget(9, 'post', reverse('master_data:import', args=[dataset.pk]),
+                                   data={'file': upload, 'has_header': 'on'})
+            self.assertQueryBudget(8, 'post', reverse('master_data:import_confirm', args=[dataset.pk]),
+                                   status=302, data={'mapping_Name': 'Name', 'mapping_Region': 'Region'})
+            self.assertEqual(dataset.records.count(), 2 * existing)
+        self.each_survey(check)
+
+    def test_export(self):
+        self.each_survey(lambda form: self.assertQueryBudget(
+            5, 'get', reverse('master_data:export', args=[self.dataset(form).pk]),
+        ))
+
+    def test_share(self):
+        self.each_survey(lambda form: self.assertQueryBudget(
+            4, 'get', reverse('master_data:share', args=[self.dataset(form).pk]),
+        ))
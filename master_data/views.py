@@ -7,6 +7,7 @@ from django.urls import reverse_lazy
 from django.http import HttpResponse
 import csv
 from io import TextIOWrapper
+from survey_project.queries import count_related
 from .models import MasterDataSet, MasterDataColumn, MasterDataRecord
 
 class MasterDataListView(LoginRequiredMixin, ListView):
@@ -15,7 +16,10 @@ class MasterDataListView(LoginRequiredMixin, ListView):
     context_object_name = 'datasets'
     
     def get_queryset(self):
-        return MasterDataSet.objects.filter(owner=self.request.user)
+        return MasterDataSet.objects.filter(owner=self.request.user).annotate(
+            column_count=count_related(MasterDataColumn, 'dataset'),
+            record_count=count_related(MasterDataRecord, 'dataset'),
+        )
 
 class MasterDataCreateView(LoginRequiredMixin, CreateView):
     model = MasterDataSet
@@ -53,6 +57,8 @@ class MasterDataDetailView(LoginRequiredMixin, DetailView):
             records_page = paginator.page(paginator.num_pages)
 
         context['records_page'] = records_page
+        # Evaluated once; the records table loops over the columns per record
+        context['columns'] = list(dataset.columns.all())
         return context
 
 class MasterDataEditView(LoginRequiredMixin, UpdateView):
@@ -187,7 +193,7 @@ def import_confirm(request, pk):
                     mappings[file_col] = value
         
         # Import records
-        imported_count = 0
+        new_records = []
         for row_data in import_data['data']:
             # Map data according to column mappings
             mapped_data = {}
@@ -196,11 +202,12 @@ def import_confirm(request, pk):
                     mapped_data[db_col] = row_data[file_col]
             
             if mapped_data:  # Only create if we have data
-                MasterDataRecord.objects.create(
-                    dataset=dataset,
-                    data=mapped_data
-                )
-                imported_count += 1
+                new_records.append(MasterDataRecord(dataset=dataset, data=mapped_data))
+        
+        # One insert per batch; bulk_create skips save(), so touch the dataset once
+        MasterDataRecord.objects.bulk_create(new_records, batch_size=500)
+        MasterDataSet.touch(dataset.pk)
+        imported_count = len(new_records)
         
         # Clear session
         del request.session['import_preview']
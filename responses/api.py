@@ -0,0 +1,221 @@
+"""
+Read-only JSON API for a form's responses (served by ``views.responses_api``).
+
+    GET /api/forms/<form id>/responses/?fields=id,submitted_at,q12&limit=500
+    Authorization: Bearer <key>
+
+Keys are created with ``manage.py create_api_token`` and act as their user,
+who must own or edit the form.
+
+``fields`` (comma separated, default ``id,submitted_at,respondent,answers``):
+``id``, ``submitted_at``, ``is_complete``, ``record_id``, ``respondent``,
+``is_new_identity``, ``identity`` (the visible identity columns of the
+selected record or of the new identity data), ``answers`` (every answer as
+``{question_id: value}``) and ``q<question id>`` for single answers.
+
+Filters: ``submitted_after`` / ``submitted_before`` (ISO date or datetime),
+``record=<id>`` and ``identity.<column>=<value>``, which matches the
+column in either the selected record or the new identity data. Only
+columns visible on the form's dataset attachments can be filtered on.
+
+Results are ordered by id. A page holds ``limit`` responses (at most
+``API_MAX_LIMIT``); pass the returned ``next_cursor`` as ``cursor`` for the
+next one. Pages are serialized in chunks and streamed, with one query per
+chunk: answers are read from each response's ``answer_data`` document (the
+answer rows are queried only for responses not yet backfilled).
+"""
+
+import json
+from datetime import datetime
+
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q, TextField
+from django.db.models.functions import Cast
+from django.db.models.fields.json import KeyTextTransform
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Response, ResponseAnswer
+
+API_DEFAULT_LIMIT = 100
+API_MAX_LIMIT = 1000
+API_CHUNK_SIZE = 200
+DEFAULT_FIELDS = ('id', 'submitted_at', 'respondent', 'answers')
+RESPONSE_FIELDS = (
+    'id', 'submitted_at', 'is_complete', 'record_id', 'respondent',
+    'is_new_identity', 'identity', 'answers',
+)
+CURSOR_SALT = 'responses.api.cursor'
+
+
+class ApiError(ValueError):
+    """A bad request parameter; the message is returned to the client"""
+
+
+class ResponseQuery:
+    """A parsed API request for one form's responses"""
+
+    def __init__(self, form, params):
+        self.form = form
+        self.attachments = {
+            attachment.dataset_id: attachment
+            for attachment in form.master_data_attachments.select_related('dataset')
+            .prefetch_related('dataset__columns')
+        }
+        self.visible_columns = {
+            dataset_id: [column.name for column in attachment.get_visible_columns()]
+            for dataset_id, attachment in self.attachments.items()
+        }
+        self.fields, self.question_ids = self._parse_fields(params.get('fields'))
+        self.limit = self._parse_limit(params.get('limit'))
+        self.after = self._parse_cursor(params.get('cursor'))
+        self.queryset = self._filter(form.responses.all(), params)
+
+    def _parse_fields(self, value):
+        names = [name.strip() for name in (value or ','.join(DEFAULT_FIELDS)).split(',') if name.strip()]
+        fields, question_ids = [], []
+        for name in names:
+            if name in RESPONSE_FIELDS:
+                fields.append(name)
+            elif name.startswith('q') and name[1:].isdigit():
+                question_ids.append(int(name[1:]))
+            else:
+                raise ApiError(f"Unknown field '{name}'.")
+        return fields, question_ids
+
+    def _parse_limit(self, value):
+        if value is None:
+            return API_DEFAULT_LIMIT
+        try:
+            limit = int(value)
+        except ValueError:
+            raise ApiError("'limit' must be a number.")
+        return max(1, min(limit, API_MAX_LIMIT))
+
+    def _parse_cursor(self, value):
+        if not value:
+            return 0
+        try:
+            cursor = signing.loads(value, salt=CURSOR_SALT)
+        except signing.BadSignature:
+            raise ApiError("Invalid 'cursor'.")
+        if cursor.get('form') != self.form.pk:
+            raise ApiError("Invalid 'cursor'.")
+        return cursor['after']
+
+    def _filter(self, queryset, params):
+        for name, bound in (('submitted_after', 'gte'), ('submitted_before', 'lt')):
+            if params.get(name):
+                queryset = queryset.filter(**{f'submitted_at__{bound}': _parse_moment(name, params[name])})
+        if params.get('record'):
+            if not params['record'].isdigit():
+                raise ApiError("'record' must be a record id.")
+            queryset = queryset.filter(record_id=int(params['record']))
+
+        allowed = {column for columns in self.visible_columns.values() for column in columns}
+        for position, (name, value) in enumerate(sorted(params.items())):
+            if not name.startswith('identity.'):
+                continue
+            column = name[len('identity.'):]
+            if column not in allowed:
+                raise ApiError(f"Cannot filter on identity column '{column}'.")
+            record_key, new_key = f'_identity_record_{position}', f'_identity_new_{position}'
+            queryset = queryset.annotate(**{
+                # Compared as text: identity values may be stored as numbers
+                record_key: Cast(KeyTextTransform(column, 'record__data'), TextField()),
+                new_key: Cast(KeyTextTransform(column, 'new_identity_data'), TextField()),
+            }).filter(Q(**{record_key: value}) | Q(**{new_key: value}))
+        return queryset
+
+    def page_ids(self):
+        """Ids of this page and whether another page follows"""
+        ids = list(
+            self.queryset.filter(pk__gt=self.after).order_by('pk').values_list('pk', flat=True)[:self.limit + 1]
+        )
+        return ids[:self.limit], len(ids) > self.limit
+
+    def next_cursor(self, last_id):
+        return signing.dumps({'form': self.form.pk, 'after': last_id}, salt=CURSOR_SALT)
+
+    def rows(self, ids):
+        """Serialized responses for ``ids``, loaded a chunk at a time"""
+        needs_record = {'respondent', 'identity'} & set(self.fields)
+        for start in range(0, len(ids), API_CHUNK_SIZE):
+            chunk = ids[start:start + API_CHUNK_SIZE]
+            responses = Response.objects.filter(pk__in=chunk).order_by('pk')
+            if needs_record:
+                responses = responses.select_related('record', 'user')
+            if not self.wants_answers:
+                responses = responses.defer('answer_data')
+            responses = list(responses)
+            # Responses not yet backfilled fall back to their answer rows
+            answers = self._answers([r.pk for r in responses if self.wants_answers and r.answer_data is None])
+            for response in responses:
+                if not self.wants_answers:
+                    yield self.serialize(response, {})
+                elif response.answer_data is not None:
+                    yield self.serialize(response, response.get_answers_map())
+                else:
+                    yield self.serialize(response, answers.get(response.pk, {}))
+
+    @property
+    def wants_answers(self):
+        return 'answers' in self.fields or bool(self.question_ids)
+
+    def _answers(self, response_ids):
+        if not response_ids:
+            return {}
+        rows = ResponseAnswer.objects.filter(response_id__in=response_ids)
+        if 'answers' not in self.fields:
+            rows = rows.filter(question_id__in=self.question_ids)
+        answers = {}
+        for response_id, question_id, value in rows.values_list('response_id', 'question_id', 'value'):
+            answers.setdefault(response_id, {})[question_id] = value
+        return answers
+
+    def serialize(self, response, answers):
+        row = {}
+        for name in self.fields:
+            if name == 'respondent':
+                row[name] = str(response.get_respondent_display(self.attachments))
+            elif name == 'identity':
+                row[name] = self._identity(response)
+            elif name == 'answers':
+                row[name] = {str(question_id): value for question_id, value in answers.items()}
+            else:
+                row[name] = getattr(response, name)
+        for question_id in self.question_ids:
+            row[f'q{question_id}'] = answers.get(question_id)
+        return row
+
+    def _identity(self, response):
+        if response.record_id:
+            dataset_id, data = response.record.dataset_id, response.record.data
+        elif response.is_new_identity and response.new_identity_data:
+            dataset_id, data = response.new_identity_dataset_id, response.new_identity_data
+        else:
+            return None
+        return {column: data.get(column) for column in self.visible_columns.get(dataset_id, [])}
+
+
+def _parse_moment(name, value):
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ApiError(f"'{name}' must be an ISO date or datetime.")
+        moment = datetime(day.year, day.month, day.day)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def stream_page(query):
+    """Yield the JSON document for one page of ``query``"""
+    ids, has_more = query.page_ids()
+    yield '{"results":['
+    for position, row in enumerate(query.rows(ids)):
+        yield (',' if position else '') + json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False)
+    next_cursor = query.next_cursor(ids[-1]) if has_more else None
+    yield '],"count":%d,"next_cursor":%s}' % (len(ids), json.dumps(next_cursor))
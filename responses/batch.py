@@ -0,0 +1,198 @@
+"""
+Batched submission of responses queued offline.
+
+In offline mode the public survey page's service worker keeps POSTs that
+failed for lack of signal in IndexedDB, each with a client-generated UUID,
+and later sends everything queued for a form in one request::
+
+    {"responses": [{"client_id": "<uuid>", "fields": {"question_12": ["Yes"],
+                                                      "dataset_3": ["17"]}}]}
+
+``fields`` holds the form fields exactly as the page would have posted them.
+Every response is validated by the form's cached ``SubmissionValidator``,
+and the accepted ones are inserted with one ``bulk_create`` for responses
+(carrying their ``answer_data`` document) and one for answers.
+``Response.client_id`` is unique, so a retried batch (the connection dropped
+before the reply arrived) reports those responses as duplicates instead of
+storing them twice.
+"""
+
+import uuid
+
+from django.db import IntegrityError, transaction
+from django.utils.datastructures import MultiValueDict
+
+from master_data.models import MasterDataRecord
+
+from .models import Response, ResponseAnswer
+from .validation import get_submission_validator
+
+
+def identity_selection(data):
+    """Read the identity fields of a submission.
+
+    Returns ``(record_refs, new_identity)``: ``record_refs`` lists the
+    ``(dataset_id, record_id)`` pairs selected from master data, in field
+    order; ``new_identity`` is ``(dataset_id, values)`` for the first
+    dataset where the respondent chose "Other" and entered data, or None.
+    """
+    record_refs = []
+    for key in data.keys():
+        if not key.startswith('dataset_'):
+            continue
+        try:
+            dataset_id = int(key.replace('dataset_', ''))
+        except ValueError:
+            continue
+        record_value = data.get(key)
+        if record_value and record_value != 'new':
+            try:
+                record_refs.append((dataset_id, int(record_value)))
+            except ValueError:
+                continue
+        elif record_value == 'new':
+            prefix = f'new_{dataset_id}_'
+            values = {
+                post_key.replace(prefix, ''): data.get(post_key)
+                for post_key in data.keys()
+                if post_key.startswith(prefix) and data.get(post_key)
+            }
+            if values:
+                # Use the first valid new identity
+                return record_refs, (dataset_id, values)
+    return record_refs, None
+
+
+def resolve_record(record_refs, records):
+    """The last selected record that exists in its dataset (like the form view)"""
+    selected = None
+    for dataset_id, record_id in record_refs:
+        record = records.get(record_id)
+        if record is not None and record.dataset_id == dataset_id:
+            selected = record
+    return selected
+
+
+def build_response(form, data, records, **fields):
+    """Unsaved ``Response`` for a validated submission"""
+    record_refs, new_identity = identity_selection(data)
+    return Response(
+        form=form,
+        record=resolve_record(record_refs, records),
+        is_new_identity=new_identity is not None,
+        new_identity_data=new_identity[1] if new_identity else None,
+        new_identity_dataset_id=new_identity[0] if new_identity else None,
+        is_complete=True,
+        **fields,
+    )
+
+
+def _parse_items(items):
+    """``[(client_id, MultiValueDict)]`` plus errors for malformed items.
+
+    Errors are keyed by the client id as sent, so the service worker can
+    match them to its queue; only an item without one is keyed by position.
+    """
+    parsed, rejected = [], {}
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            rejected[str(position)] = {'item': 'Expected an object.'}
+            continue
+        try:
+            client_id = uuid.UUID(str(item.get('client_id')))
+        except ValueError:
+            key = str(item['client_id']) if 'client_id' in item else str(position)
+            rejected[key] = {'client_id': 'Expected a UUID.'}
+            continue
+        fields = item.get('fields')
+        if not isinstance(fields, dict):
+            rejected[str(client_id)] = {'fields': 'Expected an object.'}
+            continue
+        parsed.append((client_id, MultiValueDict({
+            str(key): [str(v) for v in (value if isinstance(value, list) else [value])]
+            for key, value in fields.items()
+        })))
+    return parsed, rejected
+
+
+def submit_batch(form, items, session_key='', ip_address=None, user_agent=''):
+    """Validate and store queued responses for ``form``.
+
+    Returns ``{'accepted': [...], 'duplicates': [...], 'rejected': {id: errors}}``
+    keyed by client id. Rejected responses failed validation and will not
+    succeed on retry either.
+    """
+    parsed, rejected = _parse_items(items)
+    validator = get_submission_validator(form)
+
+    # Collapse repeats within the batch itself
+    unique = {}
+    for client_id, data in parsed:
+        unique.setdefault(client_id, data)
+
+    valid = {}
+    for client_id, data in unique.items():
+        answers, errors = validator.validate(data, check_captcha=False)
+        if errors:
+            rejected[str(client_id)] = {str(key): message for key, message in errors.items()}
+        else:
+            valid[client_id] = (data, answers)
+
+    record_ids = {
+        record_id
+        for data, _ in valid.values()
+        for _, record_id in identity_selection(data)[0]
+    }
+    records = MasterDataRecord.objects.in_bulk(record_ids) if record_ids else {}
+
+    accepted, duplicates = insert_responses(
+        form, valid, records,
+        session_key=session_key,
+        ip_address=ip_address,
+        user_agent=user_agent,
+    )
+    return {
+        'accepted': [str(client_id) for client_id in accepted],
+        'duplicates': [str(client_id) for client_id in duplicates],
+        'rejected': rejected,
+    }
+
+
+def insert_responses(form, valid, records, **fields):
+    """Bulk insert validated responses, skipping client ids already stored.
+
+    ``valid`` maps client id -> ``(data, answers)`` and ``records`` maps
+    record id -> ``MasterDataRecord`` for the selected identities. Returns
+    ``(inserted_ids, duplicate_ids)``.
+    """
+    for attempt in range(2):
+        existing = set(
+            Response.objects.filter(client_id__in=valid).values_list('client_id', flat=True)
+        )
+        pending = {client_id: value for client_id, value in valid.items() if client_id not in existing}
+        try:
+            with transaction.atomic():
+                Response.objects.bulk_create([
+                    build_response(
+                        form, data, records,
+                        client_id=client_id,
+                        answer_data=Response.answer_document(answers),
+                        **fields,
+                    )
+                    for client_id, (data, answers) in pending.items()
+                ])
+                # bulk_create does not return ids on every backend (MySQL)
+                response_ids = dict(
+                    Response.objects.filter(client_id__in=pending).values_list('client_id', 'id')
+                )
+                ResponseAnswer.objects.bulk_create([
+                    ResponseAnswer(response_id=response_ids[client_id], question_id=question_id, value=value)
+                    for client_id, (_, answers) in pending.items()
+                    for question_id, value in answers.items()
+                ])
+        except IntegrityError:
+            # A concurrent retry stored some of these first; recheck once
+            if attempt:
+                raise
+            continue
+        return list(pending), list(existing)
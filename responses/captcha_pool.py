@@ -0,0 +1,136 @@
+"""
+Pre-generated captcha pool.
+
+Rendering the public survey normally inserts a ``CaptchaStore`` row and each
+image request draws the challenge with noise arcs and dots. The
+``fill_captcha_pool`` command moves that work off the hot path: it inserts
+challenges in bulk, renders their PNGs into the shared cache and queues
+their keys. A page render pops one key (a cache ``incr`` plus a ``get``)
+and the image view serves the pre-rendered bytes. When the pool is empty
+the widget falls back to generating a challenge as before.
+
+Queue slots are numbered: the command writes slots after ``head`` and
+renders advance ``cursor`` atomically, so each challenge is handed out once.
+Queued keys expire (see ``fill_pool``), oldest first, so after a quiet
+period the slots after ``cursor`` start with expired ones. The command only
+counts live slots and moves ``cursor`` past the expired ones, so renders
+do not fall back to generating challenges while the pool refills.
+"""
+
+import datetime
+import secrets
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+HEAD_KEY = 'captcha_pool:head'
+CURSOR_KEY = 'captcha_pool:cursor'
+
+
+def pool_size():
+    return getattr(settings, 'CAPTCHA_POOL_SIZE', 0)
+
+
+def pool_lifetime():
+    """Minutes a pooled challenge stays valid after it is generated"""
+    return getattr(settings, 'CAPTCHA_POOL_TIMEOUT', 60)
+
+
+def _item_key(index):
+    return f'captcha_pool:item:{index}'
+
+
+def image_key(hashkey):
+    return f'captcha_pool:image:{hashkey}'
+
+
+def pop_captcha():
+    """Hashkey of a pre-generated challenge, or None when the pool is empty"""
+    if pool_size() <= 0:
+        return None
+    cache.add(CURSOR_KEY, 0, None)
+    try:
+        index = cache.incr(CURSOR_KEY)
+    except ValueError:
+        return None
+    return cache.get(_item_key(index))
+
+
+def _queue():
+    """``(cursor, head, live)``: ``live`` are the queued slots not yet expired"""
+    head = cache.get(HEAD_KEY, 0)
+    cursor = cache.get(CURSOR_KEY, 0)
+    slots = range(cursor + 1, head + 1)
+    found = cache.get_many([_item_key(index) for index in slots])
+    return cursor, head, [index for index in slots if _item_key(index) in found]
+
+
+def available():
+    """Number of queued challenges not yet handed out or expired"""
+    return len(_queue()[2])
+
+
+def _skip_expired(cursor, head, live):
+    """Move ``cursor`` past the expired slots in front of the live ones.
+
+    ``incr`` only moves it forward, so a render popping at the same time can
+    at worst make this skip a live slot, never hand one out twice.
+    """
+    skip = (live[0] if live else head + 1) - cursor - 1
+    if skip <= 0:
+        return cursor
+    cache.add(CURSOR_KEY, 0, None)
+    try:
+        return cache.incr(CURSOR_KEY, skip)
+    except ValueError:
+        return cursor
+
+
+def fill_pool(size=None):
+    """Top the pool up to ``size`` challenges; return how many were added"""
+    from captcha.conf import settings as captcha_settings
+    from captcha.models import CaptchaStore
+    from captcha.views import captcha_image
+
+    size = pool_size() if size is None else size
+    cursor, head, live = _queue()
+    cursor = _skip_expired(cursor, head, live)
+    needed = size - len(live)
+    if needed <= 0:
+        return 0
+
+    lifetime = pool_lifetime()
+    expiration = timezone.now() + datetime.timedelta(minutes=lifetime)
+    stores = []
+    for _ in range(needed):
+        challenge, response = captcha_settings.get_challenge()()
+        stores.append(CaptchaStore(
+            challenge=challenge,
+            response=response.lower(),
+            hashkey=secrets.token_hex(20),
+            expiration=expiration,
+        ))
+    CaptchaStore.objects.bulk_create(stores)
+
+    # Queued keys expire early enough that a popped challenge is still
+    # valid for a full CAPTCHA_TIMEOUT; images live as long as the row
+    queue_timeout = max(60, (lifetime - int(captcha_settings.CAPTCHA_TIMEOUT)) * 60)
+    start = max(head, cursor)
+    items = {}
+    images = {}
+    for offset, store in enumerate(stores, 1):
+        images[image_key(store.hashkey)] = captcha_image(None, store.hashkey).content
+        items[_item_key(start + offset)] = store.hashkey
+    cache.set_many(images, lifetime * 60)
+    cache.set_many(items, queue_timeout)
+    cache.set(HEAD_KEY, start + needed, None)
+    return needed
+
+
+def prune_expired():
+    """Delete every expired challenge with one DELETE; return the count"""
+    from captcha.models import CaptchaStore
+
+    deleted, _ = CaptchaStore.objects.filter(expiration__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,114 @@
+"""
+Conditional GET for the public survey and thank-you pages.
+
+Respondents reload, share and reopen survey links constantly. These pages
+get an ``ETag`` built from cheap version inputs, and a request carrying a
+matching ``If-None-Match`` gets a ``304 Not Modified`` before any context
+is built.
+
+There is no ``Last-Modified``: the tag also covers inputs a date cannot
+express (the template version, the CSRF cookie, the user), so a client
+revalidating with ``If-Modified-Since`` alone always gets the full page.
+
+The version inputs are:
+
+* ``Form.updated_at``, which saving or deleting a section, question or
+  dataset attachment and reordering sections or questions touch,
+* ``MasterDataSet.updated_at`` of the attached datasets, which saving or
+  deleting a record or column touches,
+* the modification times of the page templates, so a deploy changes the tag,
+* the per-request parts of the page: the CSRF cookie the embedded tokens are
+  valid for, the logged-in user shown in the navbar, and extra parts given
+  by the view (such as whether the respondent has entered the password).
+
+Pages that embed one-time content are never answered with a 304: a pending
+flash message, a missing CSRF cookie (the page sets a new one) or, for the
+survey page, a captcha challenge.
+"""
+
+import functools
+import hashlib
+import os
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.db.models import Max
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import salted_hmac
+
+# Templates whose markup ends up in the public pages
+PAGE_TEMPLATES = (
+    'base.html',
+    'partials/navbar.html',
+    'partials/footer.html',
+    'partials/messages.html',
+    'responses/public_survey.html',
+    'responses/question_input.html',
+    'responses/thank_you.html',
+)
+
+
+@functools.lru_cache(maxsize=1)
+def template_version():
+    """Latest modification time of the page templates (read once per process)"""
+    mtimes = [0]
+    for name in PAGE_TEMPLATES:
+        try:
+            origin = get_template(name).origin.name
+            mtimes.append(int(os.path.getmtime(origin)))
+        except (TemplateDoesNotExist, OSError, AttributeError):
+            continue
+    return max(mtimes)
+
+
+def dataset_version(form):
+    """Latest ``updated_at`` of the datasets attached to ``form`` (or None)"""
+    return form.master_data_attachments.aggregate(version=Max('dataset__updated_at'))['version']
+
+
+def page_etag(request, form, *parts):
+    """The ``ETag`` of a public page of ``form``, or None.
+
+    Returns None when the page holds one-time content and must be rendered.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    csrf_cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME)
+    if not csrf_cookie or len(get_messages(request)):
+        return None
+
+    datasets_modified = dataset_version(form)
+    user = request.user
+    key = '|'.join(str(part) for part in (
+        form.pk,
+        form.updated_at.timestamp(),
+        datasets_modified.timestamp() if datasets_modified else '',
+        template_version(),
+        salted_hmac('responses.conditional', csrf_cookie).hexdigest(),
+        f'{user.pk}:{user.get_username()}' if user.is_authenticated else '',
+        *parts,
+    ))
+    return '"%s"' % hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+
+
+def not_modified(request, etag):
+    """A 304 response if the client's copy is current, else None"""
+    if etag is None:
+        return None
+    # No last_modified: If-Modified-Since alone never yields a 304
+    return get_conditional_response(request, etag=etag)
+
+
+def set_etag(response, etag):
+    """Add the ``ETag`` to a rendered page.
+
+    ``no-cache`` makes browsers revalidate on every visit, and ``private``
+    keeps shared caches away from pages holding CSRF tokens.
+    """
+    if etag is None or response.status_code != 200:
+        return response
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
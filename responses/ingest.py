@@ -0,0 +1,184 @@
+"""
+Bulk ingestion of responses keyed in from paper forms.
+
+Enumerators upload a JSON or CSV file holding many responses to one form,
+either through the form's "import responses" endpoint or with
+``manage.py import_responses``. Scripts call the endpoint with an API token
+of the form's owner or an editor::
+
+    curl -H "Authorization: Bearer <key>" -F file=@responses.csv \\
+        https://example.org/forms/<form id>/responses/import/
+
+A row uses the public form's field names:
+
+* ``question_<id>`` (or just the question id, or the exact question text)
+  for answers; multi-select values are lists in JSON and ``;``-separated
+  in CSV,
+* ``dataset_<id>`` with a master data record id, or ``new`` together with
+  ``new_<dataset id>_<column>`` fields, for the respondent's identity,
+* an optional ``client_id`` (UUID). Rows with a client id that is already
+  stored are reported as duplicates, which makes re-running a file safe.
+
+All rows are validated in memory against the form's cached
+``SubmissionValidator`` and its dataset attachments, with one query for
+every record referenced in the file. Valid rows are then inserted in batches
+of ``batch_size``, one ``bulk_create`` for responses and one for answers per
+batch. The report lists every rejected row with its errors.
+"""
+
+import csv
+import io
+import json
+import uuid
+
+from django.utils.datastructures import MultiValueDict
+
+from master_data.models import MasterDataRecord
+
+from .batch import identity_selection, insert_responses
+from .validation import get_submission_validator
+
+DEFAULT_BATCH_SIZE = 500
+MULTI_VALUE_SEPARATOR = ';'
+
+
+class IngestError(ValueError):
+    """The uploaded file cannot be read at all"""
+
+
+def read_rows(fileobj, fmt):
+    """Rows of ``{column: value}`` from a JSON or CSV file object (bytes)"""
+    if fmt == 'json':
+        try:
+            payload = json.load(io.TextIOWrapper(fileobj, encoding='utf-8-sig'))
+        except (ValueError, UnicodeDecodeError) as e:
+            raise IngestError(f'Invalid JSON: {e}')
+        if isinstance(payload, dict):
+            payload = payload.get('responses')
+        if not isinstance(payload, list):
+            raise IngestError('Expected a list of responses or {"responses": [...]}.')
+        return payload
+    if fmt == 'csv':
+        try:
+            return list(csv.DictReader(io.TextIOWrapper(fileobj, encoding='utf-8-sig')))
+        except (csv.Error, UnicodeDecodeError) as e:
+            raise IngestError(f'Invalid CSV: {e}')
+    raise IngestError('Unsupported format; use JSON or CSV.')
+
+
+def detect_format(filename):
+    """``'json'`` or ``'csv'`` from a file name, or None"""
+    extension = filename.lower().rsplit('.', 1)[-1]
+    return extension if extension in ('json', 'csv') else None
+
+
+class RowMapper:
+    """Turns file rows into the field dicts the public form would post"""
+
+    def __init__(self, questions):
+        self.by_id = {str(question.pk): question for question in questions}
+        self.by_text = {question.text.strip().lower(): question for question in questions}
+
+    def field_name(self, column):
+        column = str(column).strip()
+        if column.startswith(('question_', 'dataset_', 'new_')) or column == 'client_id':
+            return column
+        question = self.by_id.get(column) or self.by_text.get(column.lower())
+        return f'question_{question.pk}' if question else None
+
+    def map(self, row):
+        """``(fields, unknown_columns)`` for one row"""
+        fields, unknown = {}, []
+        for column, value in row.items():
+            name = self.field_name(column)
+            if name is None:
+                if value not in (None, ''):
+                    unknown.append(str(column))
+                continue
+            values = value if isinstance(value, list) else [value]
+            values = ['' if v is None else str(v) for v in values]
+            question = self.by_id.get(name[len('question_'):]) if name.startswith('question_') else None
+            if question and question.question_type == 'multi_select' and not isinstance(value, list):
+                values = [v.strip() for v in values[0].split(MULTI_VALUE_SEPARATOR)]
+            fields[name] = values
+        return fields, unknown
+
+
+def ingest_rows(form, rows, batch_size=DEFAULT_BATCH_SIZE, dry_run=False, user_agent='bulk-import'):
+    """Validate ``rows`` for ``form`` and insert the valid ones.
+
+    Returns ``{'total', 'valid', 'imported', 'duplicates', 'errors'}`` where
+    ``errors`` is a list of ``{'row': <1-based number>, 'errors': {...}}``.
+    With ``dry_run`` rows are only validated.
+    """
+    questions = list(form.questions.only('id', 'form_id', 'text', 'question_type'))
+    mapper = RowMapper(questions)
+    validator = get_submission_validator(form)
+    attached = set(form.master_data_attachments.values_list('dataset_id', flat=True))
+
+    errors = []
+    checked = []  # (row number, client id, data, answers, record refs)
+    seen = set()
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append({'row': number, 'errors': {'row': 'Expected an object.'}})
+            continue
+        fields, unknown = mapper.map(row)
+        row_errors = {column: 'Unknown column.' for column in unknown}
+
+        client_id = (fields.pop('client_id', None) or [''])[0]
+        try:
+            client_id = uuid.UUID(client_id) if client_id else uuid.uuid4()
+        except ValueError:
+            row_errors['client_id'] = 'Expected a UUID.'
+        if client_id in seen:
+            row_errors['client_id'] = 'Repeated in this file.'
+        seen.add(client_id)
+
+        data = MultiValueDict(fields)
+        answers, answer_errors = validator.validate(data, check_captcha=False)
+        row_errors.update({f'question_{key}': message for key, message in answer_errors.items()})
+
+        record_refs, new_identity = identity_selection(data)
+        for dataset_id in [ref[0] for ref in record_refs] + ([new_identity[0]] if new_identity else []):
+            if dataset_id not in attached:
+                row_errors[f'dataset_{dataset_id}'] = 'This dataset is not attached to the form.'
+
+        if row_errors:
+            errors.append({'row': number, 'errors': row_errors})
+        else:
+            checked.append((number, client_id, data, answers, record_refs))
+
+    # One query for every record referenced in the file
+    record_ids = {record_id for *_, refs in checked for _, record_id in refs}
+    records = MasterDataRecord.objects.in_bulk(record_ids) if record_ids else {}
+
+    valid = {}
+    for number, client_id, data, answers, record_refs in checked:
+        missing = [
+            f'dataset_{dataset_id}' for dataset_id, record_id in record_refs
+            if record_id not in records or records[record_id].dataset_id != dataset_id
+        ]
+        if missing:
+            errors.append({'row': number, 'errors': {name: 'No such record in this dataset.' for name in missing}})
+        else:
+            valid[client_id] = (data, answers)
+
+    imported = duplicates = 0
+    if not dry_run:
+        pending = list(valid.items())
+        for start in range(0, len(pending), batch_size):
+            inserted, existing = insert_responses(
+                form, dict(pending[start:start + batch_size]), records, user_agent=user_agent,
+            )
+            imported += len(inserted)
+            duplicates += len(existing)
+
+    errors.sort(key=lambda error: error['row'])
+    return {
+        'total': len(rows),
+        'valid': len(valid),
+        'imported': imported,
+        'duplicates': duplicates,
+        'errors': errors,
+    }
@@ -0,0 +1,348 @@
+"""
+Load-test harness for the public survey pages.
+
+Simulates respondents arriving after a QR code goes up: each virtual client
+keeps its own cookies and repeats the public flow against a running server:
+
+* ``survey``: GET the survey page the QR code points at,
+* ``snapshot``: GET each attachment's identity snapshot and drill down its
+  filter columns (Wilayah, then Lingkungan, ...) to one record, as the
+  page's cascading selects do in the browser,
+* ``captcha``: GET the captcha image (forms that require a captcha),
+* ``submit``: POST the answers with the CSRF token and captcha,
+* ``thank_you``: follow the redirect.
+
+The harness reads each form's questions and attachments from the database,
+and the answer to a captcha from ``CaptchaStore``. It must therefore use
+the same database as the server, so it only suits a local server. Every
+request is timed per endpoint. ``QueryCountingApplication`` wraps the WSGI
+application of an in-process server to report each request's query count
+in the ``X-Query-Count`` header. An external server does not send that
+header, so its query counts are left out of the report.
+
+``503`` (submission admission control, see throttling.py) and ``403``/``429``
+(per-IP rate limits) are counted as *limited* rather than as errors. On one
+machine every client shares an IP address, like a parish on one Wi-Fi
+network.
+"""
+
+import gzip
+import json
+import math
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urljoin
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+
+from django.core.servers.basehttp import WSGIRequestHandler, WSGIServer
+from django.db import connection, connections
+from django.urls import reverse
+
+QUERY_COUNT_HEADER = 'X-Query-Count'
+LIMITED_STATUSES = (403, 429, 503)
+ENDPOINTS = ('survey', 'snapshot', 'captcha', 'submit', 'thank_you')
+
+_INPUT = re.compile(r'<input\b[^>]*>', re.IGNORECASE)
+_ATTRIBUTE = re.compile(r'([\w-]+)="([^"]*)"')
+_SNAPSHOT_URL = re.compile(r'snapshotUrl:\s*"([^"]+)"')
+_SNAPSHOT_ATTACHMENT = re.compile(r'/identities/(\d+)/')
+_JS_ESCAPE = re.compile(r'\\u([0-9A-Fa-f]{4})')
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted ``values`` (``fraction`` in 0..1)"""
+    if not values:
+        return None
+    rank = math.ceil(round(fraction * len(values), 6))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+class Stats:
+    """Per-endpoint samples shared by all client threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.flows = 0
+        self.started = self.finished = None
+
+    def add(self, endpoint, seconds, status, queries=None):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append((seconds, status, queries))
+
+    def flow_done(self):
+        with self.lock:
+            self.flows += 1
+
+    def summary(self):
+        """Report as a JSON-serialisable dict; latencies in milliseconds"""
+        elapsed = max((self.finished or time.perf_counter()) - self.started, 1e-9)
+        endpoints = {}
+        total = 0
+        for endpoint in sorted(self.samples, key=lambda name: (ENDPOINTS + (name,)).index(name)):
+            samples = self.samples[endpoint]
+            total += len(samples)
+            latencies = sorted(seconds * 1000 for seconds, _, _ in samples)
+            queries = [count for _, _, count in samples if count is not None]
+            limited = sum(1 for _, status, _ in samples if status in LIMITED_STATUSES)
+            errors = sum(
+                1 for _, status, _ in samples
+                if status is None or (status >= 400 and status not in LIMITED_STATUSES)
+            )
+            endpoints[endpoint] = {
+                'requests': len(samples),
+                'rps': len(samples) / elapsed,
+                'p50': percentile(latencies, 0.50),
+                'p95': percentile(latencies, 0.95),
+                'p99': percentile(latencies, 0.99),
+                'max': latencies[-1],
+                'limited_rate': limited / len(samples),
+                'error_rate': errors / len(samples),
+                'queries_avg': sum(queries) / len(queries) if queries else None,
+                'queries_max': max(queries) if queries else None,
+            }
+        return {
+            'elapsed': elapsed,
+            'flows': self.flows,
+            'flows_per_second': self.flows / elapsed,
+            'requests': total,
+            'requests_per_second': total / elapsed,
+            'endpoints': endpoints,
+        }
+
+
+class SurveyPlan:
+    """What a respondent needs to know to fill in one form"""
+
+    def __init__(self, form):
+        self.slug = form.slug
+        self.require_captcha = form.require_captcha
+        self.questions = list(form.questions.order_by('order').values_list('id', 'question_type', 'options'))
+        self.datasets = dict(form.master_data_attachments.values_list('id', 'dataset_id'))
+        self.survey_path = reverse('responses:public_survey', kwargs={'slug': form.slug})
+
+    def answers(self, rng):
+        """POST fields answering every question with a valid value"""
+        fields = []
+        for question_id, question_type, options in self.questions:
+            name = f'question_{question_id}'
+            values = [str(option.get('value', '')) for option in options or [] if isinstance(option, dict)]
+            if question_type == 'multi_select' and values:
+                fields.extend((name, value) for value in rng.sample(values, rng.randint(1, min(3, len(values)))))
+            elif values:
+                fields.append((name, rng.choice(values)))
+            elif question_type == 'numeric_input':
+                fields.append((name, str(rng.randint(0, 100))))
+            elif question_type == 'date_input':
+                fields.append((name, (date(2000, 1, 1) + timedelta(days=rng.randrange(9000))).isoformat()))
+            else:
+                fields.append((name, rng.choice(['Baik', 'Cukup', 'Sangat membantu'])))
+        return fields
+
+
+class _NoRedirect(HTTPRedirectHandler):
+    """Report redirects instead of following them, so each hop is timed"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class VirtualClient:
+    """One respondent with its own cookie jar"""
+
+    def __init__(self, base_url, stats, rng, think_time=0):
+        self.base_url = base_url
+        self.stats = stats
+        self.rng = rng
+        self.think_time = think_time
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()), _NoRedirect())
+
+    def request(self, endpoint, path, data=None, headers=None):
+        """Timed request; returns ``(status, headers, body)`` or None on a connection error"""
+        request = Request(
+            urljoin(self.base_url, path),
+            data=urlencode(data).encode() if data is not None else None,
+            headers={'User-Agent': 'survey-loadtest', **(headers or {})},
+        )
+        started = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                status, response_headers, body = response.status, response.headers, response.read()
+        except HTTPError as error:
+            status, response_headers, body = error.code, error.headers, error.read()
+        except (URLError, OSError):
+            self.stats.add(endpoint, time.perf_counter() - started, None)
+            return None
+        queries = response_headers.get(QUERY_COUNT_HEADER)
+        self.stats.add(endpoint, time.perf_counter() - started, status, int(queries) if queries else None)
+        return status, response_headers, body
+
+    def pause(self):
+        if self.think_time:
+            time.sleep(self.rng.uniform(0, self.think_time))
+
+    def respond(self, plan):
+        """Run the whole flow once; True when the submission was stored"""
+        result = self.request('survey', plan.survey_path)
+        if result is None or result[0] != 200:
+            return False
+        page = result[2].decode('utf-8', 'replace')
+        inputs = _inputs(page)
+        fields = [('csrfmiddlewaretoken', inputs.get('csrfmiddlewaretoken', ''))]
+
+        for url in _SNAPSHOT_URL.findall(page):
+            url = _JS_ESCAPE.sub(lambda match: chr(int(match.group(1), 16)), url)  # escapejs
+            attachment = _SNAPSHOT_ATTACHMENT.search(url)
+            result = self.request('snapshot', url, headers={'Accept-Encoding': 'gzip'})
+            if result is None or result[0] != 200 or attachment is None:
+                continue
+            body = result[2]
+            if result[1].get('Content-Encoding') == 'gzip':
+                body = gzip.decompress(body)
+            record = self.drill(json.loads(body))
+            dataset_id = plan.datasets.get(int(attachment.group(1)))
+            if record is not None and dataset_id is not None:
+                fields.append((f'dataset_{dataset_id}', str(record)))
+
+        if plan.require_captcha:
+            key = inputs.get('captcha_0', '')
+            self.request('captcha', reverse('pooled_captcha_image', kwargs={'key': key}))
+            fields += [('captcha_0', key), ('captcha_1', _captcha_answer(key))]
+
+        self.pause()
+        fields += plan.answers(self.rng)
+        result = self.request('submit', plan.survey_path, fields, headers={
+            'Referer': urljoin(self.base_url, plan.survey_path),
+        })
+        if result is None or result[0] != 302:
+            return False
+        self.request('thank_you', result[1].get('Location'))
+        return True
+
+    def drill(self, snapshot):
+        """Narrow the records filter by filter, like the cascading selects"""
+        records = snapshot.get('records') or []
+        for position in range(len(snapshot.get('filters') or [])):
+            if not records:
+                return None
+            value = self.rng.choice(sorted({row[2][position] for row in records}, key=str))
+            records = [row for row in records if row[2][position] == value]
+        return self.rng.choice(records)[0] if records else None
+
+
+def _inputs(page):
+    """``name -> value`` of the ``<input>`` elements of a page (first wins)"""
+    values = {}
+    for tag in _INPUT.findall(page):
+        attributes = dict(_ATTRIBUTE.findall(tag))
+        if 'name' in attributes:
+            values.setdefault(attributes['name'], attributes.get('value', ''))
+    return values
+
+
+def _captcha_answer(hashkey):
+    from captcha.models import CaptchaStore
+
+    return CaptchaStore.objects.filter(hashkey=hashkey).values_list('response', flat=True).first() or ''
+
+
+def run(base_url, plans, clients, stats, duration=None, flows=None, ramp_up=0, think_time=0, seed=0):
+    """Drive ``clients`` concurrent virtual clients until ``duration`` seconds
+    have passed or ``flows`` flows have started, whichever comes first."""
+    deadline = None if duration is None else time.perf_counter() + ramp_up + duration
+    remaining = [flows]
+    lock = threading.Lock()
+
+    def take():
+        with lock:
+            if remaining[0] is None:
+                return True
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def client(number):
+        rng = random.Random(f'{seed}:{number}')
+        time.sleep(ramp_up * number / max(clients, 1))
+        try:
+            while (deadline is None or time.perf_counter() < deadline) and take():
+                respondent = VirtualClient(base_url, stats, rng, think_time)
+                if respondent.respond(rng.choice(plans)):
+                    stats.flow_done()
+                respondent.pause()
+        finally:
+            connection.close()
+
+    stats.started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(client, range(clients)))
+    stats.finished = time.perf_counter()
+    return stats
+
+
+class QueryCountingApplication:
+    """WSGI wrapper adding each request's query count as a response header"""
+
+    def __init__(self, application):
+        self.application = application
+
+    def __call__(self, environ, start_response):
+        count = [0]
+
+        def counter(execute, sql, params, many, context):
+            count[0] += 1
+            return execute(sql, params, many, context)
+
+        def counted_start_response(status, headers, exc_info=None):
+            return start_response(status, headers + [(QUERY_COUNT_HEADER, str(count[0]))], exc_info)
+
+        with connection.execute_wrapper(counter):
+            return self.application(environ, counted_start_response)
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class WorkerPoolServer(WSGIServer):
+    """Threaded WSGI server with a fixed number of workers, like Passenger's
+    process pool: requests beyond ``workers`` wait for a free worker."""
+
+    request_queue_size = 128
+
+    def __init__(self, address, workers):
+        super().__init__(address, _QuietRequestHandler)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='loadtest-worker')
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            connections.close_all()
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+def serve(application, workers, host='127.0.0.1', port=0):
+    """Start ``application`` in a background thread; returns ``(server, base_url)``"""
+    server = WorkerPoolServer((host, port), workers)
+    server.set_app(QueryCountingApplication(application))
+    threading.Thread(target=server.serve_forever, name='loadtest-server', daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}'
+
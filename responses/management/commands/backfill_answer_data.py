@@ -0,0 +1,69 @@
+"""
+Management command to fill in the denormalized answer document of responses.
+
+Responses stored before ``Response.answer_data`` existed have it null and
+are read from their ResponseAnswer rows instead. This writes the document
+for them in batches, one query for the answers and one bulk update per batch.
+It can be stopped and re-run at any time.
+
+Usage:
+    python manage.py backfill_answer_data
+    python manage.py backfill_answer_data --form 12 --batch-size 500
+    python manage.py backfill_answer_data --rebuild    # Rewrite every document
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from responses.models import Response, ResponseAnswer
+
+
+class Command(BaseCommand):
+    help = 'Write Response.answer_data for responses that do not have it yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--form', type=int, help='Only responses to this form id')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Responses updated per batch (default: 1000)',
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Rewrite documents that already exist as well',
+        )
+
+    def handle(self, *args, **options):
+        queryset = Response.objects.all()
+        if options['form']:
+            queryset = queryset.filter(form_id=options['form'])
+        if not options['rebuild']:
+            queryset = queryset.filter(answer_data__isnull=True)
+        batch_size = max(1, options['batch_size'])
+
+        started = time.perf_counter()
+        updated = 0
+        last_id = 0
+        while True:
+            ids = list(
+                queryset.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            documents = {pk: {} for pk in ids}
+            rows = ResponseAnswer.objects.filter(response_id__in=ids).values_list('response_id', 'question_id', 'value')
+            for response_id, question_id, value in rows:
+                documents[response_id][str(question_id)] = value
+
+            Response.objects.bulk_update(
+                [Response(pk=pk, answer_data=document) for pk, document in documents.items()],
+                ['answer_data'],
+            )
+            updated += len(ids)
+            last_id = ids[-1]
+            self.stdout.write(f'  ✓ {updated} response(s) updated')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Backfilled {updated} response(s) in {elapsed:.2f}s'))
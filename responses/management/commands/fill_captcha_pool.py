@@ -0,0 +1,57 @@
+"""
+Management command to keep the captcha pool topped up.
+
+Generates challenges in bulk, pre-renders their images into the cache and
+deletes expired challenges in one statement. Run it from cron more often
+than CAPTCHA_POOL_TIMEOUT, e.g. every 10 minutes:
+
+    */10 * * * * cd ~/survey_application && python manage.py fill_captcha_pool
+
+Usage:
+    python manage.py fill_captcha_pool
+    python manage.py fill_captcha_pool --size 500
+    python manage.py fill_captcha_pool --prune-only
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from responses.captcha_pool import available, fill_pool, pool_size, prune_expired
+
+
+class Command(BaseCommand):
+    help = 'Pre-generate captcha challenges and images and prune expired ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size',
+            type=int,
+            help='Number of challenges to keep queued (default: CAPTCHA_POOL_SIZE)',
+        )
+        parser.add_argument(
+            '--prune-only',
+            action='store_true',
+            help='Only delete expired challenges',
+        )
+
+    def handle(self, *args, **options):
+        pruned = prune_expired()
+        self.stdout.write(f'  ✓ Pruned {pruned} expired challenge(s)')
+
+        if options['prune_only']:
+            return
+
+        size = options['size'] if options['size'] is not None else pool_size()
+        if size <= 0:
+            self.stdout.write(self.style.WARNING('Captcha pool is disabled (CAPTCHA_POOL_SIZE is 0).'))
+            return
+
+        started = time.perf_counter()
+        added = fill_pool(size)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n✓ Added {added} challenge(s) in {elapsed:.2f}s; {available()} queued'
+            )
+        )
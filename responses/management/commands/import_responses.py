@@ -0,0 +1,92 @@
+"""
+Management command to bulk-import responses from a JSON or CSV file.
+
+For responses keyed in from paper forms: every row is validated against
+the form's questions and dataset attachments, valid rows are inserted in
+batches and rejected rows are listed with their errors. Rows carrying a
+``client_id`` that is already stored are skipped, so a file can be re-run.
+See responses/ingest.py for the row format.
+
+Usage:
+    python manage.py import_responses <form id or slug> responses.csv
+    python manage.py import_responses <form id or slug> responses.json --dry-run
+    python manage.py import_responses <form id or slug> responses.csv --report errors.json
+"""
+
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from forms.models import Form
+from responses.ingest import DEFAULT_BATCH_SIZE, IngestError, detect_format, ingest_rows, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Bulk-import responses to a form from a JSON or CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('form', help='Form id or slug')
+        parser.add_argument('path', help='JSON or CSV file of responses')
+        parser.add_argument(
+            '--format',
+            choices=['json', 'csv'],
+            help='File format (default: from the file extension)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Responses inserted per batch (default: {DEFAULT_BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate only, without inserting anything',
+        )
+        parser.add_argument(
+            '--report',
+            help='Write the full report (including every row error) to this JSON file',
+        )
+
+    def handle(self, *args, **options):
+        lookup = {'pk': options['form']} if options['form'].isdigit() else {'slug': options['form']}
+        try:
+            form = Form.objects.get(**lookup)
+        except Form.DoesNotExist:
+            raise CommandError(f"Form '{options['form']}' not found")
+
+        fmt = options['format'] or detect_format(options['path'])
+        started = time.perf_counter()
+        try:
+            with open(options['path'], 'rb') as fh:
+                rows = read_rows(fh, fmt)
+        except (OSError, IngestError) as e:
+            raise CommandError(str(e))
+
+        report = ingest_rows(
+            form, rows,
+            batch_size=max(1, options['batch_size']),
+            dry_run=options['dry_run'],
+            user_agent='bulk-import:command',
+        )
+        elapsed = time.perf_counter() - started
+
+        for error in report['errors'][:20]:
+            details = '; '.join(f'{field}: {message}' for field, message in error['errors'].items())
+            self.stdout.write(self.style.WARNING(f"  ✗ Row {error['row']}: {details}"))
+        if len(report['errors']) > 20:
+            self.stdout.write(f"  … and {len(report['errors']) - 20} more rejected row(s)")
+
+        if options['report']:
+            with open(options['report'], 'w', encoding='utf-8') as fh:
+                json.dump(report, fh, ensure_ascii=False, indent=2)
+            self.stdout.write(f"  ✓ Report written to {options['report']}")
+
+        action = 'Validated' if options['dry_run'] else 'Imported'
+        count = report['valid'] if options['dry_run'] else report['imported']
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\n✓ {action} {count} of {report['total']} row(s) in {elapsed:.2f}s "
+                f"({report['duplicates']} duplicate(s), {len(report['errors'])} rejected)"
+            )
+        )
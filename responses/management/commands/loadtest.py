@@ -0,0 +1,121 @@
+"""
+Management command to load-test the public survey flow.
+
+Runs many concurrent virtual respondents through QR scan, identity snapshot
+drilling, captcha, submit and thank-you (see responses/loadtest.py) and
+reports throughput, p50/p95/p99 latency, limited and error rates and
+database queries per endpoint.
+
+Without ``--url`` the site is served in-process by a pool of ``--workers``
+threads, the way Passenger runs a fixed number of application processes,
+and every response carries its query count. Compare runs with different
+``--workers`` to size the pool, or before and after a caching change.
+With ``--url`` an already running local server is tested instead; it must
+use the same database as this command.
+
+Seed forms to test with ``seed_scale`` first; the command submits real
+responses to them.
+
+Usage:
+    python manage.py loadtest --form scale-survey-1 --clients 50 --duration 60
+    python manage.py loadtest --clients 100 --flows 2000 --workers 8 --report run.json
+    python manage.py loadtest --url http://127.0.0.1:8000 --clients 20 --think-time 2
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import get_internal_wsgi_application
+from forms.models import Form
+from responses.loadtest import ENDPOINTS, Stats, SurveyPlan, run, serve
+
+
+class Command(BaseCommand):
+    help = 'Load-test the public survey pages with concurrent virtual respondents'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--form', action='append', dest='forms', metavar='SLUG',
+                            help='Published form to test (repeatable; default: every published form)')
+        parser.add_argument('--url', help='Base URL of a running local server (default: serve in-process)')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Worker threads of the in-process server (default: 4)')
+        parser.add_argument('--clients', type=int, default=20, help='Concurrent virtual clients (default: 20)')
+        parser.add_argument('--duration', type=float, help='Seconds to run after ramp-up (default: 30 without --flows)')
+        parser.add_argument('--flows', type=int, help='Stop after this many respondent flows')
+        parser.add_argument('--ramp-up', type=float, default=0,
+                            help='Seconds over which the clients start (default: 0)')
+        parser.add_argument('--think-time', type=float, default=0,
+                            help='Longest random pause before submitting, in seconds (default: 0)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+        parser.add_argument('--report', help='Write the report to this JSON file')
+
+    def handle(self, *args, **options):
+        forms = Form.objects.filter(status='published').order_by('id')
+        if options['forms']:
+            forms = forms.filter(slug__in=options['forms'])
+        forms = list(forms)
+        if not forms:
+            raise CommandError('No published form to test')
+        if min(options['clients'], options['workers']) < 1:
+            raise CommandError('--clients and --workers must be at least 1')
+        duration = options['duration']
+        if duration is None and options['flows'] is None:
+            duration = 30
+
+        plans = [SurveyPlan(form) for form in forms]
+        server = None
+        base_url = options['url']
+        if not base_url:
+            server, base_url = serve(get_internal_wsgi_application(), options['workers'])
+            self.stdout.write(f"  ✓ Serving in-process at {base_url} with {options['workers']} workers")
+        self.stdout.write(
+            f"  … {options['clients']} clients on {len(plans)} form(s) "
+            + (f"for {duration:g}s" if duration is not None else f"for {options['flows']} flows")
+        )
+
+        try:
+            stats = run(
+                base_url, plans, options['clients'], Stats(),
+                duration=duration, flows=options['flows'], ramp_up=options['ramp_up'],
+                think_time=options['think_time'], seed=options['seed'],
+            )
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+        report = stats.summary()
+        self.write_table(report)
+        if options['report']:
+            with open(options['report'], 'w', encoding='utf-8') as fh:
+                json.dump({'options': {key: options[key] for key in (
+                    'forms', 'url', 'workers', 'clients', 'duration', 'flows', 'ramp_up', 'think_time', 'seed',
+                )}, **report}, fh, indent=2)
+            self.stdout.write(f"  ✓ Report written to {options['report']}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\n✓ {report['flows']} submissions and {report['requests']} requests in {report['elapsed']:.1f}s "
+                f"({report['flows_per_second']:.1f} submissions/s, {report['requests_per_second']:.1f} requests/s)"
+            )
+        )
+
+    def write_table(self, report):
+        def number(value, digits=0):
+            return '-' if value is None else f'{value:.{digits}f}'
+
+        header = (f"{'endpoint':<10} {'requests':>8} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                  f"{'max ms':>8} {'limited':>8} {'errors':>7} {'queries':>8} {'max q':>6}")
+        self.stdout.write('\n' + header)
+        self.stdout.write('-' * len(header))
+        for endpoint in ENDPOINTS:
+            row = report['endpoints'].get(endpoint)
+            if row is None:
+                continue
+            line = (
+                f"{endpoint:<10} {row['requests']:>8} {row['rps']:>7.1f} {number(row['p50']):>8} "
+                f"{number(row['p95']):>8} {number(row['p99']):>8} {number(row['max']):>8} "
+                f"{row['limited_rate']:>8.1%} {row['error_rate']:>7.1%} "
+                f"{number(row['queries_avg'], 1):>8} {number(row['queries_max']):>6}"
+            )
+            self.stdout.write(self.style.ERROR(line) if row['error_rate'] else line)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('responses', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='response',
+            name='client_id',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+    ]
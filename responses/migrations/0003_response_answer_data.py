@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('responses', '0002_response_client_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='response',
+            name='answer_data',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
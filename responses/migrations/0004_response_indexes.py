@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms', '0001_initial'),
+        ('master_data', '0001_initial'),
+        ('responses', '0003_response_answer_data'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='response',
+            index=models.Index(fields=['form', 'submitted_at'], name='response_form_submitted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='response',
+            index=models.Index(fields=['form', 'is_complete'], name='response_form_complete_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='response',
+            index=models.Index(fields=['session_key'], name='response_session_idx'),
+        ),
+    ]
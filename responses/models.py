@@ -22,6 +22,9 @@ class Response(models.Model):
     # Session tracking for anonymous users
     session_key = models.CharField(max_length=40, blank=True)
     
+    # Client-generated id of a response queued offline; makes sync idempotent
+    client_id = models.UUIDField(null=True, blank=True, unique=True, editable=False)
+    
     # Status tracking
     is_complete = models.BooleanField(default=False)
     submitted_at = models.DateTimeField(auto_now_add=True)
@@ -45,29 +48,69 @@ class Response(models.Model):
         help_text="ID of the dataset this new identity belongs to"
     )
     
+    # Denormalized copy of the answers ({"<question id>": value}), written with
+    # the ResponseAnswer rows so readers need not join them; null until
+    # backfilled (manage.py backfill_answer_data)
+    answer_data = models.JSONField(null=True, blank=True, editable=False)
+    
     class Meta:
         ordering = ['-submitted_at']
+        indexes = [
+            # Dashboard/export listing and counts per form
+            models.Index(fields=['form', 'submitted_at'], name='response_form_submitted_idx'),
+            models.Index(fields=['form', 'is_complete'], name='response_form_complete_idx'),
+            models.Index(fields=['session_key'], name='response_session_idx'),
+        ]
+    
+    @staticmethod
+    def answer_document(answers):
+        """``answer_data`` for ``answers`` mapping question id -> value"""
+        return {str(question_id): value for question_id, value in answers.items()}
+    
+    @classmethod
+    def with_answers(cls, queryset):
+        """``queryset`` prefetching answers only while some responses lack ``answer_data``"""
+        if queryset.filter(answer_data__isnull=True).exists():
+            return queryset.prefetch_related('answers')
+        return queryset
+    
+    @classmethod
+    def sync_answer_data(cls, pk):
+        """Rebuild ``answer_data`` of response ``pk`` from its answer rows"""
+        answers = ResponseAnswer.objects.filter(response_id=pk).values_list('question_id', 'value')
+        cls.objects.filter(pk=pk).update(answer_data=cls.answer_document(dict(answers)))
+    
+    def get_answers_map(self):
+        """Answers as {question id: value}, from ``answer_data`` when present"""
+        if self.answer_data is not None:
+            return {int(question_id): value for question_id, value in self.answer_data.items()}
+        return {answer.question_id: answer.value for answer in self.answers.all()}
     
-    def get_respondent_display(self):
-        """Get the display value for the respondent based on configured display column"""
+    def get_respondent_display(self, attachments=None):
+        """Get the display value for the respondent based on configured display column
+        
+        ``attachments`` maps dataset id -> the form's ``FormMasterDataAttachment``;
+        pass it when listing many responses to avoid a query per response.
+        """
+        def attachment_for(dataset_id):
+            if attachments is not None:
+                return attachments.get(dataset_id)
+            return self.form.master_data_attachments.filter(dataset_id=dataset_id).first()
+        
         if self.user:
             return self.user.username
         elif self.record:
             # Get the FormMasterDataAttachment for this response's record
             try:
-                attachment = self.form.master_data_attachments.get(dataset=self.record.dataset)
-                return attachment.get_record_display_value(self.record)
+                return attachment_for(self.record.dataset_id).get_record_display_value(self.record)
             except Exception:
                 # Fallback to record's __str__ method
                 return str(self.record)
         elif self.is_new_identity and self.new_identity_data:
             # For new identities, try to get the display column from the dataset attachment
-            try:
-                attachment = self.form.master_data_attachments.get(dataset_id=self.new_identity_dataset_id)
-                if attachment.display_column and attachment.display_column in self.new_identity_data:
-                    return self.new_identity_data[attachment.display_column]
-            except Exception:
-                pass
+            attachment = attachment_for(self.new_identity_dataset_id)
+            if attachment and attachment.display_column and attachment.display_column in self.new_identity_data:
+                return self.new_identity_data[attachment.display_column]
             # Fallback: return all values
             return ', '.join(str(v) for v in self.new_identity_data.values() if v)
         return "Anonymous"
@@ -94,5 +137,16 @@ class ResponseAnswer(models.Model):
     class Meta:
         unique_together = ['response', 'question']
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Keep the response's answer document in step with single-row edits
+        Response.sync_answer_data(self.response_id)
+    
+    def delete(self, *args, **kwargs):
+        response_id = self.response_id
+        result = super().delete(*args, **kwargs)
+        Response.sync_answer_data(response_id)
+        return result
+    
     def __str__(self):
         return f"{self.response} - {self.question.text[:30]}..."
@@ -0,0 +1,87 @@
+"""
+Column projection for master data sent to public survey pages.
+
+Records carry every dataset column, including ones listed in
+``FormMasterDataAttachment.hidden_columns`` (NIK, addresses). Nothing from a
+record leaves the server for respondents except what a ``Projection``
+allows: the record id, a display label and the attachment's filter values.
+Hidden columns are never used for any of them. A filter column that is
+hidden is dropped, and a hidden display column falls back to a visible
+name-like column or to ``Record #<id>``.
+
+A projection is computed from the attachment configuration and the
+dataset's column names. It is cached per attachment version, which changes
+whenever the dataset or the attachment settings do.
+"""
+
+import hashlib
+import json
+
+from django.core.cache import cache
+
+# Bump when the projection rules or the snapshot format change
+PROJECTION_VERSION = 2
+PROJECTION_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def attachment_version(attachment):
+    """Token for the dataset version and column settings of ``attachment``"""
+    key = json.dumps([
+        PROJECTION_VERSION,
+        attachment.pk,
+        attachment.dataset.updated_at.timestamp(),
+        attachment.display_column,
+        attachment.filter_columns,
+        attachment.hidden_columns,
+    ])
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+class Projection:
+    """The public view of one attachment's records"""
+
+    def __init__(self, label_columns, filter_columns):
+        # Columns tried in order for the label, as get_record_display_value does
+        self.label_columns = tuple(label_columns)
+        self.filter_columns = tuple(filter_columns)
+
+    def label(self, record_id, data):
+        for column in self.label_columns:
+            value = data.get(column)
+            if value not in (None, ''):
+                return str(value)
+        return f'Record #{record_id}'
+
+    def project(self, record_id, data):
+        """``[id, label, [filter values]]`` for one record"""
+        return [
+            record_id,
+            self.label(record_id, data),
+            [data.get(column) for column in self.filter_columns],
+        ]
+
+
+def build_projection(attachment, column_names):
+    hidden = set(attachment.hidden_columns or [])
+    visible = [name for name in column_names if name not in hidden]
+
+    label_columns = []
+    if attachment.display_column and attachment.display_column not in hidden:
+        label_columns.append(attachment.display_column)
+    # Same fallback as get_record_display_value, over visible columns only
+    label_columns.extend(
+        name for name in visible if 'nama' in name.lower() or 'name' in name.lower()
+    )
+    filters = [column for column in attachment.filter_columns or [] if column not in hidden]
+    return Projection(label_columns, filters)
+
+
+def get_projection(attachment):
+    """Cached ``Projection`` for the current version of ``attachment``"""
+    key = f'attachment_projection:{attachment.pk}:{attachment_version(attachment)}'
+    projection = cache.get(key)
+    if projection is None:
+        column_names = list(attachment.dataset.columns.values_list('name', flat=True))
+        projection = build_projection(attachment, column_names)
+        cache.set(key, projection, PROJECTION_CACHE_TIMEOUT)
+    return projection
@@ -0,0 +1,88 @@
+"""
+Anonymous respondent sessions for the public survey pages.
+
+With ``RESPONDENT_SESSION_MODE = 'cookie'`` (the default) the respondent id
+and the forms whose password the respondent has entered live in a signed
+cookie instead of a ``django_session`` row, so public traffic does no
+session-table writes. The respondent id is a random 32 character key stored
+in ``Response.session_key``, which keeps its meaning: one browser, across
+submissions. Password grants are bound to a fingerprint of the form's
+current password, so changing the password revokes them.
+
+``RESPONDENT_SESSION_MODE = 'session'`` keeps the previous behaviour of
+using Django's session for both.
+"""
+
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.utils.crypto import salted_hmac
+
+COOKIE_NAME = 'survey_respondent'
+COOKIE_SALT = 'responses.respondent'
+COOKIE_MAX_AGE = 60 * 60 * 24 * 365
+
+
+def _password_fingerprint(form):
+    return salted_hmac('responses.form_access', f'{form.pk}:{form.password}').hexdigest()[:16]
+
+
+class RespondentSession:
+    """The anonymous respondent behind a public survey request"""
+
+    def __init__(self, request):
+        self.request = request
+        self.use_cookie = getattr(settings, 'RESPONDENT_SESSION_MODE', 'cookie') == 'cookie'
+        self.modified = False
+        self.data = {}
+        if self.use_cookie:
+            self.data = self._load()
+
+    def _load(self):
+        value = self.request.COOKIES.get(COOKIE_NAME)
+        if not value:
+            return {}
+        try:
+            data = signing.loads(value, salt=COOKIE_SALT, max_age=COOKIE_MAX_AGE)
+        except (signing.BadSignature, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    @property
+    def key(self):
+        """Stable identifier stored in ``Response.session_key``"""
+        if not self.use_cookie:
+            if not self.request.session.session_key:
+                self.request.session.save()
+            return self.request.session.session_key
+
+        if not self.data.get('id'):
+            self.data['id'] = uuid.uuid4().hex
+            self.modified = True
+        return self.data['id']
+
+    def has_access(self, form):
+        if not self.use_cookie:
+            return bool(self.request.session.get(f'form_access_{form.slug}'))
+        return self.data.get('access', {}).get(form.slug) == _password_fingerprint(form)
+
+    def grant_access(self, form):
+        if not self.use_cookie:
+            self.request.session[f'form_access_{form.slug}'] = True
+            return
+        self.data.setdefault('access', {})[form.slug] = _password_fingerprint(form)
+        self.modified = True
+
+    def save(self, response):
+        """Write the cookie onto ``response`` if anything changed"""
+        if not (self.use_cookie and self.modified):
+            return
+        response.set_cookie(
+            COOKIE_NAME,
+            signing.dumps(self.data, salt=COOKIE_SALT, compress=True),
+            max_age=COOKIE_MAX_AGE,
+            secure=settings.SESSION_COOKIE_SECURE,
+            httponly=True,
+            samesite='Lax',
+        )
@@ -0,0 +1,63 @@
+"""
+Identity-list snapshots for the public survey page.
+
+The cascading identity selects used to receive every record of every
+attached dataset inline in the page, on every load. Instead each attachment
+gets a JSON snapshot holding only what the selects need: the record id, its
+display label and its ``filter_columns`` values, as allowed by the
+attachment's column projection (see projection.py)::
+
+    {"filters": ["Wilayah", "Lingkungan"],
+     "records": [[17, "Budi", ["Barat", "St. Petrus"]], ...]}
+
+A snapshot is built once per attachment version (the dataset's
+``updated_at`` plus the attachment's column settings), gzipped and kept in
+the cache. It is served from a URL carrying a hash of its content, so
+browsers cache it as immutable and download each dataset once per version.
+Saving a record, a column or the attachment changes the version, and the
+next page render builds a new snapshot under a new URL.
+"""
+
+import gzip
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.urls import reverse
+
+from .projection import attachment_version, get_projection
+
+SNAPSHOT_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def build_snapshot(attachment):
+    """Serialize the identity list of ``attachment`` to compact JSON bytes"""
+    projection = get_projection(attachment)
+    rows = attachment.dataset.records.order_by('id').values_list('id', 'data')
+    records = [projection.project(record_id, data) for record_id, data in rows.iterator(chunk_size=2000)]
+    payload = {'filters': list(projection.filter_columns), 'records': records}
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def get_snapshot(attachment):
+    """``(content_hash, gzipped_json)`` for the current version of ``attachment``"""
+    key = f'identity_snapshot:{attachment.pk}:{attachment_version(attachment)}'
+    snapshot = cache.get(key)
+    if snapshot is None:
+        content = build_snapshot(attachment)
+        snapshot = (
+            hashlib.sha256(content).hexdigest()[:16],
+            gzip.compress(content, compresslevel=6, mtime=0),
+        )
+        cache.set(key, snapshot, SNAPSHOT_CACHE_TIMEOUT)
+    return snapshot
+
+
+def snapshot_url(form, attachment):
+    """Content-hashed URL of the current snapshot for ``attachment``"""
+    content_hash, _ = get_snapshot(attachment)
+    return reverse('responses:identity_snapshot', kwargs={
+        'slug': form.slug,
+        'attachment_id': attachment.pk,
+        'content_hash': content_hash,
+    })
@@ -1,3 +1,504 @@
-from django.test import TestCase
+import json
+import random
+import re
+import shutil
+import subprocess
+import uuid
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.datastructures import MultiValueDict
+
+from accounts.models import ApiToken, User
+from forms.logic import get_form_logic
+from forms.models import Form, FormQuestion
+from master_data.models import MasterDataRecord, MasterDataSet
+from survey_project.testing import QueryBudgetAssertions, QueryPlanAssertions, seed_survey
+from .captcha_pool import _item_key, available, fill_pool, pop_captcha
+from .loadtest import Stats, SurveyPlan
+from .models import Response, ResponseAnswer
+from .snapshots import snapshot_url
+from .throttling import INFLIGHT_KEY, TokenBucket, _enter, _leave
+from .validation import get_submission_validator
+
+
+class ResponseQueryPlanTests(QueryPlanAssertions, TestCase):
+    """The hot queries on responses and answers must not scan whole tables"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', password='x')
+        dataset = MasterDataSet.objects.create(name='People', description='', owner=owner)
+        cls.record = MasterDataRecord.objects.create(dataset=dataset, data={'Name': 'A'})
+        cls.forms = [
+            Form.objects.create(title=f'Form {n}', owner=owner, status='published')
+            for n in range(3)
+        ]
+        cls.form = cls.forms[0]
+        cls.question = FormQuestion.objects.create(form=cls.form, text='Q', question_type='text_input')
+        # Enough rows that an index is worth using on every backend
+        Response.objects.bulk_create([
+            Response(
+                form=form,
+                record=cls.record if n % 5 == 0 else None,
+                session_key=f'session-{n}',
+                is_complete=n % 3 != 0,
+                answer_data={},
+            )
+            for form in cls.forms
+            for n in range(200)
+        ])
+        ResponseAnswer.objects.bulk_create([
+            ResponseAnswer(response=response, question=cls.question, value='x')
+            for response in cls.form.responses.all()
+        ])
+
+    def test_latest_responses_of_form(self):
+        self.assertNoFullScan(
+            self.form.responses.select_related('user', 'record')[:20],
+            index='response_form_submitted_idx',
+        )
+
+    def test_complete_count_of_form(self):
+        # The rows behind .count()
+        self.assertNoFullScan(
+            self.form.responses.filter(is_complete=True).order_by().values('pk'),
+            index='response_form_complete_idx',
+        )
+
+    def test_responses_by_session(self):
+        self.assertNoFullScan(
+            Response.objects.filter(session_key='session-7'),
+            index='response_session_idx',
+        )
+
+    def test_responses_by_record(self):
+        self.assertNoFullScan(Response.objects.filter(record=self.record))
+
+    def test_responses_by_client_id(self):
+        self.assertNoFullScan(Response.objects.filter(client_id__in=['00000000-0000-0000-0000-000000000000']))
+
+    def test_api_page_of_form(self):
+        self.assertNoFullScan(self.form.responses.filter(pk__gt=10).order_by('pk').values_list('pk', flat=True)[:101])
+
+    def test_answers_by_question(self):
+        self.assertNoFullScan(ResponseAnswer.objects.filter(question=self.question))
+
+    def test_answers_of_responses(self):
+        ids = list(self.form.responses.values_list('pk', flat=True)[:50])
+        self.assertNoFullScan(ResponseAnswer.objects.filter(response_id__in=ids))
+
+
+class PublicViewQueryBudgetTests(QueryBudgetAssertions, TestCase):
+    """Every view in responses/urls.py, and the JSON API, makes a bounded number of queries"""
+
+    def submission(self, form, record):
+        choice, why = form.questions.get(text='Choice'), form.questions.get(text='Why')
+        return {
+            f'question_{choice.pk}': 'yes',
+            f'question_{why.pk}': 'Because',
+            f'dataset_{record.dataset_id}': str(record.pk),
+        }
+
+    def test_service_worker(self):
+        self.each_survey(lambda form: self.assertQueryBudget(0, 'get', reverse('responses:service_worker')))
+
+    def test_public_survey(self):
+        def check(form):
+            url = reverse('responses:public_survey', args=[form.slug])
+            record = form.master_data_attachments.get().dataset.records.last()
+            self.assertQueryBudget(14, 'get', url)
+            self.assertQueryBudget(8, 'post', url, status=302, data=self.submission(form, record))
+            self.assertQueryBudget(4, 'get', reverse('responses:thank_you', args=[form.slug]))
+        self.each_survey(check)
+
+    def test_submit(self):
+        self.each_survey(lambda form: self.assertQueryBudget(0, 'post', reverse('responses:submit', args=[form.slug])))
+
+    def test_batch_submit(self):
+        def check(form):
+            # One queued response per record: the batch grows with the survey
+            items = [
+                {'client_id': str(uuid.uuid4()), 'fields': self.submission(form, record)}
+                for record in form.master_data_attachments.get().dataset.records.all()
+            ]
+            response = self.assertQueryBudget(
+                10, 'post', reverse('responses:batch_submit', args=[form.slug]),
+                data=json.dumps({'responses': items}), content_type='application/json',
+            )
+            self.assertEqual(len(response.json()['accepted']), len(items))
+        self.each_survey(check)
+
+    def test_manifest(self):
+        self.each_survey(lambda form: self.assertQueryBudget(1, 'get', reverse('responses:manifest', args=[form.slug])))
+
+    def test_identity_snapshot(self):
+        self.each_survey(lambda form: self.assertQueryBudget(
+            4, 'get', snapshot_url(form, form.master_data_attachments.get()),
+        ))
+
+    def test_responses_api(self):
+        def check(form):
+            _, key = ApiToken.create_token(form.owner, 'budget')
+            url = reverse('responses_api', args=[form.pk])
+            auth = {'HTTP_AUTHORIZATION': f'Bearer {key}'}
+            self.assertQueryBudget(7, 'get', url, **auth)
+            self.assertQueryBudget(6, 'get', url, data={'fields': 'id,respondent,identity,answers'}, **auth)
+            self.assertQueryBudget(5, 'get', url, data={'identity.Region': 'R1', 'limit': 5}, **auth)
+        self.each_survey(check)
+
+
+class PublicSurveyPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='x')
+        cls.form = seed_survey(cls.owner, 3)
+        cls.url = reverse('responses:public_survey', args=[cls.form.slug])
+
+    def test_logic_table_cannot_close_script(self):
+        question = self.form.questions.get(text='Why')
+        question.logic = {'conditions': [{
+            'question': self.form.questions.get(text='Choice').pk,
+            'operator': 'equals',
+            'value': '</script><script>alert(1)</script>',
+        }]}
+        question.save()
+
+        content = self.client.get(self.url).content.decode()
+        self.assertNotIn('<script>alert(1)', content)
+        self.assertIn('\\u003C/script\\u003E\\u003Cscript\\u003Ealert(1)', content)
+
+    @skipUnless(shutil.which('node'), 'needs node to run the page script')
+    def test_browser_and_server_logic_agree(self):
+        questions = {q.text: q for q in self.form.questions.all()}
+        why, tags = questions['Why'], questions['Tags']
+        why.logic = {'action': 'show', 'match': 'all', 'conditions': [
+            {'question': questions['When'].pk, 'operator': 'gte', 'value': '2024-06-01'},
+            {'question': questions['Count'].pk, 'operator': 'lt', 'value': 10},
+        ]}
+        why.save()
+        tags.logic = {'action': 'hide', 'match': 'any', 'conditions': [
+            {'question': questions['When'].pk, 'operator': 'lt', 'value': '2024-12-01'},
+            {'question': questions['Count'].pk, 'operator': 'gt', 'value': '2.5e1'},
+        ]}
+        tags.save()
+        when, count = questions['When'].pk, questions['Count'].pk
+        answer_sets = [
+            {when: '2024-12-01', count: '9'},
+            {when: '2024-05-31', count: '9.5'},
+            {when: '2024-06-01', count: '10'},
+            {when: '2025-01-15', count: '26'},
+            {when: '2025-01-15', count: '0x10'},
+            {when: '', count: '-3'},
+        ]
+
+        # The page's evaluator, with the DOM reduced to the answers above
+        content = self.client.get(self.url).content.decode()
+        script = content[content.index('const formLogic'):content.index('if (formLogic) {')]
+        harness = script + """
+            const cards = {};
+            var document = {querySelector(selector) {
+                const id = selector.match(/data-question-id="(\\d+)"/)[1];
+                return cards[id] = {style: {}, querySelectorAll: () => []};
+            }};
+            const results = [];
+            for (const answers of %s) {
+                questionValues = (dep, hidden) => hidden.has(dep) || !answers[dep] ? [] : [answers[dep]];
+                applyFormLogic();
+                results.push(Object.keys(cards).filter(id => cards[id].style.display === 'none').map(Number).sort());
+            }
+            console.log(JSON.stringify(results));
+        """ % json.dumps(answer_sets)
+        browser = json.loads(subprocess.run(
+            ['node', '-e', harness], capture_output=True, text=True, check=True,
+        ).stdout)
+
+        logic = get_form_logic(Form.objects.get(pk=self.form.pk))
+        server = [sorted(logic.hidden_questions(answers)) for answers in answer_sets]
+        self.assertEqual(browser, server)
+        # "2024-05-31" is a date before "2024-06-01", not the number 2024
+        self.assertEqual(server[0], [])
+        self.assertEqual(server[1], sorted([why.pk, tags.pk]))
+
+    def test_rejected_submission_keeps_the_answers(self):
+        questions = {q.text: q for q in self.form.questions.all()}
+        tags = questions['Tags']
+        record = self.form.master_data_attachments.get().dataset.records.first()
+        # The required Choice is missing
+        response = self.client.post(self.url, {
+            f'question_{questions["Why"].pk}': 'Because <b>',
+            f'question_{tags.pk}': [tags.options[0]['value'], tags.options[1]['value']],
+            f'question_{questions["When"].pk}': '2024-12-01',
+            f'dataset_{record.dataset_id}': str(record.pk),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'value="Because &lt;b&gt;"')
+        self.assertContains(response, 'value="2024-12-01"')
+        content = response.content.decode()
+        for value in ('a', 'b'):
+            self.assertRegex(content, rf'value="{value}" class="checkbox[^>]*\schecked')
+        self.assertNotRegex(content, r'class="radio[^>]*\schecked')
+        self.assertContains(
+            response, f'id="hidden_dataset_{record.dataset_id}" value="{record.pk}"',
+        )
+
+    def test_rejected_submission_gets_a_new_captcha(self):
+        Form.objects.filter(pk=self.form.pk).update(require_captcha=True)
+
+        def captcha_key(response):
+            return re.search(r'name="captcha_0"[^>]*value="([0-9a-f]+)"', response.content.decode()).group(1)
+
+        key = captcha_key(self.client.get(self.url))
+        response = self.client.post(self.url, {'captcha_0': key, 'captcha_1': 'wrong'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(captcha_key(response), key)
+        # Not bound to the used-up answer, so it is not checked again
+        self.assertFalse(response.context['form'].is_bound)
+
+    def test_if_modified_since_alone_is_not_a_304(self):
+        self.client.get(self.url)  # Sets the CSRF cookie the ETag depends on
+        response = self.client.get(self.url)
+        self.assertIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+class TokenBucketTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.bucket = TokenBucket('test', rate=2, burst=5)
+
+    def test_refill_is_capped_at_burst(self):
+        self.assertEqual(self.bucket.take(5, now=1000), 0)
+        self.assertEqual(self.bucket.level(now=1001), 2)
+        self.assertEqual(self.bucket.level(now=5000), 5)
+        self.assertEqual(self.bucket.take(5, now=5000), 0)
+        self.assertEqual(self.bucket.take(now=5000), 1)
+
+    def test_level_matches_take(self):
+        self.bucket.take(4, now=1000)
+        self.assertEqual(self.bucket.level(now=1000.5), 2)
+        self.assertEqual(self.bucket.take(3, now=1000.5), 1)
+        self.assertEqual(self.bucket.take(2, now=1000.5), 0)
+        self.assertEqual(self.bucket.level(now=1000.5), 0)
+
+    def test_take_up_to(self):
+        self.assertEqual(self.bucket.take_up_to(8, now=1000), (5, 0))
+        self.assertEqual(self.bucket.take_up_to(1, now=1000), (0, 1))
+        self.bucket.give(3, now=1000)
+        self.assertEqual(self.bucket.take_up_to(8, now=1000), (3, 0))
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_backend_without_update(self):
+        self.assertEqual(self.bucket.take(5, now=1000), 0)
+        self.assertEqual(self.bucket.take(now=1000), 1)
+        self.assertEqual(self.bucket.level(now=1001), 2)
+
+
+class InflightCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_counter_never_goes_negative(self):
+        self.assertEqual(_enter(), 1)
+        # The counter expired while the request was running
+        cache.delete(INFLIGHT_KEY)
+        _leave()
+        self.assertEqual(cache.get(INFLIGHT_KEY), 0)
+        self.assertEqual(_enter(), 1)
+
+    def test_each_request_renews_the_timeout(self):
+        with mock.patch('survey_project.cache.time.time', return_value=1000):
+            _enter()
+        with mock.patch('survey_project.cache.time.time', return_value=1050):
+            _enter()
+            _leave()
+        with mock.patch('survey_project.cache.time.time', return_value=1070):
+            self.assertEqual(cache.get(INFLIGHT_KEY), 1)
+
+
+@override_settings(SUBMISSION_FORM_RATE=0.01, SUBMISSION_FORM_BURST=3)
+class BatchThrottlingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.form = seed_survey(User.objects.create_user('owner', password='x'), 5)
+        cls.url = reverse('responses:batch_submit', args=[cls.form.slug])
+
+    def setUp(self):
+        cache.clear()
+
+    def post_batch(self):
+        choice = self.form.questions.get(text='Choice')
+        items = [
+            {'client_id': str(uuid.uuid4()), 'fields': {
+                f'question_{choice.pk}': 'no', f'dataset_{record.dataset_id}': str(record.pk),
+            }}
+            for record in self.form.master_data_attachments.get().dataset.records.all()
+        ]
+        return self.client.post(self.url, data=json.dumps({'responses': items}), content_type='application/json')
+
+    def test_one_token_per_response(self):
+        response = self.post_batch()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['accepted']), 3)
+        response = self.post_batch()
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+
+@skipUnless(shutil.which('node'), 'node is needed to run the service worker')
+class ServiceWorkerQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.form = seed_survey(User.objects.create_user('owner', password='x'), 1)
+
+    def setUp(self):
+        cache.clear()
+
+    def flush(self, queue, replies):
+        """Run the service worker's flushQueue over ``queue``, answering each endpoint with its reply"""
+        script = self.client.get(reverse('responses:service_worker')).content.decode()
+        harness = """
+            const stores = {queue: new Map(), failed: new Map()};
+            const messages = [];
+            const db = {
+                objectStoreNames: {contains: name => name in stores},
+                transaction() {
+                    const tx = {objectStore: name => ({
+                        put: item => { stores[name].set(item.client_id, item); },
+                        delete: id => { stores[name].delete(id); },
+                        getAll: () => ({result: [...stores[name].values()]}),
+                    })};
+                    setTimeout(() => tx.oncomplete());
+                    return tx;
+                },
+            };
+            var indexedDB = {open() { const open = {result: db}; setTimeout(() => open.onsuccess()); return open; }};
+            var self = {
+                registration: {scope: 'http://testserver/survey/'},
+                addEventListener() {},
+                clients: {matchAll: async () => [{postMessage: message => messages.push(message)}]},
+            };
+            const replies = %s;
+            globalThis.fetch = async endpoint => {
+                const [status, body] = replies[endpoint];
+                return {ok: status < 300, status: status, statusText: '', json: async () => body};
+            };
+            %s.forEach(item => stores.queue.set(item.client_id, item));
+        """ % (json.dumps(replies), json.dumps(queue)) + script + """
+            flushQueue().then(() => console.log(JSON.stringify({
+                queue: [...stores.queue.keys()],
+                failed: Object.fromEntries([...stores.failed.values()].map(item => [item.client_id, item.errors])),
+                message: messages[0],
+            })));
+        """
+        return json.loads(subprocess.run(
+            ['node', '-e', harness], capture_output=True, text=True, check=True,
+        ).stdout)
+
+    def test_refused_responses_leave_the_queue(self):
+        choice = self.form.questions.get(text='Choice')
+        record = self.form.master_data_attachments.get().dataset.records.get()
+        accepted = {'client_id': str(uuid.uuid4()), 'fields': {
+            f'question_{choice.pk}': ['no'], f'dataset_{record.dataset_id}': [str(record.pk)],
+        }}
+        # Stored by a client that writes its ids in capitals; the server's reply uses lowercase
+        invalid = {'client_id': str(uuid.uuid4()).upper(), 'fields': {}}
+        batch_url = reverse('responses:batch_submit', args=[self.form.slug])
+        reply = self.client.post(
+            batch_url, data=json.dumps({'responses': [accepted, invalid]}), content_type='application/json',
+        ).json()
+        self.assertEqual(list(reply['rejected']), [invalid['client_id'].lower()])
+
+        closed, throttled = str(uuid.uuid4()), str(uuid.uuid4())
+        queue = [
+            {**accepted, 'endpoint': batch_url}, {**invalid, 'endpoint': batch_url},
+            {'client_id': closed, 'endpoint': '/survey/closed/batch/', 'fields': {}},
+            {'client_id': throttled, 'endpoint': '/survey/busy/batch/', 'fields': {}},
+        ]
+        result = self.flush(queue, {
+            batch_url: [200, reply],
+            '/survey/closed/batch/': [403, {'error': 'This survey cannot be submitted offline.'}],
+            '/survey/busy/batch/': [429, {'error': 'Too many requests.'}],
+        })
+        self.assertEqual(result['queue'], [throttled])
+        self.assertEqual(result['failed'], {
+            invalid['client_id']: reply['rejected'][invalid['client_id'].lower()],
+            closed: {'batch': 'This survey cannot be submitted offline.'},
+        })
+        self.assertEqual(result['message'], {'type': 'survey-sync', 'sent': 1, 'failed': 2, 'remaining': 1})
+
+    def test_malformed_ids_are_reported_under_the_id_sent(self):
+        response = self.client.post(
+            reverse('responses:batch_submit', args=[self.form.slug]),
+            data=json.dumps({'responses': [{'client_id': 'not-a-uuid', 'fields': {}}, 'junk']}),
+            content_type='application/json',
+        )
+        self.assertEqual(set(response.json()['rejected']), {'not-a-uuid', '1'})
+
+@override_settings(CAPTCHA_POOL_SIZE=3)
+class CaptchaPoolTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def expire_queue(self):
+        # What the queue timeout does to the slots after a quiet period
+        for index in range(1, 4):
+            cache.delete(_item_key(index))
+
+    def test_refill_after_the_queue_expired(self):
+        self.assertEqual(fill_pool(), 3)
+        self.assertEqual(fill_pool(), 0)
+        self.expire_queue()
+        self.assertEqual(available(), 0)
+
+        self.assertEqual(fill_pool(), 3)
+        self.assertEqual(available(), 3)
+        popped = [pop_captcha() for _ in range(3)]
+        self.assertNotIn(None, popped)
+        self.assertEqual(len(set(popped)), 3)
+
+    def test_refill_after_part_of_the_queue_expired(self):
+        fill_pool(2)
+        fill_pool(3)
+        cache.delete(_item_key(1))
+        cache.delete(_item_key(2))
+        self.assertEqual(fill_pool(), 2)
+        self.assertIsNotNone(pop_captcha())
+
+
+class LoadTestHarnessTests(TestCase):
+    """The load-test harness posts valid answers and reports what it measured"""
+
+    def test_answers_pass_validation(self):
+        form = seed_survey(User.objects.create_user('owner', password='x'), 3)
+        plan = SurveyPlan(form)
+        data = MultiValueDict()
+        for name, value in plan.answers(random.Random(1)):
+            data.appendlist(name, value)
+        answers, errors = get_submission_validator(form).validate(data, check_captcha=False)
+        self.assertEqual(errors, {})
+        self.assertTrue(answers)
+
+    def test_summary(self):
+        stats = Stats()
+        stats.started = 0
+        stats.finished = 10
+        for n in range(1, 101):
+            stats.add('survey', n / 1000, 200, 5)
+        stats.add('submit', 0.1, 302, 7)
+        stats.add('submit', 0.1, 503)
+        stats.add('submit', 0.1, 500, 2)
+        stats.add('submit', 0.1, None)
+        report = stats.summary()
+        survey, submit = report['endpoints']['survey'], report['endpoints']['submit']
+        self.assertEqual((survey['p50'], survey['p95'], survey['p99'], survey['max']), (50, 95, 99, 100))
+        self.assertEqual(survey['rps'], 10)
+        self.assertEqual((survey['queries_avg'], survey['queries_max']), (5, 5))
+        self.assertEqual((submit['limited_rate'], submit['error_rate']), (0.25, 0.5))
+        self.assertEqual(report['requests'], 104)
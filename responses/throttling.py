@@ -0,0 +1,275 @@
+"""
+Admission control for public survey submissions.
+
+Per-IP rate limits do not help when a whole congregation submits from one
+NAT'd Wi-Fi address, and they do nothing when many addresses submit at
+once. Submissions therefore pass three checks, all kept in the shared cache
+so every worker process sees the same state:
+
+* a token bucket per form (keyed by slug),
+* a global token bucket across all forms,
+* an in-flight counter that caps how many submissions are being processed
+  at once (the queue depth in front of the database).
+
+A rejected request gets ``503 Service Unavailable`` with ``Retry-After``
+before the view runs, so no database work is done for it. Batches of
+responses queued offline take one token per response once the batch is
+parsed; the responses beyond the available tokens stay queued on the
+device for a later batch.
+
+A bucket's state is ``(tokens, last_refill)`` under one cache key. Taking
+a token first refills the bucket with ``rate`` tokens per second since the
+last refill, capped at ``burst``, and the whole read-modify-write happens
+atomically: inside one immediate transaction with ``SharedCache.update``,
+or under a lock taken with the atomic ``add`` on other backends. A missing
+key is a full bucket, so the key expires once the bucket would be full
+again anyway.
+"""
+
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+INFLIGHT_TIMEOUT = 60
+LOCK_TIMEOUT = 1
+# Retry-After for a bucket that never refills (rate 0)
+NO_REFILL_RETRY = 60
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _atomic_update(key, func, timeout):
+    """Replace the value under ``key`` with ``func(value)``, atomically.
+
+    ``func`` gets the current value (None if missing) and returns
+    ``(new_value, result)``; ``result`` is returned.
+    """
+    update = getattr(cache, 'update', None)
+    if update is not None:
+        return update(key, func, timeout)
+    lock = f'{key}:lock'
+    # The lock expires by itself if its holder dies
+    while not cache.add(lock, 1, LOCK_TIMEOUT):
+        time.sleep(0.001)
+    try:
+        value, result = func(cache.get(key))
+        cache.set(key, value, timeout)
+    finally:
+        cache.delete(lock)
+    return result
+
+
+class TokenBucket:
+    """Token bucket shared across processes through the cache"""
+
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.key = f'throttle:{name}'
+
+    def _timeout(self):
+        # After burst / rate seconds the bucket is full, the same as missing
+        if self.rate <= 0:
+            return None
+        return math.ceil(self.burst / self.rate) + 1
+
+    def _refill(self, state, now):
+        if state is None:
+            return self.burst
+        tokens, last_refill = state
+        return min(self.burst, tokens + self.rate * max(0.0, now - last_refill))
+
+    def _wait(self, tokens, count):
+        """Seconds until ``count`` tokens are available"""
+        if self.rate <= 0:
+            return NO_REFILL_RETRY
+        return max(1, math.ceil((count - tokens) / self.rate))
+
+    def _update(self, func, now):
+        def step(state):
+            tokens = self._refill(state, now)
+            tokens, result = func(tokens)
+            # Never move the refill time back (clocks of other processes)
+            return (tokens, now if state is None else max(now, state[1])), result
+        return _atomic_update(self.key, step, self._timeout())
+
+    def take(self, count=1, now=None):
+        """Take ``count`` tokens; return 0 on success or the seconds to wait.
+
+        Rejected requests take nothing, so they do not drain the bucket.
+        """
+        now = time.time() if now is None else now
+
+        def take_all(tokens):
+            if tokens >= count:
+                return tokens - count, 0
+            return tokens, self._wait(tokens, count)
+        return self._update(take_all, now)
+
+    def take_up_to(self, count, now=None):
+        """Take as many of ``count`` tokens as there are.
+
+        Returns ``(taken, wait)``: ``wait`` is the seconds until the next
+        token when none could be taken, else 0.
+        """
+        now = time.time() if now is None else now
+
+        def take_some(tokens):
+            taken = min(count, int(tokens))
+            if taken or not count:
+                return tokens - taken, (taken, 0)
+            return tokens, (0, self._wait(tokens, 1))
+        return self._update(take_some, now)
+
+    def give(self, count, now=None):
+        """Return tokens taken for work that was not done"""
+        now = time.time() if now is None else now
+        self._update(lambda tokens: (min(self.burst, tokens + count), None), now)
+
+    def level(self, now=None):
+        """Tokens currently available, as ``take`` sees them"""
+        now = time.time() if now is None else now
+        return self._update(lambda tokens: (tokens, tokens), now)
+
+
+def form_bucket(slug):
+    return TokenBucket(
+        f'form:{slug}',
+        _setting('SUBMISSION_FORM_RATE', 5),
+        _setting('SUBMISSION_FORM_BURST', 30),
+    )
+
+
+def global_bucket():
+    return TokenBucket(
+        'global',
+        _setting('SUBMISSION_GLOBAL_RATE', 20),
+        _setting('SUBMISSION_GLOBAL_BURST', 60),
+    )
+
+
+INFLIGHT_KEY = 'throttle:inflight'
+REJECTED_KEY = 'throttle:rejected'
+
+
+def _enter():
+    # Every change renews the timeout, so the counter only expires after a
+    # quiet period and never while requests keep arriving
+    return _atomic_update(
+        INFLIGHT_KEY, lambda depth: ((depth or 0) + 1,) * 2, INFLIGHT_TIMEOUT,
+    )
+
+
+def _leave():
+    # A counter that expired while the request was running restarts at 0;
+    # clamp so the missing increment cannot push it below zero
+    _atomic_update(
+        INFLIGHT_KEY, lambda depth: (max((depth or 0) - 1, 0), None), INFLIGHT_TIMEOUT,
+    )
+
+
+def _record_rejection(reason):
+    key = f'{REJECTED_KEY}:{reason}'
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def _unavailable(retry_after, reason):
+    _record_rejection(reason)
+    response = HttpResponse(
+        'The survey is receiving too many submissions right now. Please try again shortly.',
+        status=503,
+        content_type='text/plain',
+    )
+    response['Retry-After'] = str(int(retry_after))
+    return response
+
+
+def admit_responses(slug, count):
+    """Take one token per response from both buckets, as many as they allow.
+
+    Returns ``(admitted, rejected)``: how many of the ``count`` responses
+    may be stored, and a 503 response when none may.
+    """
+    if not _setting('SUBMISSION_THROTTLE_ENABLE', True) or not count:
+        return count, None
+
+    form = form_bucket(slug)
+    granted, wait = form.take_up_to(count)
+    if not granted:
+        return 0, _unavailable(wait, 'form')
+    bucket = global_bucket()
+    admitted, wait = bucket.take_up_to(granted)
+    if admitted < granted:
+        form.give(granted - admitted)
+    if not admitted:
+        return 0, _unavailable(wait, 'global')
+    return admitted, None
+
+
+def admit_submission(slug):
+    """Run the admission checks for one response; return a 503 response or None"""
+    return admit_responses(slug, 1)[1]
+
+
+def throttle_submissions(view_func=None, *, per_request=True):
+    """Apply admission control to a view taking a ``slug`` kwarg.
+
+    Checks the buckets, then holds an in-flight slot while the view runs.
+    With ``per_request=False`` the view takes its own tokens with
+    ``admit_responses`` (one per response of a batch).
+    """
+    if view_func is None:
+        return lambda func: throttle_submissions(func, per_request=per_request)
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if per_request:
+            rejected = admit_submission(kwargs.get('slug', ''))
+            if rejected is not None:
+                return rejected
+
+        if not _setting('SUBMISSION_THROTTLE_ENABLE', True):
+            return view_func(request, *args, **kwargs)
+
+        depth = _enter()
+        try:
+            if depth > _setting('SUBMISSION_MAX_INFLIGHT', 8):
+                return _unavailable(1, 'inflight')
+            return view_func(request, *args, **kwargs)
+        finally:
+            _leave()
+    return wrapper
+
+
+def throttle_metrics(slugs=()):
+    """Current bucket levels, queue depth and rejection counts"""
+    now = time.time()
+    bucket = global_bucket()
+    return {
+        'global': {
+            'tokens': round(bucket.level(now), 2),
+            'burst': bucket.burst,
+            'rate': bucket.rate,
+        },
+        'forms': {
+            slug: round(form_bucket(slug).level(now), 2)
+            for slug in slugs
+        },
+        'inflight': cache.get(INFLIGHT_KEY, 0),
+        'max_inflight': _setting('SUBMISSION_MAX_INFLIGHT', 8),
+        'rejected': {
+            reason: cache.get(f'{REJECTED_KEY}:{reason}', 0)
+            for reason in ('form', 'global', 'inflight')
+        },
+    }
@@ -4,7 +4,11 @@ from . import views
 app_name = 'responses'
 
 urlpatterns = [
+    path('sw.js', views.service_worker, name='service_worker'),
     path('<slug:slug>/', views.PublicSurveyView.as_view(), name='public_survey'),
     path('<slug:slug>/submit/', views.SurveySubmitView.as_view(), name='submit'),
+    path('<slug:slug>/batch/', views.batch_submit, name='batch_submit'),
+    path('<slug:slug>/manifest.webmanifest', views.survey_manifest, name='manifest'),
     path('<slug:slug>/thank-you/', views.SurveyThankYouView.as_view(), name='thank_you'),
+    path('<slug:slug>/identities/<int:attachment_id>/<str:content_hash>.json', views.identity_snapshot, name='identity_snapshot'),
 ]
\ No newline at end of file
@@ -0,0 +1,151 @@
+"""
+Per-form submission validation.
+
+A ``SubmissionValidator`` is compiled once per form version (keyed on
+``Form.updated_at``, like the compiled logic) from the form's questions and
+kept in the cache. Validating a POST is then a single pass over the compiled
+field specs with no ORM access: required flags, integer and date parsing and
+option membership are checked in memory, and questions hidden by conditional
+logic are skipped. Only the captcha check touches the database.
+"""
+
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from forms.logic import get_form_logic
+
+from .captcha_pool import pool_size
+
+VALIDATOR_CACHE_TIMEOUT = 60 * 60 * 24
+
+REQUIRED_MESSAGE = 'This question is required.'
+CAPTCHA_MESSAGE = 'Invalid CAPTCHA. Please try again.'
+
+
+class SubmissionValidator:
+    """Validates survey submissions for one version of a form"""
+
+    def __init__(self, fields, require_captcha, logic):
+        # fields: tuple of (question_id, question_type, is_required, choices)
+        self.fields = fields
+        self.require_captcha = require_captcha
+        self.logic = logic
+
+    def validate(self, data, check_captcha=True):
+        """Validate a QueryDict (or dict of lists) of submitted values.
+
+        Returns ``(answers, errors)``: ``answers`` maps question id -> the
+        value to store, ``errors`` maps question id (or ``'captcha'``) -> a
+        message. Answers to hidden questions are dropped.
+        """
+        submitted = {
+            question_id: [v.strip() for v in _getlist(data, f'question_{question_id}') if v.strip()]
+            for question_id, _, _, _ in self.fields
+        }
+        hidden = self.logic.hidden_questions(submitted) if self.logic.has_rules else ()
+
+        answers, errors = {}, {}
+        for question_id, question_type, is_required, choices in self.fields:
+            if question_id in hidden:
+                continue
+            values = submitted[question_id]
+            if not values:
+                if is_required:
+                    errors[question_id] = REQUIRED_MESSAGE
+                continue
+
+            if question_type == 'multi_select':
+                if choices is not None and not set(values) <= choices:
+                    errors[question_id] = 'Select only the available options.'
+                    continue
+                answers[question_id] = ', '.join(values)
+                continue
+
+            value = values[0]
+            if choices is not None and value not in choices:
+                errors[question_id] = 'Select one of the available options.'
+            elif question_type == 'numeric_input' and not _is_integer(value):
+                errors[question_id] = 'Enter a whole number.'
+            elif question_type == 'date_input' and not _is_date(value):
+                errors[question_id] = 'Enter a valid date.'
+            else:
+                answers[question_id] = value
+
+        if check_captcha and self.require_captcha and not _check_captcha(data):
+            errors['captcha'] = CAPTCHA_MESSAGE
+
+        return answers, errors
+
+
+def _getlist(data, key):
+    if hasattr(data, 'getlist'):
+        return data.getlist(key)
+    value = data.get(key, [])
+    return value if isinstance(value, list) else [value]
+
+
+def _is_integer(value):
+    try:
+        int(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _is_date(value):
+    try:
+        datetime.date.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _check_captcha(data):
+    """Check and consume the captcha answer with a single DELETE"""
+    from captcha.models import CaptchaStore
+
+    hashkey = data.get('captcha_0', '')
+    response = (data.get('captcha_1') or '').strip().lower()
+    if not hashkey or not response:
+        return False
+
+    # With the captcha pool, fill_captcha_pool prunes expired rows in bulk
+    if not getattr(settings, 'CAPTCHA_GET_FROM_POOL', False) and pool_size() <= 0:
+        CaptchaStore.remove_expired()
+    if getattr(settings, 'CAPTCHA_TEST_MODE', False) and response == 'passed':
+        CaptchaStore.objects.filter(hashkey=hashkey).delete()
+        return True
+
+    deleted, _ = CaptchaStore.objects.filter(
+        hashkey=hashkey, response=response, expiration__gt=timezone.now()
+    ).delete()
+    return deleted > 0
+
+
+def build_validator(form, questions):
+    """Compile a validator from ``form`` and its questions"""
+    fields = []
+    for question in questions:
+        choices = None
+        if question.question_type in ('single_select', 'multi_select', 'image_select'):
+            choices = frozenset(
+                str(option.get('value', '')) for option in question.options or []
+                if isinstance(option, dict)
+            )
+        fields.append((question.pk, question.question_type, question.is_required, choices))
+    return SubmissionValidator(tuple(fields), form.require_captcha, get_form_logic(form))
+
+
+def get_submission_validator(form):
+    """Cached validator for ``form``, rebuilt whenever the form is updated"""
+    version = form.updated_at.timestamp() if form.updated_at else 0
+    key = f'form_validator:{form.pk}:{version}'
+    validator = cache.get(key)
+    if validator is None:
+        questions = list(form.questions.only('id', 'form_id', 'question_type', 'is_required', 'options'))
+        validator = build_validator(form, questions)
+        cache.set(key, validator, VALIDATOR_CACHE_TIMEOUT)
+    return validator
@@ -1,18 +1,38 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.generic import DetailView, CreateView, TemplateView, FormView
-from django.http import JsonResponse, HttpResponse
+from django.conf import settings
+from django.http import Http404, JsonResponse, HttpResponse, StreamingHttpResponse
+from django.templatetags.static import static
+from django.urls import reverse
 from django.contrib import messages
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_protect
+from django.views.decorators.http import require_GET, require_POST
 from django.utils.decorators import method_decorator
 from django_ratelimit.decorators import ratelimit
-from captcha.fields import CaptchaField
+from captcha.fields import CaptchaField, CaptchaTextInput
 from captcha.models import CaptchaStore
+from captcha.views import captcha_image as render_captcha_image
+from django.core.cache import cache
 from django import forms
+from django.db import transaction
+from django.db.models import Q
+import gzip
 import json
+from .api import ApiError, ResponseQuery, stream_page
+from .batch import build_response, identity_selection, submit_batch
+from .captcha_pool import image_key, pop_captcha
+from .conditional import not_modified, page_etag, set_etag
 from .models import Response, ResponseAnswer
-from forms.models import Form, FormQuestion
+from .projection import get_projection
+from .respondent import RespondentSession
+from .snapshots import get_snapshot, snapshot_url
+from .throttling import admit_responses, throttle_submissions
+from .validation import get_submission_validator
+from forms.logic import get_form_logic
+from forms.models import Form
 from master_data.models import MasterDataRecord
+from accounts.models import ApiToken
 
 class PasswordForm(forms.Form):
     """Form for password protection"""
@@ -21,9 +41,24 @@ class PasswordForm(forms.Form):
         'placeholder': 'Enter form password'
     }))
 
+class PooledCaptchaTextInput(CaptchaTextInput):
+    """Captcha widget that takes its challenge from the pre-generated pool"""
+    
+    def fetch_captcha_store(self, name, value, attrs=None, generator=None):
+        key = pop_captcha()
+        if key is None:
+            return super().fetch_captcha_store(name, value, attrs, generator)
+        self._value = [key, '']
+        self._key = key
+        self.id_ = self.build_attrs(attrs).get('id', None)
+
 class SurveyResponseForm(forms.Form):
-    """Dynamic form for survey responses"""
-    captcha = CaptchaField()
+    """Captcha field for the public survey page.
+    
+    Question answers are validated by the form's cached
+    ``SubmissionValidator`` instead of per-request Django fields.
+    """
+    captcha = CaptchaField(widget=PooledCaptchaTextInput())
     
     def __init__(self, *args, **kwargs):
         form_obj = kwargs.pop('form_obj', None)
@@ -31,47 +66,8 @@ class SurveyResponseForm(forms.Form):
         
         if form_obj and not form_obj.require_captcha:
             del self.fields['captcha']
-        
-        # Add dynamic fields based on form questions
-        if form_obj:
-            for question in form_obj.questions.all():
-                field_name = f'question_{question.id}'
-                
-                if question.question_type == 'text_input':
-                    self.fields[field_name] = forms.CharField(
-                        label=question.text,
-                        required=question.is_required,
-                        widget=forms.TextInput(attrs={'class': 'input input-bordered w-full'})
-                    )
-                elif question.question_type == 'numeric_input':
-                    self.fields[field_name] = forms.IntegerField(
-                        label=question.text,
-                        required=question.is_required,
-                        widget=forms.NumberInput(attrs={'class': 'input input-bordered w-full'})
-                    )
-                elif question.question_type == 'date_input':
-                    self.fields[field_name] = forms.DateField(
-                        label=question.text,
-                        required=question.is_required,
-                        widget=forms.DateInput(attrs={'class': 'input input-bordered w-full', 'type': 'date'})
-                    )
-                elif question.question_type in ['single_select', 'image_select']:
-                    choices = [(opt.get('value', ''), opt.get('text', '')) for opt in question.options]
-                    self.fields[field_name] = forms.ChoiceField(
-                        label=question.text,
-                        choices=choices,
-                        required=question.is_required,
-                        widget=forms.RadioSelect(attrs={'class': 'radio'})
-                    )
-                elif question.question_type == 'multi_select':
-                    choices = [(opt.get('value', ''), opt.get('text', '')) for opt in question.options]
-                    self.fields[field_name] = forms.MultipleChoiceField(
-                        label=question.text,
-                        choices=choices,
-                        required=question.is_required,
-                        widget=forms.CheckboxSelectMultiple(attrs={'class': 'checkbox'})
-                    )
 
+@method_decorator(throttle_submissions, name='post')
 @method_decorator(ratelimit(key='ip', rate='20/s', method='GET'), name='get')
 @method_decorator(ratelimit(key='ip', rate='20/s', method='POST'), name='post')
 class PublicSurveyView(FormView):
@@ -81,17 +77,37 @@ class PublicSurveyView(FormView):
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
         kwargs['form_obj'] = self.get_form_object()
+        # Submissions are validated by the SubmissionValidator, never by this
+        # form; a rejected submission is shown again with a new challenge,
+        # since the submitted one has been used up
+        kwargs.pop('data', None)
+        kwargs.pop('files', None)
         return kwargs
     
     def get_form_object(self):
-        return get_object_or_404(Form, slug=self.kwargs['slug'], status='published')
+        if not hasattr(self, '_form_obj'):
+            self._form_obj = get_object_or_404(Form, slug=self.kwargs['slug'], status='published')
+        return self._form_obj
+    
+    def get(self, request, *args, **kwargs):
+        form_obj = self.get_form_object()
+        etag = None
+        # A captcha challenge is single-use, so those pages are always rendered
+        if not form_obj.require_captcha:
+            etag = page_etag(
+                request, form_obj, bool(form_obj.password) and self.respondent.has_access(form_obj)
+            )
+        response = not_modified(request, etag)
+        if response is None:
+            response = set_etag(super().get(request, *args, **kwargs), etag)
+        return response
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         form_obj = self.get_form_object()
         
         # Check if password is required and not provided
-        if form_obj.password and not self.request.session.get(f'form_access_{form_obj.slug}'):
+        if form_obj.password and not self.respondent.has_access(form_obj):
             context['require_password'] = True
             context['password_form'] = PasswordForm()
             return context
@@ -116,143 +132,238 @@ class PublicSurveyView(FormView):
         context['questions_without_section'] = questions_without_section
         context['all_questions_ordered'] = all_questions_ordered  # For numbering reference
         context['questions'] = form_obj.questions.all()  # Keep for backward compatibility
-        context['master_data_attachments'] = form_obj.master_data_attachments.all()
+        # A rejected submission is shown again with the respondent's input
+        submitted = getattr(self, 'submitted', None) or {}
+        attachments = list(form_obj.master_data_attachments.select_related('dataset'))
+        for attachment in attachments:
+            # Only projected columns reach the page (hidden_columns never do)
+            attachment.public_filter_columns = get_projection(attachment).filter_columns
+            attachment.snapshot_url = snapshot_url(form_obj, attachment)
+            dataset_id = attachment.dataset_id
+            attachment.submitted_record = submitted.get(f'dataset_{dataset_id}', '')
+            attachment.submitted_identity = {
+                key[len(f'new_{dataset_id}_'):]: value
+                for key, value in submitted.items()
+                if key.startswith(f'new_{dataset_id}_')
+            }
+        context['master_data_attachments'] = attachments
+        context['submitted_answers'] = {
+            question.pk: submitted.getlist(f'question_{question.pk}')
+            for question in all_questions_ordered
+        } if submitted else {}
+        
+        context['offline_enabled'] = offline_enabled(form_obj)
+        
+        logic = get_form_logic(form_obj)
+        context['logic_table'] = logic.client_table() if logic.has_rules else None
+        context['question_errors'] = getattr(self, 'question_errors', {})
         return context
     
+    def dispatch(self, request, *args, **kwargs):
+        # Anonymous respondents are tracked in a signed cookie (see respondent.py)
+        self.respondent = RespondentSession(request)
+        response = super().dispatch(request, *args, **kwargs)
+        self.respondent.save(response)
+        return response
+    
     def post(self, request, *args, **kwargs):
         form_obj = self.get_form_object()
         
-        # Ensure session exists
-        if not request.session.session_key:
-            request.session.save()
-        
         # Handle password authentication
         if 'password' in request.POST:
             password_form = PasswordForm(request.POST)
             if password_form.is_valid():
                 if password_form.cleaned_data['password'] == form_obj.password:
-                    request.session[f'form_access_{form_obj.slug}'] = True
+                    self.respondent.grant_access(form_obj)
                     return redirect(request.path)
                 else:
                     messages.error(request, 'Incorrect password.')
             return self.get(request, *args, **kwargs)
         
-        # Handle survey submission directly (bypass Django form validation for now)
+        # Submissions to protected forms need the password first
+        if form_obj.password and not self.respondent.has_access(form_obj):
+            return redirect(request.path)
+        
+        answers, errors = get_submission_validator(form_obj).validate(request.POST)
+        if errors:
+            if 'captcha' in errors:
+                messages.error(request, errors.pop('captcha'))
+            if errors:
+                messages.error(request, 'Please correct the highlighted questions.')
+            self.question_errors = errors
+            self.submitted = request.POST
+            return self.get(request, *args, **kwargs)
+        
         try:
-            return self.handle_survey_submission(form_obj)
+            return self.handle_survey_submission(form_obj, answers)
         except Exception as e:
             messages.error(request, f'Error submitting survey: {str(e)}')
+            self.submitted = request.POST
             return self.get(request, *args, **kwargs)
     
-    def handle_survey_submission(self, form_obj):
-        """Handle the survey submission directly from POST data"""
-        # Check for master data selection or new identity data
-        selected_record = None
-        new_record_data = {}
-        is_new_identity = False
-        new_identity_dataset_id = None
+    def handle_survey_submission(self, form_obj, answers):
+        """Store a validated submission (``answers`` maps question id -> value)"""
+        data = self.request.POST
+        # Master data selection or new identity data ("Other")
+        record_refs, _ = identity_selection(data)
+        records = MasterDataRecord.objects.in_bulk([record_id for _, record_id in record_refs])
         
-        for key in self.request.POST.keys():
-            if key.startswith('dataset_'):
-                dataset_id = int(key.replace('dataset_', ''))
-                record_value = self.request.POST.get(key)
-                if record_value and record_value != 'new':
-                    try:
-                        record = MasterDataRecord.objects.get(id=int(record_value), dataset_id=dataset_id)
-                        selected_record = record
-                    except (ValueError, MasterDataRecord.DoesNotExist):
-                        continue
-                elif record_value == 'new':
-                    # Collect new identity data (but don't create master data record)
-                    for post_key in self.request.POST.keys():
-                        if post_key.startswith(f'new_{dataset_id}_'):
-                            column_name = post_key.replace(f'new_{dataset_id}_', '')
-                            value = self.request.POST.get(post_key)
-                            if value:  # Only include non-empty values
-                                new_record_data[column_name] = value
-                    
-                    # Mark as new identity if we have data
-                    if new_record_data:
-                        is_new_identity = True
-                        new_identity_dataset_id = dataset_id
-                        break  # Use the first valid new identity
-        
-        # Create response record
-        response = Response.objects.create(
-            form=form_obj,
-            record=selected_record,
-            is_new_identity=is_new_identity,
-            new_identity_data=new_record_data if is_new_identity else None,
-            new_identity_dataset_id=new_identity_dataset_id,
-            session_key=self.request.session.session_key,
-            ip_address=self.get_client_ip(),
+        response = build_response(
+            form_obj, data, records,
+            answer_data=Response.answer_document(answers),
+            session_key=self.respondent.key,
+            ip_address=get_client_ip(self.request),
             user_agent=self.request.META.get('HTTP_USER_AGENT', ''),
-            is_complete=True
         )
-        
-        # Save answers from POST data
-        for key in self.request.POST.keys():
-            if key.startswith('question_'):
-                question_id = int(key.replace('question_', ''))
-                try:
-                    question = FormQuestion.objects.get(id=question_id)
-                    # Get all values for this question (handles multi-select)
-                    values = self.request.POST.getlist(key)
-                    if values:
-                        # Join multiple values with comma for multi-select
-                        value = ', '.join(values) if len(values) > 1 else values[0]
-                        ResponseAnswer.objects.create(
-                            response=response,
-                            question=question,
-                            value=str(value) if value else ''
-                        )
-                except FormQuestion.DoesNotExist:
-                    continue
+        # The answer document and the answer rows are stored together
+        with transaction.atomic():
+            response.save()
+            ResponseAnswer.objects.bulk_create([
+                ResponseAnswer(response=response, question_id=question_id, value=value)
+                for question_id, value in answers.items()
+            ])
         
         return redirect('responses:thank_you', slug=form_obj.slug)
+
+def get_client_ip(request):
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if x_forwarded_for:
+        ip = x_forwarded_for.split(',')[0]
+    else:
+        ip = request.META.get('REMOTE_ADDR')
+    return ip
+
+def offline_enabled(form_obj):
+    """Offline mode needs no server round trip before submitting (no captcha)"""
+    return getattr(settings, 'SURVEY_OFFLINE_ENABLE', True) and not form_obj.require_captcha
+
+@require_POST
+@throttle_submissions(per_request=False)
+@ratelimit(key='ip', rate='20/s', method='POST', block=False)
+def batch_submit(request, slug):
+    """Accept responses queued offline by the survey service worker (see batch.py)"""
+    if request.limited:
+        # 429 rather than the 403 of a blocked request: the service worker
+        # keeps a throttled batch queued but sets aside one refused for good
+        response = JsonResponse({'error': 'Too many requests.'}, status=429)
+        response['Retry-After'] = '1'
+        return response
+    form_obj = get_object_or_404(Form, slug=slug, status='published')
+    if not offline_enabled(form_obj):
+        return JsonResponse({'error': 'This survey cannot be submitted offline.'}, status=403)
+    respondent = RespondentSession(request)
+    if form_obj.password and not respondent.has_access(form_obj):
+        return JsonResponse({'error': 'This survey requires a password.'}, status=403)
     
-    def form_valid(self, form):
-        form_obj = self.get_form_object()
-        
-        # Ensure session exists
-        if not self.request.session.session_key:
-            self.request.session.save()
-        
-        # Create response record
-        response = Response.objects.create(
-            form=form_obj,
-            session_key=self.request.session.session_key,
-            ip_address=self.get_client_ip(),
-            user_agent=self.request.META.get('HTTP_USER_AGENT', ''),
-            is_complete=True
-        )
-        
-        # Save answers
-        for field_name, value in form.cleaned_data.items():
-            if field_name.startswith('question_') and field_name != 'captcha':
-                question_id = int(field_name.replace('question_', ''))
-                try:
-                    question = FormQuestion.objects.get(id=question_id)
-                    # Handle multi-select values
-                    if isinstance(value, list):
-                        value = ', '.join(value)
-                    ResponseAnswer.objects.create(
-                        response=response,
-                        question=question,
-                        value=str(value) if value is not None else ''
-                    )
-                except FormQuestion.DoesNotExist:
-                    continue
-        
-        return redirect('responses:thank_you', slug=form_obj.slug)
+    try:
+        items = json.loads(request.body)['responses']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected {"responses": [...]}.'}, status=400)
+    if not isinstance(items, list):
+        return JsonResponse({'error': 'Expected {"responses": [...]}.'}, status=400)
+    batch_max = getattr(settings, 'SUBMISSION_BATCH_MAX', 50)
+    if len(items) > batch_max:
+        return JsonResponse({'error': f'Send at most {batch_max} responses per batch.'}, status=413)
+    
+    admitted, rejected = admit_responses(slug, len(items))
+    if rejected is not None:
+        return rejected
+    # Responses beyond the available tokens are left out of the reply, so
+    # the service worker keeps them queued for a later batch
+    items = items[:admitted]
+    
+    result = submit_batch(
+        form_obj, items,
+        session_key=respondent.key,
+        ip_address=get_client_ip(request),
+        user_agent=request.META.get('HTTP_USER_AGENT', ''),
+    )
+    response = JsonResponse(result)
+    respondent.save(response)
+    return response
+
+def service_worker(request):
+    """Service worker for offline surveys, served under /survey/ for its scope"""
+    response = render(request, 'responses/service_worker.js', {
+        'batch_max': getattr(settings, 'SUBMISSION_BATCH_MAX', 50),
+    }, content_type='application/javascript')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+def survey_manifest(request, slug):
+    """Web app manifest so an offline survey can be installed to the home screen"""
+    form_obj = get_object_or_404(Form, slug=slug, status='published')
+    survey_url = reverse('responses:public_survey', kwargs={'slug': slug})
+    return JsonResponse({
+        'name': form_obj.title,
+        'short_name': form_obj.title[:12],
+        'start_url': survey_url,
+        'scope': survey_url,
+        'display': 'standalone',
+        'background_color': '#ffffff',
+        'theme_color': '#10b981',
+        'icons': [{'src': static('images/logo.png'), 'sizes': '40x40', 'type': 'image/png'}],
+    }, content_type='application/manifest+json')
+
+def captcha_image(request, key):
+    """Serve a pooled captcha image from the cache, rendering others as usual"""
+    content = cache.get(image_key(key))
+    if content is None:
+        return render_captcha_image(request, key)
+    response = HttpResponse(content, content_type='image/png')
+    response['Cache-Control'] = 'private, max-age=300'
+    return response
+
+def identity_snapshot(request, slug, attachment_id, content_hash):
+    """Serve an attachment's identity-list snapshot (see snapshots.py).
+    
+    The current snapshot is immutable under its content hash; a stale hash
+    from an older page redirects to the current one.
+    """
+    form_obj = get_object_or_404(Form, slug=slug, status='published')
+    if form_obj.password and not RespondentSession(request).has_access(form_obj):
+        raise Http404("Snapshot not available")
+    attachment = get_object_or_404(
+        form_obj.master_data_attachments.select_related('dataset'), pk=attachment_id
+    )
+    
+    current_hash, content = get_snapshot(attachment)
+    if content_hash != current_hash:
+        response = redirect(snapshot_url(form_obj, attachment))
+        response['Cache-Control'] = 'no-cache'
+        return response
+    
+    if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        response = HttpResponse(content, content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(gzip.decompress(content), content_type='application/json')
+    response['Vary'] = 'Accept-Encoding'
+    visibility = 'private' if form_obj.password else 'public'
+    response['Cache-Control'] = f'{visibility}, max-age=31536000, immutable'
+    return response
+
+@require_GET
+def responses_api(request, pk):
+    """Read-only JSON list of a form's responses for API tokens (see api.py)"""
+    user = ApiToken.from_request(request)
+    if user is None:
+        response = JsonResponse({'error': 'Authentication credentials were not provided or are invalid.'}, status=401)
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+    
+    form_obj = Form.objects.filter(Q(owner=user) | Q(editors=user)).filter(pk=pk).distinct().first()
+    if form_obj is None:
+        return JsonResponse({'error': 'Form not found.'}, status=404)
+    
+    try:
+        query = ResponseQuery(form_obj, request.GET)
+    except ApiError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     
-    def get_client_ip(self):
-        x_forwarded_for = self.request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = self.request.META.get('REMOTE_ADDR')
-        return ip
+    response = StreamingHttpResponse(stream_page(query), content_type='application/json')
+    response['Cache-Control'] = 'private, no-store'
+    return response
 
 class SurveySubmitView(CreateView):
     model = Response
@@ -267,8 +378,15 @@ class SurveySubmitView(CreateView):
 class SurveyThankYouView(TemplateView):
     template_name = 'responses/thank_you.html'
     
+    def get(self, request, *args, **kwargs):
+        self.form_obj = get_object_or_404(Form, slug=self.kwargs['slug'])
+        etag = page_etag(request, self.form_obj)
+        response = not_modified(request, etag)
+        if response is None:
+            response = set_etag(super().get(request, *args, **kwargs), etag)
+        return response
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        form_obj = get_object_or_404(Form, slug=self.kwargs['slug'])
-        context['survey_form'] = form_obj
+        context['survey_form'] = self.form_obj
         return context
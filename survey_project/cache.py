@@ -0,0 +1,295 @@
+"""
+Shared cache backend that needs no external service.
+
+Passenger runs several worker processes, so a per-process ``LocMemCache``
+gives every worker its own rate limit counters and its own copy of every
+cached rendering. ``SharedCache`` stores entries in a single SQLite file
+(WAL mode) that all workers on the host share, with a small in-process LRU
+(L1) in front of it for hot reads.
+
+Reads are served from L1 for at most ``L1_TIMEOUT`` seconds, so a value
+changed by another worker can be seen stale for that long; versioned keys
+(QR images, compiled logic, validators) are never rewritten and are
+unaffected. ``add``/``incr``/``decr`` and ``update`` (a read-modify-write
+of one key) always go to SQLite inside an immediate transaction, which
+makes counters (django-ratelimit) and token buckets atomic across
+processes.
+
+``get`` reports each read as a hit or miss to the request timing (see
+performance.py).
+
+Configuration (see ``CACHES`` in settings)::
+
+    'BACKEND': 'survey_project.cache.SharedCache',
+    'LOCATION': '/path/to/cache.sqlite3',
+    'OPTIONS': {'MAX_ENTRIES': 20000, 'L1_MAX_ENTRIES': 500, 'L1_TIMEOUT': 5},
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .performance import record_cache_lookup
+
+# Run the cull check once every this many writes per process
+CULL_CHECK_INTERVAL = 200
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with a per-entry expiry time"""
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, payload, expires):
+        if self.max_entries <= 0:
+            return
+        expires_at = time.time() + self.timeout
+        if expires is not None:
+            expires_at = min(expires_at, expires)
+        with self._lock:
+            self._data[key] = (expires_at, payload)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SharedCache(BaseCache):
+    """SQLite-backed cache shared across processes with an in-process L1"""
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._l1 = LRUCache(
+            int(options.get('L1_MAX_ENTRIES', 500)),
+            float(options.get('L1_TIMEOUT', 5)),
+        )
+        self._local = threading.local()
+        self._writes = 0
+
+    # -- storage -------------------------------------------------------
+
+    def _connection(self):
+        """Per-thread connection, reopened after a fork"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self._path, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _encode(self, value):
+        # Integers are stored natively; everything else is pickled
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, self.pickle_protocol)
+
+    @staticmethod
+    def _decode(payload):
+        if isinstance(payload, int):
+            return payload
+        return pickle.loads(payload)
+
+    def _expiry(self, timeout):
+        return self.get_backend_timeout(timeout)
+
+    def _fetch(self, conn, key, now):
+        row = conn.execute(
+            'SELECT value, expires FROM cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= now):
+            return None
+        return row
+
+    # -- BaseCache API -------------------------------------------------
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        payload = self._l1.get(key)
+        if payload is not None:
+            record_cache_lookup(True)
+            return self._decode(payload)
+
+        row = self._fetch(self._connection(), key, time.time())
+        record_cache_lookup(row is not None)
+        if row is None:
+            return default
+        self._l1.set(key, row[0], row[1])
+        return self._decode(row[0])
+
+    def get_many(self, keys, version=None):
+        found = {}
+        for key in keys:
+            value = self.get(key, _MISSING, version=version)
+            if value is not _MISSING:
+                found[key] = value
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        payload = self._encode(value)
+        expires = self._expiry(timeout)
+        self._connection().execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+            (key, payload, expires),
+        )
+        self._l1.set(key, payload, expires)
+        self._maybe_cull()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        payload = self._encode(value)
+        expires = self._expiry(timeout)
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if self._fetch(conn, key, time.time()) is not None:
+                conn.execute('COMMIT')
+                return False
+            conn.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                (key, payload, expires),
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._l1.delete(key)
+        self._maybe_cull()
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = self._fetch(conn, key, time.time())
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = self._decode(row[0]) + delta
+            conn.execute(
+                'UPDATE cache SET value = ? WHERE key = ?', (self._encode(value), key)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._l1.delete(key)
+        return value
+
+    def update(self, key, func, timeout=DEFAULT_TIMEOUT, version=None):
+        """Atomically replace the value under ``key`` with a function of it.
+
+        ``func(value)`` gets the current value (None if missing) and returns
+        ``(new_value, result)``; ``result`` is returned. Not part of the
+        BaseCache API: token buckets use it when the backend provides it.
+        """
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = self._fetch(conn, key, time.time())
+            value, result = func(None if row is None else self._decode(row[0]))
+            conn.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                (key, self._encode(value), self._expiry(timeout)),
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._l1.delete(key)
+        self._maybe_cull()
+        return result
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute(
+            'UPDATE cache SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self._expiry(timeout), key, time.time()),
+        )
+        self._l1.delete(key)
+        return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+        self._l1.delete(key)
+        return cursor.rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._fetch(self._connection(), key, time.time()) is not None
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+        self._l1.clear()
+
+    def close(self, **kwargs):
+        # Connections are reused across requests
+        pass
+
+    # -- maintenance ---------------------------------------------------
+
+    def _maybe_cull(self):
+        self._writes += 1
+        if self._writes % CULL_CHECK_INTERVAL:
+            return
+        self.cull()
+
+    def cull(self):
+        """Drop expired entries and, above MAX_ENTRIES, the soonest-expiring ones"""
+        conn = self._connection()
+        conn.execute('DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?', (time.time(),))
+        count = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            excess = count - self._max_entries + self._max_entries // self._cull_frequency
+            conn.execute(
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM cache ORDER BY expires IS NULL, expires LIMIT ?)',
+                (excess,),
+            )
@@ -0,0 +1,311 @@
+"""
+Per-request performance instrumentation.
+
+``TimingMiddleware`` measures every request: total time, SQL queries (count
+and time, through ``execute_wrapper`` on every database connection),
+template rendering (the ``TimedDjangoTemplates`` backend) and cache hits and
+misses (recorded by ``SharedCache``). The figures are
+
+* sent to staff users in a ``Server-Timing`` header, which the browser's
+  developer tools show next to each request (on pages that load the user),
+* logged as one JSON object per request to the ``survey_project.performance``
+  logger, at WARNING for requests slower than ``PERFORMANCE_SLOW_REQUEST_MS``,
+* added to per-minute totals per endpoint behind the staff "slowest
+  endpoints" page (``slowest_endpoints``).
+
+Passenger runs several worker processes, so the totals are kept in the
+shared cache: each process sums its requests in memory and writes its
+totals for the current minute every ``FLUSH_INTERVAL`` seconds under a slot
+number taken with ``incr``. Readers add up every slot of every minute in
+the window. Streaming responses are measured until the view returns, not
+until the last chunk is sent.
+"""
+
+import json
+import logging
+import threading
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+from django.utils.functional import empty
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 5
+
+_current = ContextVar('request_timings', default=None)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def window_minutes():
+    return _setting('PERFORMANCE_WINDOW_MINUTES', 15)
+
+
+class RequestTimings:
+    """What one request spent its time on (durations in seconds)"""
+
+    def __init__(self):
+        self.total = 0.0
+        self.queries = 0
+        self.query_time = 0.0
+        self.render_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._rendering = 0
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_time += time.perf_counter() - started
+
+    def server_timing(self):
+        """Value of the ``Server-Timing`` header"""
+        return ', '.join([
+            f'total;dur={self.total * 1000:.1f}',
+            f'db;dur={self.query_time * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.render_time * 1000:.1f};desc="Templates"',
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+        ])
+
+
+def record_cache_lookup(hit):
+    """Count a cache read of the current request (no-op outside requests)"""
+    timings = _current.get()
+    if timings is not None:
+        if hit:
+            timings.cache_hits += 1
+        else:
+            timings.cache_misses += 1
+
+
+class TimedTemplate:
+    """Template wrapper adding its render time to the current request"""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        timings = _current.get()
+        if timings is None:
+            return self.template.render(context, request)
+        # Templates rendered while rendering another are already timed
+        timings._rendering += 1
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            timings._rendering -= 1
+            if not timings._rendering:
+                timings.render_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Django template backend whose templates report their render time"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class TimingMiddleware:
+    """Measure each request; see the module docstring"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _setting('PERFORMANCE_TIMING_ENABLE', True):
+            return self.get_response(request)
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(timings.execute_wrapper))
+                response = self.get_response(request)
+        finally:
+            timings.total = time.perf_counter() - started
+            _current.reset(token)
+
+        if _is_staff(request):
+            response['Server-Timing'] = timings.server_timing()
+
+        endpoint = endpoint_name(request)
+        log_request(request, response, endpoint, timings)
+        window.add(endpoint, timings)
+        return response
+
+
+def _is_staff(request):
+    """Whether the request is a staff user's, if the user is already loaded.
+
+    Loading the user for every request would cost a session and a user
+    query on pages that never look at it (the public survey pages).
+    """
+    user = getattr(request, 'user', None)
+    if user is None or getattr(user, '_wrapped', None) is empty:
+        return False
+    return user.is_staff
+
+
+def endpoint_name(request):
+    """``"GET forms:detail"``; the URL name, or the view path for unnamed URLs"""
+    match = getattr(request, 'resolver_match', None)
+    return f'{request.method} {match.view_name if match else "(unresolved)"}'
+
+
+def log_request(request, response, endpoint, timings):
+    record = {
+        'endpoint': endpoint,
+        'path': request.path,
+        'status': response.status_code,
+        'total_ms': round(timings.total * 1000, 1),
+        'db_queries': timings.queries,
+        'db_ms': round(timings.query_time * 1000, 1),
+        'template_ms': round(timings.render_time * 1000, 1),
+        'cache_hits': timings.cache_hits,
+        'cache_misses': timings.cache_misses,
+    }
+    slow = record['total_ms'] >= _setting('PERFORMANCE_SLOW_REQUEST_MS', 1000)
+    logger.log(
+        logging.WARNING if slow else logging.INFO,
+        json.dumps(record, separators=(',', ':')),
+        extra={'performance': record},
+    )
+
+
+def _slots_key(minute):
+    return f'performance:{minute}:slots'
+
+
+def _slot_key(minute, slot):
+    return f'performance:{minute}:{slot}'
+
+
+class MinuteTotals:
+    """This process's per-endpoint totals, flushed to the shared cache.
+
+    A row is ``[requests, total_ms, max_ms, queries, db_ms, template_ms]``.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.minute = None
+        self.slot = None
+        self.rows = {}
+        self.flushed_at = 0.0
+
+    def add(self, endpoint, timings):
+        now = time.time()
+        minute = int(now // 60)
+        total_ms = timings.total * 1000
+        with self.lock:
+            pending = None
+            if minute != self.minute:
+                # Write the finished minute in full before starting a new one
+                pending = self.take()
+                self.minute, self.slot, self.rows = minute, None, {}
+            row = self.rows.setdefault(endpoint, [0, 0.0, 0.0, 0, 0.0, 0.0])
+            row[0] += 1
+            row[1] += total_ms
+            row[2] = max(row[2], total_ms)
+            row[3] += timings.queries
+            row[4] += timings.query_time * 1000
+            row[5] += timings.render_time * 1000
+            if pending is None and now - self.flushed_at >= FLUSH_INTERVAL:
+                pending = self.take()
+        if pending is not None:
+            self.write(*pending)
+
+    def take(self):
+        """Copy of the current totals to write (called with the lock held)"""
+        if self.minute is None or not self.rows:
+            return None
+        # A culled or cleared counter no longer covers our slot: take a new one
+        if self.slot is None or cache.get(_slots_key(self.minute), 0) < self.slot:
+            self.slot = self.allocate_slot(self.minute)
+        self.flushed_at = time.time()
+        return self.minute, self.slot, {endpoint: list(row) for endpoint, row in self.rows.items()}
+
+    def flush(self):
+        with self.lock:
+            pending = self.take()
+        if pending is not None:
+            self.write(*pending)
+
+    @staticmethod
+    def allocate_slot(minute):
+        timeout = (window_minutes() + 2) * 60
+        cache.add(_slots_key(minute), 0, timeout)
+        try:
+            return cache.incr(_slots_key(minute))
+        except ValueError:
+            return None
+
+    @staticmethod
+    def write(minute, slot, rows):
+        if slot is not None:
+            cache.set(_slot_key(minute, slot), rows, (window_minutes() + 2) * 60)
+
+
+window = MinuteTotals()
+
+
+def slowest_endpoints(limit=20):
+    """Endpoints of the last ``PERFORMANCE_WINDOW_MINUTES`` minutes, slowest first.
+
+    Each row has ``endpoint``, ``requests``, ``avg_ms``, ``max_ms``,
+    ``total_s``, ``avg_queries``, ``avg_db_ms`` and ``avg_template_ms``.
+    """
+    window.flush()
+    current = int(time.time() // 60)
+    minutes = range(current - window_minutes() + 1, current + 1)
+    slots = cache.get_many([_slots_key(minute) for minute in minutes])
+    keys = [
+        _slot_key(minute, slot)
+        for minute in minutes
+        for slot in range(1, slots.get(_slots_key(minute), 0) + 1)
+    ]
+
+    totals = {}
+    for rows in cache.get_many(keys).values():
+        for endpoint, row in rows.items():
+            total = totals.setdefault(endpoint, [0, 0.0, 0.0, 0, 0.0, 0.0])
+            for index in (0, 1, 3, 4, 5):
+                total[index] += row[index]
+            total[2] = max(total[2], row[2])
+
+    results = [
+        {
+            'endpoint': endpoint,
+            'requests': requests,
+            'avg_ms': total_ms / requests,
+            'max_ms': max_ms,
+            'total_s': total_ms / 1000,
+            'avg_queries': queries / requests,
+            'avg_db_ms': db_ms / requests,
+            'avg_template_ms': template_ms / requests,
+        }
+        for endpoint, (requests, total_ms, max_ms, queries, db_ms, template_ms) in totals.items()
+        if requests
+    ]
+    results.sort(key=lambda row: row['avg_ms'], reverse=True)
+    return results[:limit]
@@ -7,6 +7,10 @@ Usage:
     python manage.py migrate --settings=survey_project.settings_production
 """
 
+import atexit
+import shutil
+import sys
+import tempfile
 from pathlib import Path
 from decouple import config
 
@@ -28,6 +32,9 @@ ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='localhost,127.0.0.1', cast=lamb
 # Site URL for generating absolute URLs (e.g., in emails, QR codes)
 SITE_URL = config('SITE_URL', default='http://localhost:8000')
 
+# How long rendered QR code images stay cached (seconds)
+QR_CACHE_TIMEOUT = config('QR_CACHE_TIMEOUT', default=60 * 60 * 24 * 30, cast=int)
+
 
 # Application definition
 INSTALLED_APPS = [
@@ -47,6 +54,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the other middleware too
+    'survey_project.performance.TimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -60,7 +69,8 @@ ROOT_URLCONF = 'survey_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that reports render times (see survey_project/performance.py)
+        'BACKEND': 'survey_project.performance.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -143,6 +153,17 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# Fingerprinted file names plus pre-compressed .gz/.br copies written at
+# collectstatic time; .htaccess serves them with immutable caching
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'survey_project.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
 # Media files (User uploads)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -167,17 +188,77 @@ CAPTCHA_NOISE_FUNCTIONS = ('captcha.helpers.noise_arcs', 'captcha.helpers.noise_
 CAPTCHA_LENGTH = 4
 CAPTCHA_TIMEOUT = 5  # Minutes
 
+# Pre-generated captcha pool filled by `manage.py fill_captcha_pool` (0 disables)
+CAPTCHA_POOL_SIZE = config('CAPTCHA_POOL_SIZE', default=300, cast=int)
+CAPTCHA_POOL_TIMEOUT = config('CAPTCHA_POOL_TIMEOUT', default=60, cast=int)  # Minutes
+
 # Rate limiting settings
 RATELIMIT_ENABLE = True
 RATELIMIT_USE_CACHE = 'default'
 
-# Cache configuration for rate limiting
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+# Anonymous respondents on public survey pages: "cookie" keeps them in a
+# signed cookie (no session rows), "session" uses Django sessions
+RESPONDENT_SESSION_MODE = config('RESPONDENT_SESSION_MODE', default='cookie')
+
+# Admission control for public submissions (see responses/throttling.py).
+# Rates are tokens per second; bursts are bucket capacities.
+SUBMISSION_THROTTLE_ENABLE = config('SUBMISSION_THROTTLE_ENABLE', default=True, cast=bool)
+SUBMISSION_FORM_RATE = config('SUBMISSION_FORM_RATE', default=5, cast=float)
+SUBMISSION_FORM_BURST = config('SUBMISSION_FORM_BURST', default=30, cast=int)
+SUBMISSION_GLOBAL_RATE = config('SUBMISSION_GLOBAL_RATE', default=20, cast=float)
+SUBMISSION_GLOBAL_BURST = config('SUBMISSION_GLOBAL_BURST', default=60, cast=int)
+SUBMISSION_MAX_INFLIGHT = config('SUBMISSION_MAX_INFLIGHT', default=8, cast=int)
+
+# Offline mode for public surveys without a captcha: a service worker caches
+# the page and queues failed submissions, synced later in batches of at most
+# SUBMISSION_BATCH_MAX responses (see responses/batch.py)
+SURVEY_OFFLINE_ENABLE = config('SURVEY_OFFLINE_ENABLE', default=True, cast=bool)
+SUBMISSION_BATCH_MAX = config('SUBMISSION_BATCH_MAX', default=50, cast=int)
+
+# Per-request timing (see survey_project/performance.py): Server-Timing
+# headers for staff, one log line per request, and the slowest endpoints of
+# the last PERFORMANCE_WINDOW_MINUTES at /metrics/performance/
+PERFORMANCE_TIMING_ENABLE = config('PERFORMANCE_TIMING_ENABLE', default=True, cast=bool)
+PERFORMANCE_WINDOW_MINUTES = config('PERFORMANCE_WINDOW_MINUTES', default=15, cast=int)
+PERFORMANCE_SLOW_REQUEST_MS = config('PERFORMANCE_SLOW_REQUEST_MS', default=1000, cast=int)
+
+# Cache configuration (rate limiting, QR images, compiled form logic).
+# The shared backend keeps one SQLite-backed cache for all worker processes
+# with a small in-process LRU in front of it; CACHE_BACKEND=locmem falls
+# back to a per-process cache.
+CACHE_BACKEND = config('CACHE_BACKEND', default='shared')
+
+# The test suite clears the cache between requests (see
+# survey_project/testing.py), so it gets a throwaway cache file instead of
+# the one the running site uses
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+
+if TESTING:
+    _test_cache_dir = tempfile.mkdtemp(prefix='survey-test-cache-')
+    atexit.register(shutil.rmtree, _test_cache_dir, ignore_errors=True)
+    CACHE_LOCATION = str(Path(_test_cache_dir) / 'cache.sqlite3')
+else:
+    CACHE_LOCATION = config('CACHE_LOCATION', default=str(BASE_DIR / 'cache' / 'cache.sqlite3'))
+
+if CACHE_BACKEND == 'locmem':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'survey_project.cache.SharedCache',
+            'LOCATION': CACHE_LOCATION,
+            'OPTIONS': {
+                'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=20000, cast=int),
+                'L1_MAX_ENTRIES': config('CACHE_L1_MAX_ENTRIES', default=500, cast=int),
+                'L1_TIMEOUT': config('CACHE_L1_TIMEOUT', default=5, cast=int),
+            },
+        }
     }
-}
 
 
 # Security settings for production
@@ -203,6 +284,10 @@ LOGGING = {
             'format': '[{levelname}] {asctime} {name} {process:d} {thread:d} {message}',
             'style': '{',
         },
+        'performance': {
+            'format': '{asctime} {levelname} {message}',
+            'style': '{',
+        },
     },
     'handlers': {
         'file': {
@@ -222,6 +307,13 @@ LOGGING = {
             'class': 'logging.StreamHandler',
             'formatter': 'verbose',
         },
+        # One JSON object per request from survey_project/performance.py
+        'performance_file': {
+            'level': 'INFO',
+            'class': 'logging.FileHandler',
+            'filename': BASE_DIR / 'logs' / 'performance.log',
+            'formatter': 'performance',
+        },
     },
     'root': {
         'handlers': ['file', 'error_file', 'console'],
@@ -238,6 +330,11 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': False,
         },
+        'survey_project.performance': {
+            'handlers': ['performance_file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
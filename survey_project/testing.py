@@ -0,0 +1,182 @@
+"""
+Assertions shared by the apps' test suites.
+
+Query-plan tests run ``EXPLAIN`` on the database the tests are run against:
+SQLite with the development settings, MySQL with the production ones
+(``python manage.py test --settings=survey_project.settings_production``).
+
+Query-budget tests run every view against surveys of several sizes with
+one budget per view, so a query per record or response fails them.
+"""
+
+import json
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def _mysql_scans(node):
+    """Tables read with a full scan (``access_type: ALL``) in a MySQL JSON plan"""
+    if isinstance(node, dict):
+        if node.get('access_type') == 'ALL':
+            yield node.get('table_name', '?')
+        for value in node.values():
+            yield from _mysql_scans(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _mysql_scans(value)
+
+
+class QueryPlanAssertions:
+    """Mixin for ``TestCase`` checking the plans of ORM queries"""
+
+    def explain(self, queryset):
+        """The plan of ``queryset`` as text"""
+        if connection.vendor == 'mysql':
+            return queryset.explain(format='JSON')
+        if connection.vendor in ('sqlite', 'postgresql'):
+            return queryset.explain()
+        self.skipTest(f'No query plan checks for {connection.vendor}')
+
+    def full_scans(self, plan):
+        """Tables ``plan`` reads in full"""
+        if connection.vendor == 'mysql':
+            return list(_mysql_scans(json.loads(plan)))
+        if connection.vendor == 'postgresql':
+            return re.findall(r'Seq Scan on (\w+)', plan)
+        # SQLite: "SCAN <table>" without an index is a full table scan
+        return [
+            match.group(1)
+            for match in re.finditer(r'\bSCAN (\w+)([^\n]*)', plan)
+            if 'INDEX' not in match.group(2) and match.group(1) != 'CONSTANT'
+        ]
+
+    def assertNoFullScan(self, queryset, index=None):
+        """Fail if ``queryset`` scans a whole table, or does not use ``index``"""
+        plan = self.explain(queryset)
+        scans = self.full_scans(plan)
+        self.assertFalse(scans, f'Full table scan of {", ".join(scans)}:\n{plan}\n{queryset.query}')
+        if index:
+            self.assertIn(index, plan, f'Index {index} is not used:\n{plan}\n{queryset.query}')
+
+
+def seed_survey(owner, size, slug='survey'):
+    """A published form of ``owner`` with ``size`` records and responses.
+
+    The form has two sections and one question of each common type, one of
+    them conditional, and an attached dataset of ``size`` records with a
+    hidden and a filter column. Half the responses pick a record, the rest
+    enter a new identity. ``size`` further draft forms and datasets fill
+    the owner's lists. Returns the form.
+    """
+    from forms.models import Form, FormMasterDataAttachment, FormQuestion, FormSection
+    from master_data.models import MasterDataColumn, MasterDataRecord, MasterDataSet
+    from responses.models import Response, ResponseAnswer
+
+    dataset = MasterDataSet.objects.create(name=f'{slug} people', description='', owner=owner)
+    for order, name in enumerate(['Name', 'Region', 'Phone']):
+        MasterDataColumn.objects.create(dataset=dataset, name=name, order=order)
+    MasterDataRecord.objects.bulk_create([
+        MasterDataRecord(dataset=dataset, data={'Name': f'Person {n}', 'Region': f'R{n % 4}', 'Phone': str(n)})
+        for n in range(size)
+    ])
+    records = list(dataset.records.all())
+
+    form = Form.objects.create(
+        title=f'{slug} form', slug=slug, owner=owner, status='published', require_captcha=False,
+    )
+    FormMasterDataAttachment.objects.create(
+        form=form, dataset=dataset, display_column='Name',
+        hidden_columns=['Phone'], filter_columns=['Region'],
+    )
+    sections = [
+        FormSection.objects.create(form=form, title=f'Section {n}', order=n)
+        for n in range(2)
+    ]
+    choice = FormQuestion.objects.create(
+        form=form, section=sections[0], order=0, text='Choice', question_type='single_select',
+        options=[{'value': 'yes', 'text': 'Yes'}, {'value': 'no', 'text': 'No'}], is_required=True,
+    )
+    questions = [
+        choice,
+        FormQuestion.objects.create(
+            form=form, section=sections[0], order=1, text='Why', question_type='text_input',
+            logic={'conditions': [{'question': choice.pk, 'operator': 'equals', 'value': 'yes'}]},
+        ),
+        FormQuestion.objects.create(
+            form=form, section=sections[1], order=2, text='Tags', question_type='multi_select',
+            options=[{'value': 'a', 'text': 'A'}, {'value': 'b', 'text': 'B'}],
+        ),
+        FormQuestion.objects.create(form=form, section=sections[1], order=3, text='Count', question_type='numeric_input'),
+        FormQuestion.objects.create(form=form, section=sections[1], order=4, text='When', question_type='date_input'),
+    ]
+
+    values = ['yes', 'because', 'a, b', '3', '2024-01-31']
+    Response.objects.bulk_create([
+        Response(
+            form=form,
+            record=records[n] if n % 2 == 0 and records else None,
+            is_new_identity=n % 2 == 1,
+            new_identity_data={'Name': f'New {n}', 'Region': 'R9'} if n % 2 == 1 else None,
+            new_identity_dataset_id=dataset.pk if n % 2 == 1 else None,
+            session_key=f'session-{n}',
+            is_complete=True,
+            answer_data={str(question.pk): value for question, value in zip(questions, values)},
+        )
+        for n in range(size)
+    ])
+    responses = list(form.responses.all())
+    ResponseAnswer.objects.bulk_create([
+        ResponseAnswer(response=response, question=question, value=value)
+        for response in responses
+        for question, value in zip(questions, values)
+    ])
+
+    for n in range(size):
+        Form.objects.create(title=f'{slug} draft {n}', slug=f'{slug}-draft-{n}', owner=owner)
+        MasterDataSet.objects.create(name=f'{slug} set {n}', description='', owner=owner)
+    return form
+
+
+class QueryBudgetAssertions:
+    """Mixin for ``TestCase`` checking how many queries views make.
+
+    ``setUpTestData`` seeds one survey per size in ``sizes`` (see
+    ``seed_survey``), each with its own owner. ``each_survey`` runs a check
+    against every one of them with the same budget.
+    """
+
+    sizes = (1, 30)
+
+    @classmethod
+    def setUpTestData(cls):
+        from accounts.models import User
+
+        cls.seeded = []
+        for size in cls.sizes:
+            owner = User.objects.create_user(f'owner-{size}', password='x')
+            cls.seeded.append((size, owner, seed_survey(owner, size, slug=f'survey-{size}')))
+
+    def each_survey(self, check):
+        """Call ``check(form)`` for every seeded survey, logged in as its owner"""
+        for size, owner, form in self.seeded:
+            with self.subTest(size=size):
+                self.client.force_login(owner)
+                check(form)
+
+    def assertQueryBudget(self, budget, method, url, status=200, **kwargs):
+        """Request ``url`` with a cold cache; fail above ``budget`` queries"""
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, **kwargs)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, status, f'{method.upper()} {url}')
+        self.assertLessEqual(
+            len(queries), budget,
+            f'{method.upper()} {url} made {len(queries)} queries, budget {budget}:\n'
+            + '\n'.join(query['sql'] for query in queries.captured_queries),
+        )
+        return response
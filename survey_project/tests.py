@@ -0,0 +1,61 @@
+import json
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from accounts.models import User
+from .performance import MinuteTotals
+
+
+class PerformanceInstrumentationTests(TestCase):
+    """Request timings reach staff headers, the log and the slowest endpoints page"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        cls.user = User.objects.create_user('user', password='x')
+
+    def test_server_timing_for_staff(self):
+        self.client.force_login(self.staff)
+        header = self.client.get(reverse('home'))['Server-Timing']
+        self.assertRegex(header, r'total;dur=[\d.]+')
+        self.assertRegex(header, r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+        self.assertRegex(header, r'tpl;dur=[\d.]+')
+        self.assertRegex(header, r'cache;desc="\d+ hits, \d+ misses"')
+
+    def test_no_server_timing_for_others(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('home')))
+        self.client.force_login(self.user)
+        self.assertNotIn('Server-Timing', self.client.get(reverse('home')))
+
+    def test_structured_log(self):
+        self.client.force_login(self.user)
+        with self.assertLogs('survey_project.performance', 'INFO') as logs:
+            self.client.get(reverse('home'))
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record['endpoint'], 'GET home')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['db_queries'], 0)
+        self.assertGreater(record['template_ms'], 0)
+
+    def test_slowest_endpoints_page(self):
+        # Only the 50 slowest endpoints are listed: start from empty totals,
+        # or the endpoints hit by other tests can push "GET home" off the page
+        cache.clear()
+        self.enterContext(mock.patch('survey_project.performance.window', MinuteTotals()))
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('performance_metrics')).status_code, 302)
+        self.client.force_login(self.staff)
+        self.client.get(reverse('home'))
+        response = self.client.get(reverse('performance_metrics'))
+        self.assertContains(response, 'GET home')
+
+
+class TestCacheTests(TestCase):
+    def test_tests_never_use_the_site_cache(self):
+        # Query-budget tests clear the cache; it must not be the running site's
+        location = settings.CACHES['default']['LOCATION']
+        self.assertNotIn(str(settings.BASE_DIR), location)
@@ -18,7 +18,8 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from .views import HomeView
+from responses.views import captcha_image, responses_api
+from .views import HomeView, performance_view, throttle_metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -27,7 +28,12 @@ urlpatterns = [
     path('master-data/', include('master_data.urls')),
     path('forms/', include('forms.urls')),
     path('survey/', include('responses.urls')),  # Public survey URLs
+    path('api/forms/<int:pk>/responses/', responses_api, name='responses_api'),
+    # Pooled captcha images are served from the cache; must precede captcha.urls
+    path('captcha/image/<str:key>/', captcha_image, name='pooled_captcha_image'),
     path('captcha/', include('captcha.urls')),  # Captcha URLs
+    path('metrics/throttle/', throttle_metrics_view, name='throttle_metrics'),
+    path('metrics/performance/', performance_view, name='performance_metrics'),
 ]
 
 # Serve static and media files in development
@@ -1,7 +1,12 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from django.shortcuts import render
 from django.views.generic import TemplateView
 from forms.models import Form
 from master_data.models import MasterDataSet
 from responses.models import Response
+from responses.throttling import throttle_metrics
+from .performance import slowest_endpoints, window_minutes
 
 
 class HomeView(TemplateView):
@@ -17,3 +22,19 @@ class HomeView(TemplateView):
             context['total_responses'] = Response.objects.filter(form__owner=self.request.user).count()
         
         return context
+
+
+@staff_member_required
+def throttle_metrics_view(request):
+    """Submission bucket levels, queue depth and rejections (staff only)"""
+    slugs = Form.objects.filter(status='published').values_list('slug', flat=True)
+    return JsonResponse(throttle_metrics(slugs))
+
+
+@staff_member_required
+def performance_view(request):
+    """Slowest endpoints of the last PERFORMANCE_WINDOW_MINUTES (staff only)"""
+    return render(request, 'performance.html', {
+        'endpoints': slowest_endpoints(limit=50),
+        'window_minutes': window_minutes(),
+    })
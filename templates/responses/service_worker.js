@@ -0,0 +1,247 @@
+{% load static %}// Offline mode for public surveys (see responses/batch.py).
+//
+// - Survey pages are fetched network-first and kept in the cache, so a
+//   survey opened once can be reopened without signal.
+// - Identity snapshots and static files are immutable and served cache-first.
+// - A survey POST that fails for lack of network is queued in IndexedDB with
+//   a client-generated id and sent later, in batches, to <survey>/batch/.
+//   The server ignores ids it has already stored, so resending is safe.
+//   Responses the server refuses for good (failed validation, or a 4xx
+//   other than 429 for the whole batch) move to a "failed" store instead of
+//   being retried forever; they stay on the device for support to recover.
+
+const CACHE_NAME = 'survey-offline-v1';
+const DB_NAME = 'survey-offline';
+const STORE_NAME = 'queue';
+const FAILED_STORE_NAME = 'failed';
+const BATCH_MAX = {{ batch_max }};
+const STATIC_PREFIX = '{% get_static_prefix %}';
+const SCOPE_PATH = new URL(self.registration.scope).pathname;
+
+function isSurveyPage(url) {
+    // <scope><slug>/, the public survey page
+    return url.pathname.startsWith(SCOPE_PATH) && /^[^/]+\/$/.test(url.pathname.slice(SCOPE_PATH.length));
+}
+
+self.addEventListener('install', () => self.skipWaiting());
+
+self.addEventListener('activate', event => {
+    event.waitUntil((async () => {
+        const names = await caches.keys();
+        await Promise.all(names.filter(name => name !== CACHE_NAME).map(name => caches.delete(name)));
+        await self.clients.claim();
+    })());
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    const url = new URL(request.url);
+    if (url.origin !== self.location.origin) return;
+
+    if (request.method === 'POST' && request.mode === 'navigate' && isSurveyPage(url)) {
+        event.respondWith(submitOrQueue(event));
+    } else if (request.method === 'GET' && request.mode === 'navigate' && isSurveyPage(url)) {
+        event.respondWith(networkFirst(request));
+    } else if (request.method === 'GET' && (url.pathname.includes('/identities/') || url.pathname.startsWith(STATIC_PREFIX))) {
+        event.respondWith(cacheFirst(request));
+    }
+});
+
+self.addEventListener('sync', event => {
+    if (event.tag === 'survey-sync') event.waitUntil(flushQueue());
+});
+
+self.addEventListener('message', event => {
+    if (event.data === 'flush') event.waitUntil(flushQueue());
+});
+
+async function networkFirst(request) {
+    const cache = await caches.open(CACHE_NAME);
+    try {
+        const response = await fetch(request);
+        if (response.ok) cache.put(request, response.clone());
+        return response;
+    } catch (error) {
+        const cached = await cache.match(request);
+        if (cached) return cached;
+        throw error;
+    }
+}
+
+async function cacheFirst(request) {
+    const cache = await caches.open(CACHE_NAME);
+    const cached = await cache.match(request);
+    if (cached) return cached;
+    const response = await fetch(request);
+    if (response.ok) cache.put(request, response.clone());
+    return response;
+}
+
+async function submitOrQueue(event) {
+    const copy = event.request.clone();
+    try {
+        return await fetch(event.request);
+    } catch (error) {
+        const formData = await copy.formData();
+        // Only pages rendered with offline mode (no captcha) can be queued
+        if (!formData.has('offline_mode')) throw error;
+        const fields = {};
+        for (const [name, value] of formData.entries()) {
+            if (typeof value !== 'string') continue;  // Files cannot be queued
+            (fields[name] = fields[name] || []).push(value);
+        }
+        const csrfToken = (fields.csrfmiddlewaretoken || [''])[0];
+        delete fields.csrfmiddlewaretoken;
+        delete fields.offline_mode;
+
+        const surveyUrl = new URL(event.request.url);
+        await enqueue({
+            client_id: self.crypto.randomUUID(),
+            endpoint: new URL('batch/', surveyUrl).pathname,
+            csrf_token: csrfToken,
+            fields: fields,
+            queued_at: Date.now(),
+        });
+        if (self.registration.sync) {
+            try {
+                await self.registration.sync.register('survey-sync');
+            } catch (syncError) {
+                // Background sync unavailable; the page flushes when online
+            }
+        }
+        return new Response(offlinePage(surveyUrl.pathname), {
+            headers: {'Content-Type': 'text/html; charset=utf-8'},
+        });
+    }
+}
+
+function offlinePage(surveyPath) {
+    return `<!DOCTYPE html>
+<html><head><meta charset="utf-8"><meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Response saved</title></head>
+<body style="font-family: sans-serif; max-width: 32rem; margin: 3rem auto; padding: 0 1rem; text-align: center;">
+<h1>📶 Response saved on this device</h1>
+<p>There is no connection right now. Your answers will be sent automatically when you are back online.
+Please keep this survey open or open it again once you have signal.</p>
+<p><a href="${surveyPath}">Fill in another response</a></p>
+</body></html>`;
+}
+
+function openQueue() {
+    return new Promise((resolve, reject) => {
+        const open = indexedDB.open(DB_NAME, 2);
+        open.onupgradeneeded = () => {
+            [STORE_NAME, FAILED_STORE_NAME].forEach(name => {
+                if (!open.result.objectStoreNames.contains(name)) {
+                    open.result.createObjectStore(name, {keyPath: 'client_id'});
+                }
+            });
+        };
+        open.onsuccess = () => resolve(open.result);
+        open.onerror = () => reject(open.error);
+    });
+}
+
+async function queueTransaction(mode, work) {
+    const db = await openQueue();
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction(STORE_NAME, mode);
+        const result = work(tx.objectStore(STORE_NAME));
+        tx.oncomplete = () => resolve(result && 'result' in result ? result.result : undefined);
+        tx.onerror = () => reject(tx.error);
+    });
+}
+
+function enqueue(item) {
+    return queueTransaction('readwrite', store => store.put(item));
+}
+
+function queuedItems() {
+    return queueTransaction('readonly', store => store.getAll());
+}
+
+function dequeue(clientIds) {
+    return queueTransaction('readwrite', store => clientIds.forEach(id => store.delete(id)));
+}
+
+async function setAside(items, errorsFor) {
+    // Move items from the queue to the failed store in one transaction
+    if (!items.length) return;
+    const db = await openQueue();
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction([STORE_NAME, FAILED_STORE_NAME], 'readwrite');
+        items.forEach(item => {
+            tx.objectStore(FAILED_STORE_NAME).put({...item, errors: errorsFor(item), failed_at: Date.now()});
+            tx.objectStore(STORE_NAME).delete(item.client_id);
+        });
+        tx.oncomplete = () => resolve();
+        tx.onerror = () => reject(tx.error);
+    });
+}
+
+async function refusal(response) {
+    try {
+        return (await response.json()).error || response.statusText;
+    } catch (error) {
+        return `${response.status} ${response.statusText}`;
+    }
+}
+
+async function flushQueue() {
+    const items = await queuedItems();
+    const byEndpoint = {};
+    items.forEach(item => (byEndpoint[item.endpoint] = byEndpoint[item.endpoint] || []).push(item));
+
+    let sent = 0;
+    let failed = 0;
+    for (const [endpoint, queued] of Object.entries(byEndpoint)) {
+        for (let start = 0; start < queued.length; start += BATCH_MAX) {
+            const batch = queued.slice(start, start + BATCH_MAX);
+            let response;
+            try {
+                response = await fetch(endpoint, {
+                    method: 'POST',
+                    credentials: 'same-origin',
+                    headers: {'Content-Type': 'application/json', 'X-CSRFToken': batch[0].csrf_token},
+                    body: JSON.stringify({
+                        responses: batch.map(item => ({client_id: item.client_id, fields: item.fields})),
+                    }),
+                });
+            } catch (error) {
+                return notifyClients(sent, failed);  // Still offline; retry later
+            }
+            if (response.status === 429 || response.status >= 500) break;  // Throttled or server trouble; retry later
+            if (!response.ok) {
+                // Refused for the whole batch (survey closed, bad token...); resending cannot help
+                const error = await refusal(response);
+                await setAside(batch, () => ({batch: error}));
+                failed += batch.length;
+                continue;
+            }
+
+            // Results are keyed by client id; the server may have normalised
+            // the ids, so match them case-insensitively against the batch
+            const result = await response.json();
+            const queuedById = new Map(batch.map(item => [item.client_id.toLowerCase(), item]));
+            const itemsFor = ids => ids.map(id => queuedById.get(String(id).toLowerCase())).filter(Boolean);
+            await dequeue(itemsFor([...result.accepted, ...result.duplicates]).map(item => item.client_id));
+            // Rejected responses failed validation and would fail again
+            const rejected = Object.fromEntries(
+                Object.entries(result.rejected).map(([id, errors]) => [String(id).toLowerCase(), errors])
+            );
+            const refused = itemsFor(Object.keys(rejected));
+            await setAside(refused, item => rejected[item.client_id.toLowerCase()]);
+            sent += result.accepted.length;
+            failed += refused.length;
+        }
+    }
+    return notifyClients(sent, failed);
+}
+
+async function notifyClients(sent, failed) {
+    const remaining = (await queuedItems()).length;
+    const clients = await self.clients.matchAll({type: 'window'});
+    clients.forEach(client => client.postMessage({
+        type: 'survey-sync', sent: sent, failed: failed, remaining: remaining,
+    }));
+}